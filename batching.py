@@ -0,0 +1,133 @@
+# batching.py
+# Micro-batching de trabajos para el pipeline de Qwen-Image-Edit
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class BatchItem:
+    """Un trabajo en cola esperando ser agrupado con otros del mismo bucket."""
+
+    def __init__(self, key, payload):
+        self.key = key
+        self.payload = payload
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class MicroBatcher:
+    """
+    Agrupa trabajos que llegan dentro de una ventana corta en una sola
+    llamada al pipeline.
+
+    Los trabajos se separan por `key` (bucket de resolución y parámetros de
+    inferencia) porque solo los trabajos con la misma forma se pueden
+    ejecutar juntos. Un único hilo despachador ejecuta los lotes, así que la
+    GPU nunca recibe dos llamadas a la vez.
+
+    `run_batch(payloads)` debe devolver una lista de resultados en el mismo
+    orden. Si el lote completo falla, cada trabajo se reintenta por separado
+    para que un trabajo inválido no arrastre a los demás.
+    """
+
+    def __init__(self, run_batch, max_batch_size=4, max_wait_ms=50.0):
+        self._run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._buckets = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, key, payload):
+        """Encola un trabajo y devuelve un Future con su resultado."""
+        item = BatchItem(key, payload)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("El micro-batcher está cerrado")
+            self._buckets.setdefault(key, []).append(item)
+            self._cond.notify()
+        return item.future
+
+    def pending(self):
+        """Número de trabajos en cola."""
+        with self._cond:
+            return sum(len(items) for items in self._buckets.values())
+
+    def close(self):
+        """Detiene el despachador después de vaciar la cola."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _next_batch(self):
+        """
+        Espera hasta que algún bucket esté lleno o su trabajo más antiguo haya
+        agotado la ventana de espera. Devuelve None al cerrar sin pendientes.
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                ready_key = None
+                timeout = None
+                for key, items in self._buckets.items():
+                    deadline = items[0].enqueued_at + self.max_wait
+                    if len(items) >= self.max_batch_size or deadline <= now or self._closed:
+                        # El bucket con el trabajo más antiguo sale primero
+                        if ready_key is None or items[0].enqueued_at < self._buckets[ready_key][0].enqueued_at:
+                            ready_key = key
+                    else:
+                        remaining = deadline - now
+                        timeout = remaining if timeout is None else min(timeout, remaining)
+
+                if ready_key is not None:
+                    items = self._buckets[ready_key]
+                    batch = items[:self.max_batch_size]
+                    del items[:self.max_batch_size]
+                    if not items:
+                        del self._buckets[ready_key]
+                    return batch
+
+                if self._closed:
+                    return None
+                self._cond.wait(timeout)
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._execute(batch)
+
+    def _execute(self, batch):
+        started = time.monotonic()
+        waits = [started - item.enqueued_at for item in batch]
+        logger.info(
+            f"Ejecutando lote de {len(batch)} trabajo(s) | bucket: {batch[0].key} | "
+            f"espera máxima en cola: {max(waits) * 1000:.1f} ms"
+        )
+        try:
+            results = self._run_batch([item.payload for item in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f"El lote devolvió {len(results)} resultados para {len(batch)} trabajos"
+                )
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].future.set_exception(e)
+                return
+            logger.warning(
+                f"Fallo en lote de {len(batch)} trabajos ({type(e).__name__}: {e}), "
+                "reintentando cada trabajo por separado"
+            )
+            for item in batch:
+                self._execute([item])
+            return
+
+        for item, result in zip(batch, results):
+            item.future.set_result(result)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark de codificación de la imagen de salida
+Compara tiempo de codificación y tamaño de la respuesta por formato
+en las resoluciones que produce el pipeline (~1 MP)
+"""
+
+import argparse
+import base64
+import statistics
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from image_io import DEFAULT_RESOLUTION_BUCKETS, encode_image
+
+# Buckets de ~1 MP del handler: los tamaños que se codifican en producción
+RESOLUTIONS = DEFAULT_RESOLUTION_BUCKETS
+
+# (nombre, formato, opciones)
+VARIANTS = [
+    ("png-6", "png", {"compress_level": 6}),
+    ("png-1", "png", {"compress_level": 1}),
+    ("png-0", "png", {"compress_level": 0}),
+    ("jpeg-90", "jpeg", {"quality": 90}),
+    ("jpeg-75", "jpeg", {"quality": 75}),
+    ("webp-90", "webp", {"quality": 90}),
+    ("raw", "raw", {}),
+]
+
+
+def synthetic_photo(width, height, seed=0):
+    """Imagen con degradados y ruido: una imagen de color sólido comprime de forma irreal."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    r = 128 + 100 * np.sin(x / 57.0) * np.cos(y / 91.0)
+    g = 128 + 100 * np.sin((x + y) / 73.0)
+    b = 128 + 100 * np.cos(x / 37.0 - y / 53.0)
+    pixels = np.stack([r, g, b], axis=-1) + rng.normal(0, 12, (height, width, 3))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB")
+
+
+def bench_encoding(repeats=5):
+    """Mide cada variante en cada resolución y devuelve las filas de resultados."""
+    rows = []
+    for width, height in RESOLUTIONS:
+        image = synthetic_photo(width, height)
+        for name, output_format, options in VARIANTS:
+            times = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                data = encode_image(image, output_format=output_format, **options)
+                b64 = base64.b64encode(data)
+                times.append(time.perf_counter() - start)
+            rows.append({
+                "resolution": f"{width}x{height}",
+                "variant": name,
+                "encode_ms": statistics.median(times) * 1000,
+                "bytes": len(data),
+                "base64_bytes": len(b64),
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=5, help="Repeticiones por variante (se usa la mediana)")
+    args = parser.parse_args()
+
+    print("=== BENCHMARK DE CODIFICACIÓN DE SALIDA ===")
+    print(f"{'Resolución':<12} {'Formato':<9} {'Encode+b64 (ms)':>16} {'Tamaño (KB)':>12} {'Base64 (KB)':>12}")
+    for row in bench_encoding(args.repeats):
+        print(
+            f"{row['resolution']:<12} {row['variant']:<9} {row['encode_ms']:>16.1f} "
+            f"{row['bytes'] / 1024:>12.0f} {row['base64_bytes'] / 1024:>12.0f}"
+        )
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Benchmark de Qwen-Image-Edit
+Mide la latencia por etapa (decode, preprocess, inference, encode,
+serialize), el throughput, los percentiles p50/p95/p99 y la memoria pico
+(RSS y VRAM) sobre una matriz de resoluciones, steps y tamaños de lote.
+Los resultados se escriben en JSON y se comparan con un baseline guardado.
+
+Backends:
+  - pipeline: QwenImageEditPipeline real (GPU o CPU)
+  - stub: simulación ligera en numpy para máquinas sin GPU; sirve para
+    detectar regresiones en todo lo que rodea a la inferencia
+"""
+
+import argparse
+import base64
+import json
+import platform
+import resource
+import statistics
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from bench_encoding import synthetic_photo
+from image_io import decode_base64_image, encode_image, open_input_image, resolution_bucket
+from cpu_quant import QUANT_MODES, configure_threads, quantize_pipeline
+from placement import STRATEGIES, apply_placement, plan_for_host, torch_dtypes
+
+STAGES = ("decode", "preprocess", "inference", "encode", "serialize")
+
+DEFAULT_MODEL = "Qwen/Qwen-Image-Edit"
+
+# Métricas comparadas con el baseline: (ruta en el resultado, mayor es mejor)
+COMPARED_METRICS = [
+    (("latency", "p50"), False),
+    (("latency", "p95"), False),
+    (("throughput_ips",), True),
+]
+
+
+class StubBackend:
+    """
+    Simula la inferencia sin modelo: itera sobre un tensor con la forma de
+    los latentes (16 canales a 1/8 de resolución) tantas veces como steps,
+    así que el coste escala con la resolución, los steps y el lote.
+    """
+
+    name = "stub"
+
+    def __init__(self, seed=0):
+        self.rng = np.random.default_rng(seed)
+
+    def load(self):
+        pass
+
+    def preprocess(self, image):
+        # Igual que el pipeline: reescalado al bucket de ~1 MP
+        return image.resize(resolution_bucket(image.size), Image.LANCZOS)
+
+    def infer(self, images, prompt, steps):
+        width, height = images[0].size
+        latents = self.rng.standard_normal((len(images), 16, height // 8, width // 8), dtype=np.float32)
+        for _ in range(steps):
+            latents = 0.95 * latents + 0.05 * np.tanh(latents)
+        return [image.transpose(Image.FLIP_LEFT_RIGHT) for image in images]
+
+    def reset_peak_vram(self):
+        pass
+
+    def peak_vram_mb(self):
+        return None
+
+
+class PipelineBackend:
+    """
+    QwenImageEditPipeline real, ubicado con el mismo planificador que
+    rp_handler (`placement=None` y `dtype=None` = elección automática).
+    """
+
+    name = "pipeline"
+
+    def __init__(self, placement=None, dtype=None, model=DEFAULT_MODEL, quantize=None,
+                 threads=0, interop_threads=0, seed=0):
+        self.placement = placement
+        self.dtype = dtype
+        self.model = model
+        self.quantize = quantize
+        self.threads = threads
+        self.interop_threads = interop_threads
+        self.seed = seed
+        self.plan = None
+        self.pipeline = None
+
+    def load(self):
+        import torch
+        from diffusers import QwenImageEditPipeline
+
+        self.torch = torch
+        if self.threads or self.interop_threads:
+            threads = configure_threads(self.threads, self.interop_threads)
+            print(f"Hilos de torch: {threads[0]} intra-op, {threads[1]} inter-op")
+        self.plan = plan_for_host(dtype=self.dtype, strategy=self.placement)
+        print(f"Plan de ubicación: {self.plan.describe()}")
+        self.pipeline = QwenImageEditPipeline.from_pretrained(
+            self.model,
+            torch_dtype=torch_dtypes(self.plan),
+            low_cpu_mem_usage=True,
+            use_safetensors=True
+        )
+        apply_placement(self.pipeline, self.plan)
+        if self.quantize:
+            quantized = quantize_pipeline(self.pipeline, self.quantize)
+            print(f"Capas lineales cuantizadas ({self.quantize}): {quantized}")
+
+    def preprocess(self, image):
+        width, height = resolution_bucket(image.size)
+        return self.pipeline.image_processor.resize(image, height, width)
+
+    def infer(self, images, prompt, steps):
+        result = self.pipeline(
+            image=images if len(images) > 1 else images[0],
+            prompt=[prompt] * len(images) if len(images) > 1 else prompt,
+            num_inference_steps=steps,
+            # Mismo ruido en todas las ejecuciones, para comparar las salidas
+            generator=self.torch.Generator("cpu").manual_seed(self.seed)
+        )
+        return result.images
+
+    def reset_peak_vram(self):
+        if self.torch.cuda.is_available():
+            self.torch.cuda.reset_peak_memory_stats()
+
+    def peak_vram_mb(self):
+        if not self.torch.cuda.is_available():
+            return None
+        return self.torch.cuda.max_memory_allocated() / 1024**2
+
+
+def reset_peak_rss():
+    """Reinicia el pico de RSS del proceso (Linux); devuelve False si no se puede."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """RSS pico del proceso desde el último reinicio (o desde el arranque)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024**2 if sys.platform == "darwin" else maxrss / 1024
+
+
+def percentiles(values):
+    """p50/p95/p99 y media de una lista de segundos, en milisegundos."""
+    ordered = sorted(values)
+
+    def pick(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "p50": pick(50),
+        "p95": pick(95),
+        "p99": pick(99),
+        "mean": statistics.fmean(values) * 1000,
+    }
+
+
+def synthetic_request(width, height, seed=0):
+    """Imagen de prueba con degradados y ruido, codificada en base64 como la recibe el worker."""
+    image = synthetic_photo(width, height, seed=seed)
+    return base64.b64encode(encode_image(image, "png", compress_level=1)).decode("utf-8")
+
+
+def run_iteration(backend, requests, prompt, steps):
+    """Procesa un lote de peticiones y devuelve los segundos de cada etapa."""
+    timings = dict.fromkeys(STAGES, 0.0)
+
+    start = time.perf_counter()
+    images = [
+        open_input_image(decode_base64_image(data, float("inf"), float("inf")), float("inf"))
+        for data in requests
+    ]
+    timings["decode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    images = [backend.preprocess(image) for image in images]
+    timings["preprocess"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = backend.infer(images, prompt, steps)
+    timings["inference"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    encoded = [encode_image(image, "png") for image in results]
+    timings["encode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for data in encoded:
+        json.dumps({"image_base64": base64.b64encode(data).decode("utf-8")})
+    timings["serialize"] = time.perf_counter() - start
+    return timings
+
+
+def run_config(backend, resolution, steps, batch_size, repeats, warmup, prompt):
+    """Mide una combinación de la matriz y devuelve su resultado."""
+    width, height = resolution
+    requests = [synthetic_request(width, height, seed=i) for i in range(batch_size)]
+
+    for _ in range(warmup):
+        run_iteration(backend, requests, prompt, steps)
+
+    reset_peak_rss()
+    backend.reset_peak_vram()
+    stage_times = {name: [] for name in STAGES}
+    latencies = []
+    bench_start = time.perf_counter()
+    for _ in range(repeats):
+        timings = run_iteration(backend, requests, prompt, steps)
+        for name in STAGES:
+            stage_times[name].append(timings[name])
+        latencies.append(sum(timings.values()))
+    elapsed = time.perf_counter() - bench_start
+
+    return {
+        "key": config_key(resolution, steps, batch_size),
+        "config": {"resolution": f"{width}x{height}", "steps": steps, "batch_size": batch_size, "repeats": repeats},
+        "stages": {name: percentiles(values) for name, values in stage_times.items()},
+        "latency": percentiles(latencies),
+        "throughput_ips": batch_size * repeats / elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_vram_mb": backend.peak_vram_mb(),
+    }
+
+
+def config_key(resolution, steps, batch_size):
+    return f"{resolution[0]}x{resolution[1]}-s{steps}-b{batch_size}"
+
+
+def run_matrix(backend, resolutions, steps_list, batch_sizes, repeats=5, warmup=1, prompt="Make the sky a sunset"):
+    """Ejecuta la matriz completa y devuelve el documento de resultados."""
+    backend.load()
+    results = []
+    for resolution in resolutions:
+        for steps in steps_list:
+            for batch_size in batch_sizes:
+                result = run_config(backend, resolution, steps, batch_size, repeats, warmup, prompt)
+                print_result(result)
+                results.append(result)
+    return {
+        "meta": {
+            "backend": backend.name,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+
+
+def _metric(result, path):
+    value = result
+    for part in path:
+        value = value[part]
+    return value
+
+
+def compare_with_baseline(current, baseline, tolerance=0.10):
+    """
+    Compara cada combinación presente en ambos documentos. Devuelve filas
+    `(clave, métrica, baseline, actual, cambio relativo, regresión)`; una
+    regresión es un empeoramiento mayor que `tolerance`.
+    """
+    baseline_results = {result["key"]: result for result in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        reference = baseline_results.get(result["key"])
+        if reference is None:
+            continue
+        for path, higher_is_better in COMPARED_METRICS:
+            before, after = _metric(reference, path), _metric(result, path)
+            change = (after - before) / before if before else 0.0
+            worse = -change if higher_is_better else change
+            rows.append((result["key"], ".".join(path), before, after, change, worse > tolerance))
+    return rows
+
+
+def print_result(result):
+    latency = result["latency"]
+    stages = " ".join(f"{name}={result['stages'][name]['p50']:.1f}" for name in STAGES)
+    vram = f"{result['peak_vram_mb']:.0f}MB" if result["peak_vram_mb"] is not None else "n/d"
+    print(
+        f"{result['key']:<22} p50={latency['p50']:.1f}ms p95={latency['p95']:.1f}ms p99={latency['p99']:.1f}ms "
+        f"{result['throughput_ips']:.2f} img/s RSS={result['peak_rss_mb']:.0f}MB VRAM={vram} | {stages}"
+    )
+
+
+def parse_resolutions(spec):
+    return [tuple(int(v) for v in item.lower().split("x")) for item in spec.split(",")]
+
+
+def parse_ints(spec):
+    return [int(v) for v in spec.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["stub", "pipeline"], default="stub")
+    parser.add_argument("--model", default=DEFAULT_MODEL,
+                        help="Modelo del backend pipeline: id del Hub o ruta local (p. ej. uno pequeño para probar en CPU)")
+    parser.add_argument("--placement", choices=("auto",) + STRATEGIES, default="auto",
+                        help="Ubicación del backend pipeline (auto = según la memoria disponible)")
+    parser.add_argument("--dtype", help="float16, bfloat16 o float32 (por defecto, el del plan)")
+    parser.add_argument("--quantize", choices=QUANT_MODES, help="Cuantizar las capas lineales (CPU, float32)")
+    parser.add_argument("--threads", type=int, default=0, help="Hilos intra-op de torch (0 = por defecto)")
+    parser.add_argument("--interop-threads", type=int, default=0, help="Hilos inter-op de torch (0 = por defecto)")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla del ruido del backend pipeline")
+    parser.add_argument("--resolutions", default="512x512,1024x1024")
+    parser.add_argument("--steps", default="4,20")
+    parser.add_argument("--batch-sizes", default="1,2")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--prompt", default="Make the sky a sunset")
+    parser.add_argument("--output", help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior con el que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Empeoramiento relativo tolerado (0.10 = 10%%)")
+    parser.add_argument("--save-sample", help="Guardar la imagen resultante de la primera combinación")
+    args = parser.parse_args(argv)
+
+    if args.backend == "pipeline":
+        placement = None if args.placement == "auto" else args.placement
+        backend = PipelineBackend(
+            placement=placement,
+            dtype=args.dtype,
+            model=args.model,
+            quantize=args.quantize,
+            threads=args.threads,
+            interop_threads=args.interop_threads,
+            seed=args.seed,
+        )
+    else:
+        backend = StubBackend()
+
+    print(f"=== BENCHMARK QWEN-IMAGE-EDIT ({backend.name}) ===")
+    try:
+        report = run_matrix(
+            backend,
+            parse_resolutions(args.resolutions),
+            parse_ints(args.steps),
+            parse_ints(args.batch_sizes),
+            repeats=args.repeats,
+            warmup=args.warmup,
+            prompt=args.prompt,
+        )
+    except Exception as e:
+        print(f"❌ Error durante el benchmark: {type(e).__name__}: {e}")
+        return False
+    if args.backend == "pipeline":
+        report["meta"]["model"] = args.model
+        report["meta"]["placement"] = backend.plan.as_dict()
+        report["meta"]["quantize"] = args.quantize
+
+    if args.save_sample:
+        resolution = parse_resolutions(args.resolutions)[0]
+        data = synthetic_request(*resolution)
+        image = backend.preprocess(open_input_image(decode_base64_image(data, float("inf"), float("inf")), float("inf")))
+        backend.infer([image], args.prompt, parse_ints(args.steps)[0])[0].save(args.save_sample)
+        print(f"💾 Imagen de muestra guardada como '{args.save_sample}'")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Resultados guardados en {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = compare_with_baseline(report, baseline, args.tolerance)
+        print(f"\n=== COMPARACIÓN CON {args.baseline} (tolerancia {args.tolerance:.0%}) ===")
+        for key, metric, before, after, change, regression in rows:
+            flag = "❌ REGRESIÓN" if regression else "✅"
+            print(f"{key:<22} {metric:<16} {before:>10.2f} -> {after:>10.2f} ({change:+.1%}) {flag}")
+        if any(row[-1] for row in rows):
+            return False
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
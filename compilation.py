@@ -0,0 +1,132 @@
+# compilation.py
+# Modo compilado del transformer (torch.compile) con caché persistente de
+# los artefactos de compilación y contador de recompilaciones
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Compilaciones que guarda dynamo por función antes de volver a modo eager.
+# Cada bucket de resolución es un grafo distinto, así que el límite por
+# defecto (8) se queda corto
+RECOMPILE_LIMIT = 64
+# Los embeddings del prompt se rellenan hasta un múltiplo de esta longitud:
+# el transformer convierte la longitud del texto en un int de Python (RoPE),
+# así que cada longitud distinta sería un grafo distinto
+TEXT_PADDING = 64
+
+
+def configure_cache(cache_dir):
+    """
+    Guarda los artefactos de compilación (grafos de inductor, kernels de
+    Triton y de C++ en CPU, resultados de autotuning) en `cache_dir`, para
+    que los cold starts siguientes los reutilicen en lugar de recompilar.
+    Debe llamarse antes de importar torch: inductor lee estas variables al
+    importarse.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", cache_dir)
+    os.environ.setdefault("TRITON_CACHE_DIR", os.path.join(cache_dir, "triton"))
+    os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+    os.environ.setdefault("TORCHINDUCTOR_AUTOGRAD_CACHE", "1")
+
+
+class CompiledDenoiser:
+    """
+    Sustituye `forward` del transformer por su versión compilada. Los
+    grafos se especializan por forma (un grafo por bucket de resolución,
+    tamaño de lote y tramo de longitud del prompt). Para que cada prompt
+    nuevo no provoque una compilación, los embeddings del prompt se
+    rellenan hasta un múltiplo de `text_padding` con la máscara de atención
+    a cero en el relleno, que así no influye en el resultado.
+
+    Cuenta las compilaciones por forma: la primera de cada forma es
+    esperada, las siguientes son recompilaciones (cambios de guards que no
+    se previeron) y se registran como warning.
+    """
+
+    def __init__(self, module, mode=None, text_padding=TEXT_PADDING):
+        import torch
+        from torch._dynamo.utils import counters
+
+        self.torch = torch
+        self._counters = counters
+        for name in ("recompile_limit", "cache_size_limit"):
+            if hasattr(torch._dynamo.config, name):
+                setattr(torch._dynamo.config, name, max(getattr(torch._dynamo.config, name), RECOMPILE_LIMIT))
+
+        self.module = module
+        self.mode = mode
+        self.text_padding = text_padding
+        self._forward = module.forward
+        self._compiled = torch.compile(self._forward, mode=mode, dynamic=False)
+        self._lock = threading.Lock()
+        self.compiles = {}
+        self.recompiles = 0
+        self.compile_seconds = 0.0
+        module.forward = self
+
+    def __call__(self, *args, **kwargs):
+        hidden_states = kwargs.get("hidden_states", args[0] if args else None)
+        if self.text_padding and kwargs.get("encoder_hidden_states") is not None:
+            self._pad_text(kwargs)
+
+        text = kwargs.get("encoder_hidden_states")
+        shape = tuple(hidden_states.shape[:2]) + ((text.shape[1],) if text is not None else ())
+        graphs_before = self._counters["stats"]["unique_graphs"]
+        start = time.time()
+        output = self._compiled(*args, **kwargs)
+        if self._counters["stats"]["unique_graphs"] != graphs_before:
+            self._record_compile(shape, time.time() - start)
+        return output
+
+    def _pad_text(self, kwargs):
+        # Relleno del prompt hasta el siguiente múltiplo de text_padding (en kwargs)
+        text = kwargs["encoder_hidden_states"]
+        batch, length = text.shape[:2]
+        target = math.ceil(length / self.text_padding) * self.text_padding
+        if target == length:
+            return
+        mask = kwargs.get("encoder_hidden_states_mask")
+        if mask is None:
+            mask = self.torch.ones(batch, length, dtype=self.torch.bool, device=text.device)
+        padding = target - length
+        kwargs["encoder_hidden_states"] = self.torch.nn.functional.pad(text, (0, 0, 0, padding))
+        kwargs["encoder_hidden_states_mask"] = self.torch.nn.functional.pad(mask.bool(), (0, padding), value=False)
+
+    def _record_compile(self, shape, seconds):
+        with self._lock:
+            count = self.compiles.get(shape, 0) + 1
+            self.compiles[shape] = count
+            self.compile_seconds += seconds
+            if count > 1:
+                self.recompiles += 1
+        description = "x".join(str(dim) for dim in shape)
+        if count > 1:
+            logger.warning(
+                f"RECOMPILE: transformer (lote x tokens de imagen x tokens de texto = {description}) "
+                f"recompilado {count} veces ({seconds:.1f}s); total de recompilaciones: {self.recompiles}"
+            )
+        else:
+            logger.info(f"COMPILE: transformer {description} (lote x tokens de imagen x tokens de texto) en {seconds:.1f}s")
+
+    def stats(self):
+        """Formas compiladas, recompilaciones y segundos de compilación."""
+        with self._lock:
+            return {
+                "shapes": len(self.compiles),
+                "recompiles": self.recompiles,
+                "compile_seconds": round(self.compile_seconds, 1),
+            }
+
+    def restore(self):
+        """Vuelve al forward eager."""
+        self.module.forward = self._forward
+
+
+def compile_transformer(pipeline, mode=None):
+    """Compila el transformer del pipeline y devuelve el `CompiledDenoiser`."""
+    return CompiledDenoiser(pipeline.transformer, mode=mode)
@@ -0,0 +1,185 @@
+# config.py
+# Configuración del worker leída de variables de entorno
+# Todas las funcionalidades opcionales están desactivadas por defecto
+import os
+
+
+def env_bool(name, default=False):
+    """Lee un booleano ("1", "true", "yes", "on") de una variable de entorno."""
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_int(name, default):
+    """Lee un entero de una variable de entorno."""
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    return int(value)
+
+
+def env_float(name, default):
+    """Lee un número decimal de una variable de entorno."""
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    return float(value)
+
+
+def env_str(name, default=None):
+    """Lee una cadena de una variable de entorno (vacía equivale a no definida)."""
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip()
+
+
+# Micro-batching de trabajos concurrentes
+# Agrupa los trabajos que llegan dentro de una ventana corta y los ejecuta
+# en una sola llamada al pipeline por bucket de resolución
+BATCH_ENABLED = env_bool("QWEN_BATCH_ENABLED", False)
+BATCH_MAX_SIZE = env_int("QWEN_BATCH_MAX_SIZE", 4)
+BATCH_MAX_WAIT_MS = env_float("QWEN_BATCH_MAX_WAIT_MS", 50.0)
+
+# Handler asíncrono en etapas: decode/encode en un pool de CPU solapados con la inferencia
+PIPELINED_HANDLER = env_bool("QWEN_PIPELINED_HANDLER", False)
+CPU_WORKERS = env_int("QWEN_CPU_WORKERS", 4)
+
+# Trabajos simultáneos que RunPod entrega a este worker. En modo pipelined
+# hacen falta al menos 3 (preparando N+1, infiriendo N, codificando N-1)
+MAX_CONCURRENCY = env_int(
+    "QWEN_MAX_CONCURRENCY",
+    BATCH_MAX_SIZE if BATCH_ENABLED else (3 if PIPELINED_HANDLER else 1)
+)
+
+# Trabajos con varios elementos (campo items): máximo de elementos por
+# trabajo y elementos en proceso a la vez (se agrupan con el micro-batcher)
+ITEMS_MAX = env_int("QWEN_ITEMS_MAX", 64)
+ITEMS_CONCURRENCY = env_int("QWEN_ITEMS_CONCURRENCY", 2 * BATCH_MAX_SIZE)
+# Handler generador: devuelve cada elemento (o el resultado) en cuanto termina
+STREAM_RESULTS = env_bool("QWEN_STREAM_RESULTS", False)
+# Con el handler generador, eventos de progreso tras cada paso de denoising
+# y una preview (proyección lineal de los latentes, JPEG) cada N pasos; 0 = sin previews
+STREAM_PROGRESS = env_bool("QWEN_STREAM_PROGRESS", True)
+PREVIEW_INTERVAL = env_int("QWEN_PREVIEW_INTERVAL", 5)
+PREVIEW_QUALITY = env_int("QWEN_PREVIEW_QUALITY", 70)
+
+# Pool de procesos worker, cada uno con su pipeline: "0" = deshabilitado
+# (el pipeline corre en este proceso), N = N workers, "auto" = uno por
+# dispositivo. Dispositivos: "auto" (cada GPU o, sin GPU, cada nodo NUMA) o
+# una lista "cuda:0,cuda:1" / "cpu:0,cpu:1". Backend "stub" para probar el
+# pool sin modelo (ver stub_pipeline.py)
+WORKERS = env_str("QWEN_WORKERS", "0")
+WORKER_DEVICES = env_str("QWEN_WORKER_DEVICES", "auto")
+WORKER_BACKEND = env_str("QWEN_WORKER_BACKEND", "pipeline")
+
+# Caché de resultados para peticiones idénticas (reintentos y envíos duplicados)
+RESULT_CACHE_ENABLED = env_bool("QWEN_RESULT_CACHE_ENABLED", False)
+RESULT_CACHE_MEMORY_MB = env_float("QWEN_RESULT_CACHE_MEMORY_MB", 256.0)
+# Directorio del nivel en disco (p. ej. un network volume); sin definir = solo memoria
+RESULT_CACHE_DIR = env_str("QWEN_RESULT_CACHE_DIR")
+RESULT_CACHE_DISK_MB = env_float("QWEN_RESULT_CACHE_DISK_MB", 2048.0)
+
+# Caché de embeddings del prompt (encoder Qwen2.5-VL)
+PROMPT_CACHE_ENABLED = env_bool("QWEN_PROMPT_CACHE_ENABLED", False)
+PROMPT_CACHE_MB = env_float("QWEN_PROMPT_CACHE_MB", 256.0)
+# JSON con [{"prompt": ..., "image_path": ...}] a precalcular en init()
+PROMPT_CACHE_PRELOAD = env_str("QWEN_PROMPT_CACHE_PRELOAD")
+
+# Caché de imagen decodificada, tensor preprocesado y latentes del VAE por hash de imagen
+LATENT_CACHE_ENABLED = env_bool("QWEN_LATENT_CACHE_ENABLED", False)
+LATENT_CACHE_MB = env_float("QWEN_LATENT_CACHE_MB", 1024.0)
+
+# Caché de pasos de denoising: reutiliza la salida del transformer mientras su
+# entrada cambia menos que el umbral (cambio relativo L1 acumulado)
+STEP_CACHE_ENABLED = env_bool("QWEN_STEP_CACHE_ENABLED", False)
+STEP_CACHE_THRESHOLD = env_float("QWEN_STEP_CACHE_THRESHOLD", 0.05)
+# Pasos iniciales que se calculan siempre
+STEP_CACHE_WARMUP_STEPS = env_int("QWEN_STEP_CACHE_WARMUP_STEPS", 2)
+
+# Política de latencia (peticiones con latency_budget): fracción del
+# presupuesto reservada para cola, decode y encode
+POLICY_MARGIN = env_float("QWEN_POLICY_MARGIN", 0.15)
+# Modelo inicial de la duración del pipeline hasta medir llamadas reales:
+# segundos fijos por llamada y segundos por step y megapíxel
+POLICY_PRIOR_OVERHEAD = env_float("QWEN_POLICY_PRIOR_OVERHEAD", 3.0)
+POLICY_PRIOR_STEP_SECONDS = env_float("QWEN_POLICY_PRIOR_STEP_SECONDS", 1.0)
+
+# Codificación de la salida
+# Nivel de compresión PNG por defecto (0-9); 0-1 son más rápidos que el 6 de PIL
+PNG_COMPRESS_LEVEL = env_int("QWEN_PNG_COMPRESS_LEVEL", 6)
+# Volumen montado donde se escriben los resultados con output_mode="path"
+OUTPUT_DIR = env_str("QWEN_OUTPUT_DIR")
+
+# Límites de las imágenes de entrada (se comprueban antes de la decodificación completa)
+INPUT_MAX_BYTES = env_float("QWEN_INPUT_MAX_MB", 20.0) * 1024**2
+INPUT_MAX_PIXELS = env_float("QWEN_INPUT_MAX_MEGAPIXELS", 50.0) * 1e6
+# Ajusta cada imagen de entrada al bucket de resolución más parecido, para
+# que las formas sean predecibles (micro-batching, caché de compilación)
+SNAP_TO_BUCKETS = env_bool("QWEN_SNAP_TO_BUCKETS", False)
+# Lista de buckets "1024x1024,1184x896,..."; sin definir = buckets por defecto de image_io
+RESOLUTION_BUCKETS = env_str("QWEN_RESOLUTION_BUCKETS")
+
+# Edición acotada a la región de la máscara: con una máscara pequeña se
+# edita solo su caja (más contexto) y se funde el resultado sobre el original
+REGION_EDIT_ENABLED = env_bool("QWEN_REGION_EDIT_ENABLED", False)
+# Píxeles de contexto alrededor de la caja de la máscara
+REGION_PADDING = env_int("QWEN_REGION_PADDING", 64)
+# Fracción máxima del área de la imagen para usar la región; por encima se edita la imagen completa
+REGION_MAX_AREA = env_float("QWEN_REGION_MAX_AREA", 0.5)
+# Píxeles de difuminado del borde al fundir el resultado
+REGION_FEATHER = env_int("QWEN_REGION_FEATHER", 16)
+
+# Procesamiento por teselas de imágenes grandes: en lugar de reducirlas a
+# ~1 MP se editan por teselas solapadas a resolución nativa
+TILED_ENABLED = env_bool("QWEN_TILED_ENABLED", False)
+# Imágenes con más megapíxeles que este umbral se procesan por teselas
+TILED_MIN_MEGAPIXELS = env_float("QWEN_TILED_MIN_MEGAPIXELS", 2.0)
+TILE_SIZE = env_int("QWEN_TILE_SIZE", 1024)
+TILE_OVERLAP = env_int("QWEN_TILE_OVERLAP", 128)
+# Codificación/decodificación del VAE por teselas (menos VRAM pico), independiente de lo anterior
+TILED_VAE = env_bool("QWEN_TILED_VAE", False)
+
+# Logging: los handlers escriben desde un hilo en segundo plano (QueueListener)
+LOG_LEVEL = env_str("QWEN_LOG_LEVEL", "INFO").upper()
+LOG_FILE = env_str("QWEN_LOG_FILE", "qwen_image_edit.log")
+# Log detallado de cada trabajo (banners, parámetros, tamaños...). Desactivado
+# solo se registran errores y las líneas de METRICS/STAGES
+VERBOSE_LOGS = env_bool("QWEN_VERBOSE_LOGS", True)
+# Puerto del endpoint HTTP de métricas (/metrics y /metrics.json); 0 = deshabilitado
+METRICS_PORT = env_int("QWEN_METRICS_PORT", 0)
+
+# Arranque rápido
+# Modelo a cargar: id del Hub o, mejor, un snapshot local ya descargado
+# (p. ej. en un network volume) para no descargar nada en el cold start
+MODEL_ID = env_str("QWEN_MODEL_ID", "Qwen/Qwen-Image-Edit")
+MODEL_PATH = env_str("QWEN_MODEL_PATH")
+# Carga de los componentes del pipeline en paralelo desde MODEL_PATH y carga
+# del modelo en segundo plano nada más arrancar, sin esperar al primer trabajo
+FAST_START = env_bool("QWEN_FAST_START", False)
+LOAD_WORKERS = env_int("QWEN_LOAD_WORKERS", 4)
+# Ubicación del pipeline: "auto" la elige según la VRAM y la RAM disponibles;
+# también resident, model_offload, sequential_offload o cpu (ver placement.py)
+PLACEMENT = env_str("QWEN_PLACEMENT", "auto")
+# dtype del pipeline: "auto" (bfloat16 si la GPU lo soporta), float16, bfloat16 o float32
+DTYPE = env_str("QWEN_DTYPE", "auto")
+# Cuantización de las capas lineales cuando el pipeline corre en CPU: int8
+# (dinámica) o int8_weight_only (requiere torchao); vacío = sin cuantizar
+CPU_QUANTIZE = env_str("QWEN_CPU_QUANTIZE")
+# Hilos de torch dentro de cada operación y entre operaciones; 0 = por defecto
+TORCH_THREADS = env_int("QWEN_TORCH_THREADS", 0)
+TORCH_INTEROP_THREADS = env_int("QWEN_TORCH_INTEROP_THREADS", 0)
+# Inferencia de calentamiento (1 step) al terminar la carga
+WARMUP = env_bool("QWEN_WARMUP", False)
+
+# Transformer compilado (torch.compile): un grafo por bucket de resolución,
+# compilados en el calentamiento antes de atender trabajos
+COMPILE = env_bool("QWEN_COMPILE", False)
+# Modo de torch.compile (p. ej. max-autotune-no-cudagraphs); vacío = por defecto
+COMPILE_MODE = env_str("QWEN_COMPILE_MODE")
+# Artefactos de compilación persistentes; en un network volume sobreviven a los cold starts
+COMPILE_CACHE_DIR = env_str("QWEN_COMPILE_CACHE_DIR", "torch_compile_cache")
+# Buckets que se compilan en el calentamiento ("1024x1024,1184x896"); vacío = RESOLUTION_BUCKETS
+COMPILE_BUCKETS = env_str("QWEN_COMPILE_BUCKETS")
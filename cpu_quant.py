@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# cpu_quant.py
+# Modo de inferencia en CPU cuantizado: capas lineales del transformer y del
+# text encoder en int8, ajuste de hilos de torch y comparación de precisiones
+"""
+Inferencia cuantizada en CPU para Qwen-Image-Edit
+
+  python cpu_quant.py compare --resolution 256x256 --steps 5
+      Ejecuta el pipeline en CPU en float32, bfloat16 e int8 (cada uno en
+      su propio proceso) y compara latencia, RSS pico y PSNR frente al
+      resultado en float32.
+
+Modos de cuantización:
+  - int8: cuantización dinámica de torch (pesos int8, activaciones
+    cuantizadas al vuelo por lote). No necesita dependencias extra.
+  - int8_weight_only: pesos int8 y cálculo en float (requiere torchao).
+Ambos parten de los pesos en float32.
+"""
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import warnings
+
+import numpy as np
+from PIL import Image
+
+QUANT_MODES = ("int8", "int8_weight_only")
+# Componentes cuyas capas lineales concentran casi todo el cómputo (el VAE es convolucional)
+QUANTIZED_COMPONENTS = ("transformer", "text_encoder")
+
+# Variantes de la comparación: (nombre, dtype, cuantización)
+COMPARED_VARIANTS = [
+    ("fp32", "float32", None),
+    ("bf16", "bfloat16", None),
+    ("int8", "float32", "int8"),
+]
+
+
+def configure_threads(num_threads=0, interop_threads=0):
+    """
+    Hilos de torch en CPU: `num_threads` para el paralelismo dentro de cada
+    operación (matmul, conv) e `interop_threads` entre operaciones
+    independientes. 0 deja el valor por defecto de torch. El número de hilos
+    entre operaciones solo se puede fijar antes de que torch ejecute trabajo
+    en paralelo.
+    """
+    import torch
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            warnings.warn(f"No se pudo fijar interop_threads={interop_threads}: {e}")
+    return torch.get_num_threads(), torch.get_num_interop_threads()
+
+
+def quantize_module(module, mode="int8"):
+    """Cuantiza in situ las capas lineales de `module` y devuelve cuántas había."""
+    import torch
+
+    if mode not in QUANT_MODES:
+        raise ValueError(f"Modo de cuantización desconocido: {mode} (opciones: {', '.join(QUANT_MODES)})")
+    linear_layers = sum(isinstance(child, torch.nn.Linear) for child in module.modules())
+
+    if mode == "int8_weight_only":
+        try:
+            from torchao.quantization import Int8WeightOnlyConfig, quantize_
+        except ImportError:
+            raise ImportError("int8_weight_only requiere torchao (pip install torchao)")
+        quantize_(module, Int8WeightOnlyConfig())
+        return linear_layers
+
+    from torch.ao.quantization import quantize_dynamic
+
+    with warnings.catch_warnings():
+        # torch.ao.quantization está marcado como obsoleto en favor de torchao
+        warnings.simplefilter("ignore")
+        quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return linear_layers
+
+
+def quantize_pipeline(pipeline, mode="int8", components=QUANTIZED_COMPONENTS):
+    """
+    Cuantiza las capas lineales de los componentes indicados de un pipeline
+    en CPU con pesos float32. Devuelve `{componente: capas cuantizadas}`.
+    """
+    quantized = {}
+    for name in components:
+        module = getattr(pipeline, name, None)
+        if module is None:
+            continue
+        if module.dtype.is_floating_point and module.dtype.itemsize != 4:
+            raise ValueError(f"{name}: la cuantización int8 parte de pesos float32, no de {module.dtype}")
+        quantized[name] = quantize_module(module, mode)
+    return quantized
+
+
+def psnr(reference, image):
+    """PSNR en dB de `image` frente a `reference` (inf si son idénticas)."""
+    if image.size != reference.size:
+        image = image.resize(reference.size, Image.LANCZOS)
+    a = np.asarray(reference.convert("RGB"), dtype=np.float64)
+    b = np.asarray(image.convert("RGB"), dtype=np.float64)
+    mse = np.mean((a - b) ** 2)
+    return math.inf if mse == 0 else 10 * math.log10(255.0**2 / mse)
+
+
+def run_variant(name, dtype, quantize, args, workdir):
+    """Ejecuta benchmark.py en un proceso aparte (RSS pico aislado) y devuelve su resultado."""
+    output = os.path.join(workdir, f"{name}.json")
+    sample = os.path.join(workdir, f"{name}.png")
+    command = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark.py"),
+        "--backend", "pipeline",
+        "--placement", "cpu",
+        "--dtype", dtype,
+        "--resolutions", args.resolution,
+        "--steps", str(args.steps),
+        "--batch-sizes", "1",
+        "--repeats", str(args.repeats),
+        "--warmup", "0",
+        "--seed", str(args.seed),
+        "--output", output,
+        "--save-sample", sample,
+    ]
+    if args.model:
+        command += ["--model", args.model]
+    if quantize:
+        command += ["--quantize", quantize]
+    if args.threads:
+        command += ["--threads", str(args.threads)]
+    if args.interop_threads:
+        command += ["--interop-threads", str(args.interop_threads)]
+
+    print(f"\n--- {name} ({dtype}{', ' + quantize if quantize else ''}) ---")
+    if subprocess.run(command).returncode != 0:
+        return None
+    with open(output) as f:
+        result = json.load(f)["results"][0]
+    return {"result": result, "sample": Image.open(sample).convert("RGB")}
+
+
+def compare(args):
+    """Compara fp32, bf16 e int8 en latencia, RSS pico y PSNR frente a fp32."""
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        runs = {name: run_variant(name, dtype, quantize, args, workdir) for name, dtype, quantize in COMPARED_VARIANTS}
+
+    reference = runs["fp32"]
+    print(f"\n=== COMPARACIÓN CPU ({args.resolution}, {args.steps} steps) ===")
+    print(f"{'variante':<10} {'p50 (s)':>10} {'vs fp32':>8} {'RSS pico (MB)':>14} {'PSNR (dB)':>10}")
+    for name, _, _ in COMPARED_VARIANTS:
+        run = runs[name]
+        if run is None:
+            print(f"{name:<10} {'error':>10}")
+            continue
+        latency = run["result"]["latency"]["p50"] / 1000
+        speedup = reference["result"]["latency"]["p50"] / 1000 / latency if reference else float("nan")
+        similarity = psnr(reference["sample"], run["sample"]) if reference else float("nan")
+        rows.append({
+            "variant": name,
+            "latency_p50_s": latency,
+            "speedup": speedup,
+            "peak_rss_mb": run["result"]["peak_rss_mb"],
+            "psnr_db": similarity,
+        })
+        print(f"{name:<10} {latency:>10.2f} {speedup:>7.2f}x {run['result']['peak_rss_mb']:>14.0f} {similarity:>10.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"\nResultados guardados en {args.output}")
+    return all(runs.values())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    compare_parser = commands.add_parser("compare", help="Comparar fp32, bf16 e int8 en CPU")
+    compare_parser.add_argument("--model", help="Id del Hub o ruta local (p. ej. un modelo pequeño; por defecto, el de benchmark.py)")
+    compare_parser.add_argument("--resolution", default="256x256")
+    compare_parser.add_argument("--steps", type=int, default=5)
+    compare_parser.add_argument("--repeats", type=int, default=1)
+    compare_parser.add_argument("--seed", type=int, default=0)
+    compare_parser.add_argument("--threads", type=int, default=0, help="Hilos intra-op (0 = por defecto de torch)")
+    compare_parser.add_argument("--interop-threads", type=int, default=0, help="Hilos inter-op (0 = por defecto de torch)")
+    compare_parser.add_argument("--output", help="Archivo JSON con la tabla de la comparación")
+    args = parser.parse_args(argv)
+
+    return compare(args)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# fast_start.py
+# Arranque rápido del worker: perfil de tiempos por fase del arranque y
+# carga en paralelo de los componentes del pipeline desde un snapshot local
+"""
+Herramientas de arranque rápido de Qwen-Image-Edit
+
+  python fast_start.py download --output /runpod-volume/qwen-image-edit
+      Materializa un snapshot local del modelo (solo safetensors y configs)
+
+  python fast_start.py profile --model-path <snapshot> --device cpu --dtype float32
+      Carga el pipeline con la ruta rápida e imprime el tiempo de cada fase.
+      Con un modelo pequeño de reemplazo sirve para medir en una máquina sin GPU.
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Solo lo necesario para cargar el pipeline (sin .bin duplicados ni extras)
+SNAPSHOT_PATTERNS = ["*.json", "*.safetensors", "*.txt", "*.model", "*.jinja"]
+
+
+class StartupProfiler:
+    """
+    Registra la duración de cada fase del arranque (imports, configuración,
+    pesos de cada componente, paso al dispositivo, calentamiento). Las fases
+    pueden solaparse cuando se ejecutan en paralelo; el total es el tiempo
+    de reloj desde `origin`.
+    """
+
+    def __init__(self, origin=None):
+        self.origin = origin if origin is not None else time.time()
+        self.phases = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """Mide el bloque como la fase `name`."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.time())
+
+    def record(self, name, start, end):
+        with self._lock:
+            self.phases.append((name, start, end))
+
+    def total(self):
+        with self._lock:
+            last = max((end for _, _, end in self.phases), default=self.origin)
+        return last - self.origin
+
+    def as_dict(self):
+        """Segundos por fase, en orden de inicio."""
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase[1])
+        return {name: end - start for name, start, end in phases}
+
+    def report(self):
+        """Resumen de una línea para el log (línea STARTUP)."""
+        parts = [f"{name}: {seconds:.2f}s" for name, seconds in self.as_dict().items()]
+        parts.append(f"total: {self.total():.2f}s")
+        return " | ".join(parts)
+
+
+def read_model_index(model_path):
+    """
+    Componentes del pipeline según `model_index.json` del snapshot:
+    `{nombre: (librería, clase)}`, sin los componentes vacíos.
+    """
+    with open(os.path.join(model_path, "model_index.json")) as f:
+        index = json.load(f)
+    return {
+        name: tuple(value)
+        for name, value in index.items()
+        if not name.startswith("_") and isinstance(value, list) and value[0] is not None
+    }
+
+
+def _component_size(model_path, name):
+    # Bytes de pesos en disco, para empezar por los componentes más grandes
+    directory = os.path.join(model_path, name)
+    if not os.path.isdir(directory):
+        return 0
+    return sum(
+        os.path.getsize(os.path.join(directory, filename))
+        for filename in os.listdir(directory)
+        if filename.endswith(".safetensors")
+    )
+
+
+def load_component(model_path, name, library, class_name, torch_dtype=None):
+    """
+    Carga un componente desde su subcarpeta del snapshot. Los modelos de
+    torch se cargan con `low_cpu_mem_usage` y safetensors, que se leen con
+    mmap: las páginas se traen del disco (o de la page cache) al copiarlas.
+    """
+    import torch
+
+    component_class = getattr(importlib.import_module(library), class_name)
+    kwargs = {}
+    if isinstance(component_class, type) and issubclass(component_class, torch.nn.Module):
+        kwargs.update(low_cpu_mem_usage=True, use_safetensors=True)
+        if torch_dtype is not None:
+            kwargs["torch_dtype"] = torch_dtype
+    return component_class.from_pretrained(os.path.join(model_path, name), **kwargs)
+
+
+def load_pipeline_components(model_path, torch_dtype=None, profiler=None, max_workers=4):
+    """
+    Carga todos los componentes del snapshot en paralelo (los más pesados
+    primero). La lectura de safetensors y la copia de tensores liberan el
+    GIL, así que los componentes grandes (transformer, text_encoder) se
+    cargan realmente a la vez. Devuelve `{nombre: componente}`.
+    """
+    profiler = profiler or StartupProfiler()
+    index = read_model_index(model_path)
+    order = sorted(index, key=lambda name: _component_size(model_path, name), reverse=True)
+
+    def timed_load(name):
+        library, class_name = index[name]
+        # torch_dtype puede ser un dtype o un dict por componente, como en from_pretrained
+        dtype = torch_dtype.get(name, torch_dtype.get("default")) if isinstance(torch_dtype, dict) else torch_dtype
+        with profiler.phase(f"weights:{name}"):
+            return load_component(model_path, name, library, class_name, dtype)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="load") as pool:
+        futures = {name: pool.submit(timed_load, name) for name in order}
+        return {name: future.result() for name, future in futures.items()}
+
+
+def load_pipeline_fast(model_path, pipeline_class=None, torch_dtype=None, profiler=None, max_workers=4):
+    """
+    Carga un pipeline de diffusers desde un snapshot local con los
+    componentes en paralelo. Sin `pipeline_class` se usa la clase indicada
+    en `model_index.json`.
+    """
+    components = load_pipeline_components(model_path, torch_dtype, profiler, max_workers)
+    if pipeline_class is None:
+        import diffusers
+        with open(os.path.join(model_path, "model_index.json")) as f:
+            pipeline_class = getattr(diffusers, json.load(f)["_class_name"])
+    return pipeline_class(**components)
+
+
+def download_snapshot(model_id, output, revision=None):
+    """Descarga un snapshot del modelo en `output` (solo lo necesario para cargarlo)."""
+    from huggingface_hub import snapshot_download
+
+    return snapshot_download(model_id, revision=revision, local_dir=output, allow_patterns=SNAPSHOT_PATTERNS)
+
+
+def profile_load(model_path, device="cpu", dtype="float32", workers=4):
+    """Carga el snapshot con la ruta rápida y devuelve el perfil."""
+    profiler = StartupProfiler()
+    with profiler.phase("imports:torch"):
+        import torch
+    with profiler.phase("imports:diffusers"):
+        import diffusers  # noqa: F401
+    pipeline = load_pipeline_fast(
+        model_path, torch_dtype=getattr(torch, dtype), profiler=profiler, max_workers=workers
+    )
+    with profiler.phase("device"):
+        pipeline.to(device)
+    return profiler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    download = commands.add_parser("download", help="Materializar un snapshot local del modelo")
+    download.add_argument("--model-id", default="Qwen/Qwen-Image-Edit")
+    download.add_argument("--revision")
+    download.add_argument("--output", required=True)
+
+    profile = commands.add_parser("profile", help="Medir la carga rápida de un snapshot local")
+    profile.add_argument("--model-path", required=True)
+    profile.add_argument("--device", default="cpu")
+    profile.add_argument("--dtype", default="float32")
+    profile.add_argument("--workers", type=int, default=4, help="Hilos de carga (1 = secuencial)")
+    args = parser.parse_args(argv)
+
+    if args.command == "download":
+        path = download_snapshot(args.model_id, args.output, args.revision)
+        print(f"✅ Snapshot de {args.model_id} en {path}")
+        print(f"   Usar con QWEN_MODEL_PATH={path}")
+        return True
+
+    profiler = profile_load(args.model_path, args.device, args.dtype, args.workers)
+    print(f"=== PERFIL DE CARGA ({args.workers} hilos) ===")
+    for name, seconds in profiler.as_dict().items():
+        print(f"{name:<28} {seconds:>8.2f}s")
+    print(f"{'total':<28} {profiler.total():>8.2f}s")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
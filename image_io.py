@@ -0,0 +1,234 @@
+# image_io.py
+# Decodificación endurecida de las imágenes de entrada y codificación de la
+# imagen resultante en el formato pedido por el cliente
+import base64
+import binascii
+import math
+import os
+import uuid
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+# Buckets de ~1 MP (múltiplos de 32) en las proporciones habituales. Son
+# puntos fijos del reescalado de QwenImageEditPipeline: una imagen ya
+# ajustada a un bucket no vuelve a cambiar de tamaño dentro del pipeline.
+DEFAULT_RESOLUTION_BUCKETS = [
+    (1024, 1024),
+    (1152, 928), (928, 1152),
+    (1184, 896), (896, 1184),
+    (1248, 832), (832, 1248),
+    (1376, 768), (768, 1376),
+    (1440, 736), (736, 1440),
+]
+
+# Caracteres base64 que se decodifican primero para leer solo la cabecera
+_HEADER_PROBE_CHARS = 64 * 1024
+
+
+class InputImageError(ValueError):
+    """Imagen de entrada inválida o fuera de los límites del worker (error del cliente)."""
+
+
+def parse_buckets(spec):
+    """Convierte "1024x1024,1184x896" en [(1024, 1024), (1184, 896)]."""
+    buckets = []
+    for item in spec.split(','):
+        width, height = item.strip().lower().split('x')
+        buckets.append((int(width), int(height)))
+    return buckets
+
+
+def nearest_bucket(size, buckets):
+    """Bucket con la proporción más parecida a `size` (distancia en escala logarítmica)."""
+    ratio = math.log(size[0] / size[1])
+    return min(buckets, key=lambda bucket: abs(math.log(bucket[0] / bucket[1]) - ratio))
+
+
+def resolution_bucket(size):
+    """
+    Resolución a la que el pipeline reescala una imagen de tamaño `size`
+    (~1 MP conservando la proporción, en múltiplos de 32). Dos imágenes con
+    el mismo bucket se pueden procesar en la misma llamada al pipeline.
+    """
+    width, height = size
+    ratio = width / height
+    bucket_width = math.sqrt(1024 * 1024 * ratio)
+    bucket_height = bucket_width / ratio
+    return (round(bucket_width / 32) * 32, round(bucket_height / 32) * 32)
+
+
+def _strip_data_url(data):
+    # Acepta "data:image/png;base64,...." además del base64 plano
+    if data.startswith('data:'):
+        _, _, data = data.partition(',')
+    return data
+
+
+def decode_base64_image(data, max_bytes, max_pixels, label='imagen'):
+    """
+    Decodifica una imagen en base64 aplicando los límites antes de la
+    decodificación completa:
+
+    1. El tamaño decodificado se estima por la longitud del base64.
+    2. Se decodifica solo el principio del base64 y se lee la cabecera de
+       la imagen para rechazar dimensiones excesivas sin decodificar el resto.
+
+    Devuelve los bytes de la imagen. Lanza InputImageError si no es válida.
+    """
+    data = _strip_data_url(data)
+    estimated_bytes = len(data) * 3 // 4
+    if estimated_bytes > max_bytes:
+        raise InputImageError(
+            f"{label}: {estimated_bytes / 1024**2:.1f} MB supera el máximo de {max_bytes / 1024**2:.1f} MB"
+        )
+
+    if len(data) > _HEADER_PROBE_CHARS:
+        try:
+            header = base64.b64decode(data[:_HEADER_PROBE_CHARS])
+            width, height = Image.open(BytesIO(header)).size
+        except Exception:
+            # Cabecera más larga que la muestra o formato sin cabecera al inicio:
+            # se comprueba tras la decodificación completa
+            pass
+        else:
+            _check_pixels(width, height, max_pixels, label)
+
+    try:
+        image_bytes = base64.b64decode(data)
+    except (binascii.Error, ValueError) as e:
+        raise InputImageError(f"{label}: base64 inválido ({e})")
+    return image_bytes
+
+
+def _check_pixels(width, height, max_pixels, label):
+    if width * height > max_pixels:
+        raise InputImageError(
+            f"{label}: {width}x{height} ({width * height / 1e6:.1f} MP) supera el máximo de {max_pixels / 1e6:.1f} MP"
+        )
+
+
+def open_input_image(image_bytes, max_pixels, mode='RGB', target_pixels=None, label='imagen'):
+    """
+    Abre y normaliza una imagen ya decodificada de base64:
+
+    - Rechaza imágenes con más de `max_pixels`.
+    - Para JPEG grandes usa decodificación reducida (draft) hacia
+      `target_pixels`, que decodifica a 1/2, 1/4 u 1/8 de escala sin
+      procesar la imagen completa.
+    - Aplica la orientación EXIF y convierte al modo de color `mode`.
+    """
+    try:
+        image = Image.open(BytesIO(image_bytes))
+    except Exception as e:
+        raise InputImageError(f"{label}: no es una imagen válida ({e})")
+
+    width, height = image.size
+    _check_pixels(width, height, max_pixels, label)
+
+    if target_pixels and image.format == 'JPEG' and width * height > 4 * target_pixels:
+        scale = math.sqrt(target_pixels / (width * height))
+        image.draft(mode if mode in ('RGB', 'L') else 'RGB', (int(width * scale), int(height * scale)))
+
+    try:
+        image = ImageOps.exif_transpose(image)
+        if image.mode != mode:
+            image = image.convert(mode)
+        image.load()
+    except Exception as e:
+        raise InputImageError(f"{label}: no se pudo decodificar ({e})")
+    return image
+
+
+def snap_to_bucket(image, buckets, resample=Image.LANCZOS):
+    """Reescala la imagen al bucket de resolución con la proporción más parecida."""
+    bucket = nearest_bucket(image.size, buckets)
+    if image.size == bucket:
+        return image
+    return image.resize(bucket, resample)
+
+
+# formato de la API -> (formato de PIL, extensión, content type)
+OUTPUT_FORMATS = {
+    'png': ('PNG', 'png', 'image/png'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    # Píxeles RGB sin comprimir (ancho * alto * 3 bytes), sin coste de compresión
+    'raw': (None, 'rgb', 'application/octet-stream'),
+}
+
+OUTPUT_MODES = ('base64', 'path')
+
+
+def check_output_options(options, output_dir=None):
+    """
+    Valida las opciones de salida de una petición. Devuelve la lista de
+    errores (vacía si son válidas).
+    """
+    errors = []
+    if options['output_format'] not in OUTPUT_FORMATS:
+        errors.append(f"output_format debe ser uno de {sorted(OUTPUT_FORMATS)}")
+    if not 1 <= options['output_quality'] <= 100:
+        errors.append("output_quality debe estar entre 1 y 100")
+    if not 0 <= options['png_compress_level'] <= 9:
+        errors.append("png_compress_level debe estar entre 0 y 9")
+    if options['output_mode'] not in OUTPUT_MODES:
+        errors.append(f"output_mode debe ser uno de {list(OUTPUT_MODES)}")
+    elif options['output_mode'] == 'path' and not output_dir:
+        errors.append("output_mode 'path' no está disponible en este worker (QWEN_OUTPUT_DIR no configurado)")
+    return errors
+
+
+def encode_image(image, output_format='png', quality=90, compress_level=6):
+    """
+    Codifica una imagen PIL y devuelve los bytes.
+
+    - png: sin pérdida; `compress_level` 0-9 (1 es más rápido que el 6
+      por defecto de PIL a costa de un archivo algo mayor).
+    - jpeg / webp: con pérdida según `quality` 1-100.
+    - raw: bytes RGB sin cabecera.
+    """
+    pil_format, _, _ = OUTPUT_FORMATS[output_format]
+    if pil_format is None:
+        return image.convert('RGB').tobytes()
+
+    buffered = BytesIO()
+    if pil_format == 'PNG':
+        image.save(buffered, format='PNG', compress_level=compress_level)
+    else:
+        # JPEG no admite canal alfa
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(buffered, format=pil_format, quality=quality)
+    return buffered.getvalue()
+
+
+def build_output(image, options, output_dir=None):
+    """
+    Codifica la imagen según las opciones de salida de la petición y arma
+    los campos de la respuesta: `image_base64` en línea, o `image_path` si
+    se pidió escribir el archivo en el volumen montado `output_dir`.
+    """
+    output_format = options['output_format']
+    data = encode_image(
+        image,
+        output_format=output_format,
+        quality=options['output_quality'],
+        compress_level=options['png_compress_level']
+    )
+    _, extension, content_type = OUTPUT_FORMATS[output_format]
+
+    output = {'format': output_format, 'content_type': content_type}
+    if output_format == 'raw':
+        output['width'], output['height'] = image.size
+        output['mode'] = 'RGB'
+
+    if options['output_mode'] == 'path':
+        path = os.path.join(output_dir, f"{uuid.uuid4().hex}.{extension}")
+        with open(path, 'wb') as f:
+            f.write(data)
+        output['image_path'] = path
+        output['bytes'] = len(data)
+    else:
+        output['image_base64'] = base64.b64encode(data).decode('utf-8')
+    return output
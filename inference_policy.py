@@ -0,0 +1,166 @@
+# inference_policy.py
+# Parámetros de inferencia de cada petición y política adaptativa: con un
+# presupuesto de latencia, elige steps y resolución a partir de las
+# latencias observadas en este worker
+import math
+import threading
+
+# Límites de los parámetros de inferencia
+MAX_STEPS = 100
+MAX_OUTPUT_PIXELS = 2048 * 2048
+MIN_OUTPUT_SIDE = 256
+MAX_SEED = 2**64 - 1
+
+# Candidatos de la política: fracciones de los steps pedidos y del área de salida
+STEP_FRACTIONS = (1.0, 0.75, 0.5, 0.35, 0.25)
+AREA_FRACTIONS = (1.0, 0.75, 0.5, 0.25)
+MIN_STEPS = 4
+
+
+def check_inference_options(options):
+    """
+    Valida los parámetros de inferencia de una petición. Devuelve la lista
+    de errores (vacía si son válidos).
+    """
+    errors = []
+    if not 1 <= options['num_inference_steps'] <= MAX_STEPS:
+        errors.append(f"num_inference_steps debe estar entre 1 y {MAX_STEPS}")
+    if not 0 <= options['guidance_scale'] <= 30:
+        errors.append("guidance_scale debe estar entre 0 y 30")
+    if options['true_cfg_scale'] is not None and not 1 <= options['true_cfg_scale'] <= 20:
+        errors.append("true_cfg_scale debe estar entre 1 y 20")
+    if options['seed'] is not None and not 0 <= options['seed'] <= MAX_SEED:
+        errors.append(f"seed debe estar entre 0 y {MAX_SEED}")
+    if options['latency_budget'] is not None and options['latency_budget'] <= 0:
+        errors.append("latency_budget debe ser un número de segundos mayor que 0")
+
+    width, height = options['width'], options['height']
+    if (width is None) != (height is None):
+        errors.append("width y height deben indicarse juntos")
+    elif width is not None:
+        if min(width, height) < MIN_OUTPUT_SIDE:
+            errors.append(f"width y height deben ser al menos {MIN_OUTPUT_SIDE}")
+        elif width * height > MAX_OUTPUT_PIXELS:
+            errors.append(f"width x height no puede superar {MAX_OUTPUT_PIXELS / 1e6:.1f} MP")
+    return errors
+
+
+def round_size(size, multiple=32):
+    """Redondea un tamaño al múltiplo de `multiple` más cercano (como el pipeline)."""
+    return tuple(max(multiple, int(round(side / multiple)) * multiple) for side in size)
+
+
+def scale_size(size, area_fraction, multiple=32, min_side=MIN_OUTPUT_SIDE):
+    """Tamaño con `area_fraction` del área de `size`, misma proporción, en múltiplos de `multiple`."""
+    if area_fraction >= 1:
+        return size
+    factor = math.sqrt(area_fraction)
+    factor = max(factor, min_side / min(size))
+    return round_size((size[0] * factor, size[1] * factor), multiple)
+
+
+def work_units(steps, size, passes=1):
+    """Trabajo de una llamada: steps x megapíxeles generados x pasadas del transformer (2 con CFG real)."""
+    return steps * size[0] * size[1] / 1e6 * passes
+
+
+class LatencyModel:
+    """
+    Modelo lineal de la duración de una llamada al pipeline,
+    `segundos = fijo + coste * work_units`, ajustado por mínimos cuadrados
+    con olvido exponencial (`decay` por observación) sobre las llamadas
+    medidas en este worker. Hasta tener observaciones con trabajo distinto
+    se usan los valores iniciales `prior_overhead` y `prior_unit_seconds`,
+    corregidos para reproducir la duración media observada.
+    """
+
+    def __init__(self, prior_overhead=3.0, prior_unit_seconds=1.0, decay=0.97):
+        self.prior_overhead = prior_overhead
+        self.prior_unit_seconds = prior_unit_seconds
+        self.decay = decay
+        self._sums = [0.0] * 5  # peso, Σx, Σx², Σy, Σxy
+        self.observations = 0
+        self._lock = threading.Lock()
+
+    def observe(self, units, seconds):
+        with self._lock:
+            weight, sx, sxx, sy, sxy = (value * self.decay for value in self._sums)
+            self._sums = [weight + 1, sx + units, sxx + units * units, sy + seconds, sxy + units * seconds]
+            self.observations += 1
+
+    def coefficients(self):
+        """`(fijo, coste por unidad)` estimados."""
+        with self._lock:
+            weight, sx, sxx, sy, sxy = self._sums
+        if weight == 0:
+            return self.prior_overhead, self.prior_unit_seconds
+        variance = weight * sxx - sx * sx
+        if weight >= 2 and variance > 1e-6 * weight * weight:
+            slope = (weight * sxy - sx * sy) / variance
+            intercept = (sy - slope * sx) / weight
+            if slope > 0 and intercept >= 0:
+                return intercept, slope
+        # Todas las observaciones con el mismo trabajo: solo se conoce la duración
+        # media. Recta que pasa por ella con el coste inicial, con el fijo acotado
+        # entre 0 y el inicial (si no, se ajusta el coste)
+        mean_units, mean_seconds = sx / weight, sy / weight
+        if mean_units <= 0:
+            return min(self.prior_overhead, mean_seconds), self.prior_unit_seconds
+        overhead = min(max(mean_seconds - self.prior_unit_seconds * mean_units, 0.0), self.prior_overhead)
+        return overhead, max((mean_seconds - overhead) / mean_units, 1e-6)
+
+    def predict(self, units):
+        overhead, unit_seconds = self.coefficients()
+        return overhead + unit_seconds * units
+
+    def summary(self):
+        overhead, unit_seconds = self.coefficients()
+        return f"{overhead:.2f}s + {unit_seconds:.3f}s por step·MP ({self.observations} observaciones)"
+
+
+class Choice:
+    """Parámetros elegidos por la política y la duración prevista."""
+
+    def __init__(self, steps, size, predicted_seconds, within_budget):
+        self.steps = steps
+        self.size = size
+        self.predicted_seconds = predicted_seconds
+        self.within_budget = within_budget
+
+    def __repr__(self):
+        return (
+            f"Choice(steps={self.steps}, size={self.size}, "
+            f"predicted={self.predicted_seconds:.2f}s, within_budget={self.within_budget})"
+        )
+
+
+def choose_parameters(budget, steps, size, model, passes=1, calls=1, allow_resize=True):
+    """
+    Elige steps y tamaño de salida para terminar en `budget` segundos.
+
+    Los candidatos combinan fracciones de los `steps` pedidos (mínimo
+    MIN_STEPS) y, con `allow_resize`, fracciones del área de `size`. La
+    calidad de un candidato se estima como
+    `sqrt(fracción de steps) * sqrt(fracción de área)`; se elige el de
+    mayor calidad cuya duración prevista (`calls` llamadas, p. ej. una por
+    tesela) cabe en el presupuesto, y a igual calidad el más rápido. Si
+    ninguno cabe, el más rápido.
+    """
+    step_options = sorted({max(min(MIN_STEPS, steps), round(steps * fraction)) for fraction in STEP_FRACTIONS}, reverse=True)
+    area_options = AREA_FRACTIONS if allow_resize else (1.0,)
+
+    candidates = []
+    for area in area_options:
+        candidate_size = scale_size(size, area)
+        real_area = candidate_size[0] * candidate_size[1] / (size[0] * size[1])
+        for candidate_steps in step_options:
+            predicted = calls * model.predict(work_units(candidate_steps, candidate_size, passes))
+            quality = math.sqrt(candidate_steps / steps) * math.sqrt(min(real_area, 1.0))
+            candidates.append((quality, -predicted, candidate_steps, candidate_size, predicted))
+
+    fitting = [candidate for candidate in candidates if candidate[4] <= budget]
+    if fitting:
+        _, _, best_steps, best_size, predicted = max(fitting)
+        return Choice(best_steps, best_size, predicted, True)
+    _, _, best_steps, best_size, predicted = min(candidates, key=lambda candidate: candidate[4])
+    return Choice(best_steps, best_size, predicted, False)
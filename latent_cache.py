@@ -0,0 +1,192 @@
+# latent_cache.py
+# Reutilización de la imagen decodificada, el tensor preprocesado y los
+# latentes del VAE para ediciones repetidas sobre la misma imagen
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from prompt_cache import tensor_nbytes
+
+logger = logging.getLogger(__name__)
+
+
+def image_nbytes(image):
+    """Bytes aproximados de una imagen PIL ya decodificada."""
+    return image.size[0] * image.size[1] * len(image.getbands())
+
+
+class LatentSession:
+    """Contadores de una llamada al pipeline (uno o varios trabajos)."""
+
+    def __init__(self, digests):
+        self.digests = list(digests)
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def report(self):
+        lookups = self.hits + self.misses
+        return f"{self.hits}/{lookups} hits, {self.saved_seconds:.2f}s ahorrados"
+
+
+class LatentCache:
+    """
+    Caché LRU acotada por bytes con tres tipos de entrada, todas indexadas por
+    el hash del contenido de la imagen del usuario:
+
+    - "decoded": la imagen PIL decodificada (evita `Image.open` + decode).
+    - "preprocess": el tensor de `image_processor.preprocess` por resolución.
+    - "vae": los latentes de `_encode_vae_image` (el VAE usa `argmax`, así
+      que el resultado es determinista y se puede reutilizar).
+
+    Cada entrada guarda el tiempo que costó calcularla para reportar el
+    tiempo ahorrado en cada acierto.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {"hits": 0, "misses": 0, "saved_seconds": 0.0}
+
+    # --- Almacenamiento ---
+
+    def lookup(self, key):
+        """Devuelve el valor guardado o None, y actualiza los contadores."""
+        session = getattr(self._local, "session", None)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                if session is not None:
+                    session.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            value, seconds, _ = entry
+            self.stats["hits"] += 1
+            self.stats["saved_seconds"] += seconds
+            if session is not None:
+                session.hits += 1
+                session.saved_seconds += seconds
+            return value
+
+    def _count_misses(self, count):
+        session = getattr(self._local, "session", None)
+        with self._lock:
+            self.stats["misses"] += count
+            if session is not None:
+                session.misses += count
+
+    def store(self, key, value, seconds, nbytes):
+        """Guarda un valor junto con el tiempo que costó calcularlo."""
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (value, seconds, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+
+    def summary(self):
+        """Resumen de contadores para la línea de METRICS."""
+        with self._lock:
+            return (
+                f"hits: {self.stats['hits']} | misses: {self.stats['misses']} | "
+                f"{self.stats['saved_seconds']:.1f}s ahorrados | {self._bytes / 1024**2:.1f} MB"
+            )
+
+    # --- Imágenes decodificadas ---
+
+    def decode(self, digest, image_bytes, open_image):
+        """
+        Devuelve `(imagen, hit)` con la imagen decodificada de `image_bytes`,
+        reutilizándola si ya se vio el mismo contenido.
+        """
+        key = ("decoded", digest)
+        image = self.lookup(key)
+        if image is not None:
+            return image, True
+        decode_start = time.time()
+        image = open_image(image_bytes)
+        image.load()
+        self.store(key, image, time.time() - decode_start, image_nbytes(image))
+        return image, False
+
+    # --- Integración con el pipeline ---
+
+    @contextmanager
+    def session(self, digests):
+        """
+        Activa la caché para una llamada al pipeline cuyas imágenes tienen los
+        hashes `digests` (en el orden del lote).
+        """
+        session = LatentSession(digests)
+        self._local.session = session
+        try:
+            yield session
+        finally:
+            self._local.session = None
+
+    def install(self, pipeline):
+        """Envuelve `image_processor.preprocess` y `_encode_vae_image` del pipeline."""
+        preprocess = pipeline.image_processor.preprocess
+        encode_vae_image = pipeline._encode_vae_image
+
+        def cached_preprocess(image, height=None, width=None, *args, **kwargs):
+            images = image if isinstance(image, list) else [image]
+            keys = self._session_keys(len(images), ("preprocess", height, width))
+            if keys is None:
+                return preprocess(image, height, width, *args, **kwargs)
+            return self._cached_batch(keys, lambda: preprocess(image, height, width, *args, **kwargs))
+
+        def cached_encode_vae_image(image, generator):
+            keys = self._session_keys(
+                image.shape[0], ("vae", tuple(image.shape[1:]), str(image.dtype), str(image.device))
+            )
+            if keys is None:
+                return encode_vae_image(image=image, generator=generator)
+            return self._cached_batch(keys, lambda: encode_vae_image(image=image, generator=generator))
+
+        pipeline.image_processor.preprocess = cached_preprocess
+        pipeline._encode_vae_image = cached_encode_vae_image
+        logger.info("Caché de latentes instalada en el pipeline")
+
+    def _session_keys(self, batch_size, suffix):
+        session = getattr(self._local, "session", None)
+        if session is None or len(session.digests) != batch_size:
+            return None
+        return [(suffix[0], digest) + suffix[1:] for digest in session.digests]
+
+    def _cached_batch(self, keys, compute):
+        """Devuelve el lote desde caché si están todos sus elementos; si no, lo calcula."""
+        with self._lock:
+            complete = all(key in self._entries for key in keys)
+        if complete:
+            cached = [self.lookup(key) for key in keys]
+            if all(value is not None for value in cached):
+                if len(cached) == 1:
+                    return cached[0]
+                # Import diferido: torch solo se carga junto con el modelo
+                import torch
+                return torch.cat(cached, dim=0)
+        else:
+            self._count_misses(len(keys))
+
+        compute_start = time.time()
+        result = compute()
+        seconds = (time.time() - compute_start) / len(keys)
+        for i, key in enumerate(keys):
+            value = result[i:i + 1]
+            if len(keys) > 1:
+                # Copia para no retener el tensor del lote completo
+                value = value.clone()
+            self.store(key, value, seconds, tensor_nbytes(value))
+        return result
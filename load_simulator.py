@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Simulador de carga del handler de Qwen-Image-Edit
+
+Ejecuta `rp_handler` en el propio proceso, sin RunPod, con el pipeline real
+o con StubPipeline (sin modelo), y le envía un flujo de trabajos sintético
+o grabado. Las llegadas pueden ser de Poisson o uniformes, a la tasa
+indicada. Los trabajos sintéticos siguen una distribución de tamaños de
+imagen, una popularidad de prompts (Zipf) y una fracción de peticiones
+repetidas. Como RunPod, entrega como mucho QWEN_MAX_CONCURRENCY trabajos a
+la vez al handler que registra rp_handler.
+
+El informe incluye:
+  - throughput y latencia extremo a extremo p50/p95/p99 desde la llegada
+  - espera de admisión (hasta que hay hueco en el handler)
+  - cola de GPU e inferencia (de las etapas del handler)
+  - resultados en caché
+  - evolución en el tiempo de la memoria (RSS y VRAM), de los trabajos en
+    curso y del throughput
+
+La configuración del handler (micro-batching, cachés, handler pipelined,
+pool de workers...) se elige con las mismas variables de entorno QWEN_* del
+despliegue. Así, un cambio de scheduling, caché o codificación se puede
+evaluar offline comparando dos ejecuciones.
+
+  python load_simulator.py --rate 4 --duration 60 --sizes 1024x1024:0.6,640x480:0.3,2048x1536:0.1
+  QWEN_BATCH_ENABLED=1 python load_simulator.py --rate 8 --jobs 200 --repeat 0.2 --output batching.json
+  python load_simulator.py --rate 2 --jobs 50 --record stream.jsonl
+  QWEN_RESULT_CACHE_ENABLED=1 python load_simulator.py --replay stream.jsonl --speed 2
+  python load_simulator.py --pipeline real --rate 0.2 --jobs 10 --steps 8
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark import percentiles, synthetic_request
+from metrics import process_rss_bytes
+
+DEFAULT_PROMPTS = (
+    "Make the sky a sunset",
+    "Replace the background with a white studio backdrop",
+    "Turn the photo into a watercolor painting",
+    "Remove the people in the background",
+    "Change the season to winter with snow",
+    "Make it look like a 90s comic book",
+    "Add soft cinematic lighting",
+    "Change the color of the car to red",
+)
+
+
+def parse_sizes(spec):
+    """'1024x1024:0.6,640x480:0.4' -> [((1024, 1024), 0.6), ((640, 480), 0.4)] (peso 1 por defecto)."""
+    sizes = []
+    for item in spec.split(","):
+        size, _, weight = item.partition(":")
+        width, height = (int(value) for value in size.lower().split("x"))
+        sizes.append(((width, height), float(weight or 1)))
+    return sizes
+
+
+def arrival_times(count, rate, process, rng):
+    """Instantes de llegada (segundos desde el inicio) de `count` trabajos a `rate` por segundo."""
+    times = []
+    now = 0.0
+    for _ in range(count):
+        now += rng.expovariate(rate) if process == "poisson" else 1.0 / rate
+        times.append(now)
+    return times
+
+
+def synthetic_stream(args, rng):
+    """
+    Flujo sintético `[(llegada, input)]`. Cada trabajo repite exactamente uno
+    anterior con probabilidad `--repeat` (reintentos, duplicados); si no,
+    elige tamaño, una imagen del pool de ese tamaño y un prompt con
+    popularidad Zipf.
+    """
+    count = args.jobs or max(1, int(args.rate * args.duration))
+    sizes = parse_sizes(args.sizes)
+    print(f"Generando {args.image_pool} imágenes por tamaño ({len(sizes)} tamaños)...")
+    images = {
+        size: [synthetic_request(*size, seed=index) for index in range(args.image_pool)]
+        for size, _ in sizes
+    }
+    prompts = [DEFAULT_PROMPTS[index % len(DEFAULT_PROMPTS)] + ("" if index < len(DEFAULT_PROMPTS) else f" (v{index})")
+               for index in range(args.prompt_pool)]
+    prompt_weights = [1 / (rank + 1) ** args.prompt_zipf for rank in range(len(prompts))]
+
+    stream = []
+    for arrival in arrival_times(count, args.rate, args.arrivals, rng):
+        if stream and rng.random() < args.repeat:
+            job_input = dict(rng.choice(stream)[1])
+        else:
+            size = rng.choices([size for size, _ in sizes], weights=[weight for _, weight in sizes])[0]
+            job_input = {
+                "prompt": rng.choices(prompts, weights=prompt_weights)[0],
+                "user_image": rng.choice(images[size]),
+                "num_inference_steps": args.steps,
+                "output_format": args.output_format,
+            }
+            if args.budget:
+                job_input["latency_budget"] = args.budget
+        stream.append((arrival, job_input))
+    return stream
+
+
+def load_stream(path, speed, rate, process, rng):
+    """
+    Flujo grabado: JSONL con `{"t": segundos, "input": {...}}` por línea (o
+    solo el input). Sin `t`, las llegadas se generan a `rate`.
+    """
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    inputs = [record.get("input", record) for record in records]
+    if all("t" in record for record in records):
+        times = [record["t"] / speed for record in records]
+    else:
+        times = arrival_times(len(records), rate, process, rng)
+    return list(zip(times, inputs))
+
+
+class StageRecorder:
+    """Recoge las etapas de cada trabajo completado (cola de GPU, inferencia) y el estado de la caché."""
+
+    def __init__(self, rp_handler):
+        self.records = []
+        self._lock = threading.Lock()
+        record_metrics = rp_handler.record_metrics
+
+        def recording(payload, timings, total_time, cache_status):
+            stages = {name: end - start for name, (start, end) in timings.get("stages", {}).items()}
+            with self._lock:
+                self.records.append({"stages": stages, "cache": cache_status})
+            return record_metrics(payload, timings, total_time, cache_status)
+
+        rp_handler.record_metrics = recording
+
+    def stage(self, name):
+        with self._lock:
+            return [record["stages"][name] for record in self.records if name in record["stages"]]
+
+    def cache_statuses(self):
+        """Trabajos por resultado de la caché de resultados (hit-memory, hit-disk, shared, miss)."""
+        with self._lock:
+            return dict(Counter(record["cache"] for record in self.records if record["cache"] is not None))
+
+
+class MemorySampler:
+    """Muestrea RSS, VRAM, trabajos en curso y completados cada `interval` segundos."""
+
+    def __init__(self, rp_handler, interval, state):
+        self.rp_handler = rp_handler
+        self.interval = interval
+        self.state = state
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="memory-sampler", daemon=True)
+
+    def start(self, origin):
+        self.origin = origin
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        vram = None
+        if self.rp_handler.cuda_available():
+            vram = self.rp_handler.torch.cuda.memory_allocated() / 1024**2
+        self.samples.append({
+            "t": round(time.time() - self.origin, 2),
+            "rss_mb": round(process_rss_bytes() / 1024**2, 1),
+            "vram_mb": round(vram, 1) if vram is not None else None,
+            "in_flight": self.state["in_flight"],
+            "completed": self.state["completed"],
+        })
+
+
+async def call_handler(handler, job, executor):
+    """Llama al handler registrado sea cual sea su tipo (síncrono, asíncrono o generador)."""
+    if inspect.isasyncgenfunction(handler):
+        return [event async for event in handler(job)]
+    if inspect.iscoroutinefunction(handler):
+        return await handler(job)
+    return await asyncio.get_running_loop().run_in_executor(executor, handler, job)
+
+
+def job_failed(output):
+    # Los generadores devuelven la lista de eventos; falla si el último es un error
+    if isinstance(output, list):
+        output = output[-1] if output else {"error": "sin salida"}
+    return "error" in output
+
+
+async def run_stream(handler, stream, concurrency, state):
+    """Entrega los trabajos en su instante de llegada con `concurrency` huecos; devuelve un registro por trabajo."""
+    slots = asyncio.Semaphore(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="sim")
+    origin = time.time()
+    results = []
+
+    async def run_job(index, arrival, job_input):
+        await asyncio.sleep(max(0.0, origin + arrival - time.time()))
+        arrived = time.time()
+        async with slots:
+            started = time.time()
+            state["in_flight"] += 1
+            try:
+                output = await call_handler(handler, {"id": f"sim-{index}", "input": job_input}, executor)
+                failed = job_failed(output)
+            except Exception as e:
+                output, failed = {"error": str(e)}, True
+            state["in_flight"] -= 1
+            state["completed"] += 1
+        finished = time.time()
+        results.append({
+            "index": index,
+            "arrival": arrived - origin,
+            "admission_wait": started - arrived,
+            "latency": finished - arrived,
+            "finished": finished - origin,
+            "failed": failed,
+        })
+
+    await asyncio.gather(*(run_job(index, arrival, job_input) for index, (arrival, job_input) in enumerate(stream)))
+    executor.shutdown(wait=False)
+    return results
+
+
+def summarize(results, recorder, sampler, wall_seconds):
+    ok = [result for result in results if not result["failed"]]
+    first_arrival = min(result["arrival"] for result in results)
+    last_finish = max(result["finished"] for result in results)
+    report = {
+        "jobs": len(results),
+        "succeeded": len(ok),
+        "failed": len(results) - len(ok),
+        "wall_seconds": wall_seconds,
+        "throughput_jps": len(ok) / max(last_finish - first_arrival, 1e-9),
+        "latency_ms": percentiles([result["latency"] for result in ok]) if ok else None,
+        "admission_wait_ms": percentiles([result["admission_wait"] for result in results]),
+        "result_cache": recorder.cache_statuses(),
+        "peak_rss_mb": max(sample["rss_mb"] for sample in sampler.samples),
+        "peak_vram_mb": max((sample["vram_mb"] for sample in sampler.samples if sample["vram_mb"] is not None), default=None),
+        "timeline": sampler.samples,
+    }
+    for name in ("queue", "inference", "decode", "encode"):
+        values = recorder.stage(name)
+        report[f"{name}_ms"] = percentiles(values) if values else None
+    return report
+
+
+def print_report(report):
+    def line(label, values):
+        if values is None:
+            return f"{label:<22} n/d"
+        return f"{label:<22} p50={values['p50']:9.1f}ms  p95={values['p95']:9.1f}ms  p99={values['p99']:9.1f}ms"
+
+    print("\n=== RESULTADO DE LA SIMULACIÓN ===")
+    print(f"Trabajos: {report['jobs']} ({report['succeeded']} ok, {report['failed']} fallidos) en {report['wall_seconds']:.1f}s")
+    cache = ", ".join(f"{status}={count}" for status, count in sorted(report["result_cache"].items())) or "desactivada"
+    print(f"Throughput: {report['throughput_jps']:.2f} trabajos/s | Caché de resultados: {cache}")
+    print(line("Latencia total", report["latency_ms"]))
+    print(line("Espera de admisión", report["admission_wait_ms"]))
+    print(line("Cola de GPU", report["queue_ms"]))
+    print(line("Inferencia", report["inference_ms"]))
+    print(line("Decode", report["decode_ms"]))
+    print(line("Encode", report["encode_ms"]))
+    vram = f"{report['peak_vram_mb']:.0f} MB" if report["peak_vram_mb"] is not None else "n/d"
+    print(f"Memoria pico: RSS {report['peak_rss_mb']:.0f} MB | VRAM {vram}")
+
+    print(f"\n{'t (s)':>8} {'RSS (MB)':>9} {'VRAM (MB)':>10} {'en curso':>9} {'trabajos/s':>11}")
+    previous = None
+    step = max(1, -(-len(report["timeline"]) // 20))
+    for sample in report["timeline"][::step]:
+        rate = "-"
+        if previous is not None and sample["t"] > previous["t"]:
+            rate = f"{(sample['completed'] - previous['completed']) / (sample['t'] - previous['t']):.2f}"
+        vram = f"{sample['vram_mb']:.0f}" if sample["vram_mb"] is not None else "-"
+        print(f"{sample['t']:>8.1f} {sample['rss_mb']:>9.0f} {vram:>10} {sample['in_flight']:>9} {rate:>11}")
+        previous = sample
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pipeline", choices=("stub", "real"), default="stub",
+                        help="stub: StubPipeline sin modelo; real: el pipeline que carga rp_handler "
+                             "(con QWEN_WORKERS manda QWEN_WORKER_BACKEND)")
+    parser.add_argument("--step-seconds", type=float, default=0.01, help="Stub: segundos por step y megapíxel")
+    parser.add_argument("--overhead", type=float, default=0.05, help="Stub: segundos fijos por llamada")
+    parser.add_argument("--batch-efficiency", type=float, default=0.6,
+                        help="Stub: coste de cada imagen extra de un lote, en imágenes")
+    parser.add_argument("--rate", type=float, default=2.0, help="Llegadas por segundo")
+    parser.add_argument("--arrivals", choices=("poisson", "uniform"), default="poisson")
+    parser.add_argument("--jobs", type=int, default=0, help="Número de trabajos (por defecto rate x duration)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Segundos de llegadas si no se indica --jobs")
+    parser.add_argument("--sizes", default="1024x1024:0.6,640x480:0.3,1536x1024:0.1",
+                        help="Distribución de tamaños de imagen WxH:peso")
+    parser.add_argument("--image-pool", type=int, default=4, help="Imágenes distintas por tamaño")
+    parser.add_argument("--prompt-pool", type=int, default=8, help="Prompts distintos")
+    parser.add_argument("--prompt-zipf", type=float, default=1.0, help="Exponente de popularidad de los prompts (0 = uniforme)")
+    parser.add_argument("--repeat", type=float, default=0.0, help="Probabilidad de repetir exactamente un trabajo anterior")
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--budget", type=float, help="latency_budget de cada trabajo (segundos)")
+    parser.add_argument("--output-format", default="png")
+    parser.add_argument("--replay", help="Flujo grabado (JSONL) en lugar del sintético")
+    parser.add_argument("--speed", type=float, default=1.0, help="Factor de velocidad de la reproducción")
+    parser.add_argument("--record", help="Guarda el flujo generado (JSONL) para reproducirlo")
+    parser.add_argument("--concurrency", type=int, default=0, help="Trabajos a la vez (por defecto QWEN_MAX_CONCURRENCY)")
+    parser.add_argument("--sample-interval", type=float, default=0.5, help="Segundos entre muestras de memoria")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Archivo JSON con el informe")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    if args.replay:
+        stream = load_stream(args.replay, args.speed, args.rate, args.arrivals, rng)
+    else:
+        stream = synthetic_stream(args, rng)
+    if args.record:
+        with open(args.record, "w") as f:
+            for arrival, job_input in stream:
+                f.write(json.dumps({"t": round(arrival, 4), "input": job_input}) + "\n")
+        print(f"💾 Flujo guardado en {args.record}")
+
+    import rp_handler
+
+    if args.pipeline == "stub" and rp_handler.config.WORKERS == "0":
+        from stub_pipeline import StubPipeline
+        rp_handler.import_runtime()
+        rp_handler.pipeline = StubPipeline(args.step_seconds, args.overhead, args.batch_efficiency)
+    print("Cargando el pipeline...")
+    if not rp_handler.ensure_pipeline():
+        print("❌ No se pudo cargar el pipeline")
+        return False
+
+    handler = rp_handler.select_handler()
+    concurrency = args.concurrency or rp_handler.config.MAX_CONCURRENCY
+    print(
+        f"=== SIMULACIÓN: {len(stream)} trabajos, handler {handler.__name__}, "
+        f"concurrencia {concurrency}, pipeline {args.pipeline} ==="
+    )
+
+    recorder = StageRecorder(rp_handler)
+    state = {"in_flight": 0, "completed": 0}
+    sampler = MemorySampler(rp_handler, args.sample_interval, state)
+    start = time.time()
+    sampler.start(start)
+    results = asyncio.run(run_stream(handler, stream, concurrency, state))
+    sampler.stop()
+
+    report = summarize(results, recorder, sampler, time.time() - start)
+    report["config"] = {key: value for key, value in vars(args).items()}
+    report["config"]["handler"] = handler.__name__
+    report["config"]["concurrency"] = concurrency
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Informe guardado en {args.output}")
+    return report["failed"] == 0
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# placement.py
+# Planificador de la ubicación del pipeline según la memoria disponible:
+# todo en la GPU, offload por modelo, offload secuencial o solo CPU, y el
+# dtype de cada componente
+"""
+Plan de ubicación de Qwen-Image-Edit
+
+  python placement.py
+      Plan para la memoria de esta máquina
+
+  python placement.py --vram-gb 24 --ram-gb 64
+      Plan para otra máquina (cifras de memoria supuestas)
+"""
+
+import argparse
+import os
+import sys
+
+# Estrategias, de la más rápida a la que menos VRAM necesita
+RESIDENT = "resident"                       # pipeline completo en la GPU
+MODEL_OFFLOAD = "model_offload"             # cada componente sube a la GPU mientras se usa
+SEQUENTIAL_OFFLOAD = "sequential_offload"   # sube capa a capa (muy lento, VRAM mínima)
+CPU = "cpu"                                 # sin GPU
+STRATEGIES = (RESIDENT, MODEL_OFFLOAD, SEQUENTIAL_OFFLOAD, CPU)
+
+GB = 1024**3
+
+# Parámetros de cada componente de Qwen-Image-Edit (MMDiT de 20B,
+# Qwen2.5-VL-7B y VAE)
+QWEN_IMAGE_EDIT_PARAMS = {
+    "transformer": 20.4e9,
+    "text_encoder": 8.3e9,
+    "vae": 0.13e9,
+}
+
+DTYPE_BYTES = {"float32": 4, "bfloat16": 2, "float16": 2}
+
+# Memoria de activaciones de una inferencia a ~1 MP en precisión de 16 bits
+# (en float32 se duplica)
+ACTIVATION_BYTES = 4 * GB
+# Mayor bloque que sube a la GPU a la vez con offload secuencial
+SEQUENTIAL_BLOCK_BYTES = 1 * GB
+# Margen que se deja libre (fragmentación del allocator, contexto de CUDA,
+# resto de procesos del host)
+VRAM_HEADROOM = 0.9
+RAM_HEADROOM = 0.85
+
+
+class PlacementPlan:
+    """
+    Estrategia elegida, dtype de cada componente y pico de memoria esperado
+    en bytes (`peak_vram`, `peak_ram`). `fits` es False si ni la opción más
+    modesta cabe en la memoria indicada.
+    """
+
+    def __init__(self, strategy, dtypes, peak_vram, peak_ram, fits=True, reason=""):
+        self.strategy = strategy
+        self.dtypes = dtypes
+        self.peak_vram = peak_vram
+        self.peak_ram = peak_ram
+        self.fits = fits
+        self.reason = reason
+
+    @property
+    def device(self):
+        return "cpu" if self.strategy == CPU else "cuda"
+
+    @property
+    def compute_dtype(self):
+        """dtype con el que corre el pipeline (el del transformer)."""
+        return self.dtypes.get("transformer", next(iter(self.dtypes.values())))
+
+    def as_dict(self):
+        return {
+            "strategy": self.strategy,
+            "device": self.device,
+            "dtypes": dict(self.dtypes),
+            "peak_vram_gb": round(self.peak_vram / GB, 1),
+            "peak_ram_gb": round(self.peak_ram / GB, 1),
+            "fits": self.fits,
+            "reason": self.reason,
+        }
+
+    def describe(self):
+        """Resumen de una línea para el log."""
+        dtypes = ", ".join(f"{name}={dtype}" for name, dtype in self.dtypes.items())
+        return (
+            f"{self.strategy} en {self.device} | {dtypes} | "
+            f"pico esperado: VRAM {self.peak_vram / GB:.1f} GB, RAM {self.peak_ram / GB:.1f} GB"
+            f"{'' if self.fits else ' | NO CABE'} | {self.reason}"
+        )
+
+    def __repr__(self):
+        return f"PlacementPlan({self.describe()})"
+
+
+def _weights(params, dtypes):
+    return {name: count * DTYPE_BYTES[dtypes[name]] for name, count in params.items()}
+
+
+def _uniform(params, dtype):
+    # Todos los componentes con el mismo dtype: QwenImageEditPipeline pasa los
+    # embeddings del text_encoder al transformer y los latentes del
+    # transformer al VAE sin convertirlos
+    return {name: dtype for name in params}
+
+
+def _activations(dtype):
+    return ACTIVATION_BYTES * DTYPE_BYTES[dtype] // 2
+
+
+def plan_placement(vram_bytes, ram_bytes, params=None, bf16_supported=True, dtype=None, strategy=None):
+    """
+    Elige la ubicación del pipeline para una máquina con `vram_bytes` de
+    VRAM libre (0 sin GPU) y `ram_bytes` de RAM disponible. Función pura:
+    no consulta el hardware, así que se puede probar con cifras simuladas.
+
+    - En GPU el dtype es bfloat16 si la GPU lo soporta (float16 si no), y se
+      elige la estrategia más rápida que cabe: resident > model_offload >
+      sequential_offload. Con offload los pesos completos viven en RAM.
+    - Sin GPU, o si no cabe ninguna estrategia de GPU, se usa CPU en
+      float32; si float32 no cabe en la RAM, en bfloat16.
+
+    `params` son los parámetros de cada componente (por defecto los de
+    Qwen-Image-Edit). `dtype` y `strategy` fuerzan una elección concreta;
+    el plan indica igualmente el pico esperado y si cabe.
+    """
+    params = params or QWEN_IMAGE_EDIT_PARAMS
+    vram_budget = vram_bytes * VRAM_HEADROOM
+    ram_budget = ram_bytes * RAM_HEADROOM
+    gpu_dtype = dtype or ("bfloat16" if bf16_supported else "float16")
+
+    def gpu_plan(name):
+        weights = _weights(params, _uniform(params, gpu_dtype))
+        total, largest = sum(weights.values()), max(weights.values())
+        activations = _activations(gpu_dtype)
+        if name == RESIDENT:
+            # Con low_cpu_mem_usage los componentes pasan por RAM de uno en uno
+            peak_vram, peak_ram = total + activations, largest
+        elif name == MODEL_OFFLOAD:
+            peak_vram, peak_ram = largest + activations, total
+        else:
+            peak_vram, peak_ram = SEQUENTIAL_BLOCK_BYTES + activations, total
+        fits = vram_bytes > 0 and peak_vram <= vram_budget and peak_ram <= ram_budget
+        return PlacementPlan(name, _uniform(params, gpu_dtype), peak_vram, peak_ram, fits)
+
+    def cpu_plan(cpu_dtype):
+        weights = sum(_weights(params, _uniform(params, cpu_dtype)).values())
+        peak_ram = weights + _activations(cpu_dtype)
+        return PlacementPlan(CPU, _uniform(params, cpu_dtype), 0, peak_ram, peak_ram <= ram_budget)
+
+    if strategy == CPU:
+        plan = cpu_plan(dtype or "float32")
+        plan.reason = "estrategia forzada"
+        return plan
+    if strategy:
+        plan = gpu_plan(strategy)
+        plan.reason = "estrategia forzada"
+        return plan
+
+    if vram_bytes > 0:
+        for name in (RESIDENT, MODEL_OFFLOAD, SEQUENTIAL_OFFLOAD):
+            plan = gpu_plan(name)
+            if plan.fits:
+                plan.reason = f"cabe en {vram_bytes / GB:.1f} GB de VRAM y {ram_bytes / GB:.1f} GB de RAM"
+                return plan
+
+    for cpu_dtype in ((dtype,) if dtype else ("float32", "bfloat16")):
+        plan = cpu_plan(cpu_dtype)
+        if plan.fits:
+            plan.reason = "sin GPU" if vram_bytes <= 0 else "no cabe en la GPU"
+            return plan
+    plan.reason = f"no cabe en {ram_bytes / GB:.1f} GB de RAM"
+    return plan
+
+
+def available_ram_bytes():
+    """RAM disponible (MemAvailable de /proc/meminfo; RAM libre si no hay /proc)."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+
+def detect_memory():
+    """
+    Memoria de esta máquina: `(vram_libre, ram_disponible, bf16_soportado)`.
+    Sin torch o sin GPU la VRAM es 0.
+    """
+    ram = available_ram_bytes()
+    try:
+        import torch
+    except ImportError:
+        return 0, ram, False
+    if not torch.cuda.is_available():
+        return 0, ram, False
+    free_vram, _ = torch.cuda.mem_get_info(0)
+    return free_vram, ram, torch.cuda.is_bf16_supported()
+
+
+def plan_for_host(dtype=None, strategy=None, params=None):
+    """Plan para la memoria de esta máquina (ver `plan_placement`)."""
+    vram, ram, bf16 = detect_memory()
+    return plan_placement(vram, ram, params=params, bf16_supported=bf16, dtype=dtype, strategy=strategy)
+
+
+def torch_dtypes(plan):
+    """dtypes del plan como objetos de torch, en el formato de `from_pretrained`."""
+    import torch
+
+    return {name: getattr(torch, dtype) for name, dtype in plan.dtypes.items()}
+
+
+def apply_placement(pipeline, plan):
+    """Ubica un pipeline ya cargado según el plan."""
+    if plan.strategy == RESIDENT:
+        pipeline.to("cuda")
+    elif plan.strategy == MODEL_OFFLOAD:
+        # El offload sube cada componente a la GPU solo mientras se usa;
+        # pasar antes todo el pipeline a "cuda" sería una copia inútil
+        pipeline.enable_model_cpu_offload()
+    elif plan.strategy == SEQUENTIAL_OFFLOAD:
+        pipeline.enable_sequential_cpu_offload()
+    else:
+        pipeline.to("cpu")
+    return pipeline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vram-gb", type=float, help="VRAM libre supuesta (0 = sin GPU)")
+    parser.add_argument("--ram-gb", type=float, help="RAM disponible supuesta")
+    parser.add_argument("--no-bf16", action="store_true", help="GPU sin soporte de bfloat16")
+    parser.add_argument("--dtype", choices=sorted(DTYPE_BYTES), help="Forzar dtype")
+    parser.add_argument("--strategy", choices=STRATEGIES, help="Forzar estrategia")
+    args = parser.parse_args(argv)
+
+    if args.vram_gb is None or args.ram_gb is None:
+        vram, ram, bf16 = detect_memory()
+    if args.vram_gb is not None:
+        # GPU supuesta: con bfloat16 salvo --no-bf16
+        vram, bf16 = args.vram_gb * GB, True
+    if args.ram_gb is not None:
+        ram = args.ram_gb * GB
+    bf16 = bf16 and not args.no_bf16
+
+    plan = plan_placement(vram, ram, bf16_supported=bf16, dtype=args.dtype, strategy=args.strategy)
+    print(f"=== PLAN DE UBICACIÓN (VRAM {vram / GB:.1f} GB, RAM {ram / GB:.1f} GB) ===")
+    for key, value in plan.as_dict().items():
+        print(f"{key:<14} {value}")
+    return plan.fits
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,182 @@
+# progress.py
+# Eventos de progreso del denoising, previews baratas a partir de los
+# latentes y cancelación de trabajos en curso
+import asyncio
+import base64
+import logging
+import threading
+import time
+from io import BytesIO
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Proyección lineal latente -> RGB del VAE de Qwen-Image (el de Wan 2.1, 16
+# canales), sobre los latentes normalizados del bucle de denoising. Da una
+# imagen a 1/8 de resolución sin pasar por el decoder del VAE
+LATENT_RGB_FACTORS = [
+    [-0.1299, -0.1692, 0.2932],
+    [0.0671, 0.0406, 0.0442],
+    [0.3568, 0.2548, 0.1747],
+    [0.0372, 0.2344, 0.1420],
+    [0.0313, 0.0189, -0.0328],
+    [0.0296, -0.0956, -0.0665],
+    [-0.3477, -0.4059, -0.2925],
+    [0.0166, 0.1902, 0.1975],
+    [-0.0412, 0.0267, -0.1364],
+    [-0.1293, 0.0740, 0.1636],
+    [0.0680, 0.3019, 0.1128],
+    [0.0032, 0.0581, 0.0639],
+    [-0.1251, 0.0927, 0.1699],
+    [0.0060, -0.0633, 0.0005],
+    [0.3477, 0.2275, 0.2950],
+    [0.1984, 0.0913, 0.1861],
+]
+LATENT_RGB_BIAS = [-0.1835, -0.0868, -0.3360]
+
+
+class JobCancelled(Exception):
+    """El trabajo se canceló antes de terminar el denoising."""
+
+
+def latents_to_images(latents):
+    """
+    Previews RGB de latentes desempaquetados `(lote, 16, [1,] alto, ancho)`
+    con la proyección lineal LATENT_RGB_FACTORS. Devuelve una imagen PIL por
+    elemento del lote.
+    """
+    import torch
+
+    if latents.dim() == 5:
+        latents = latents[:, :, 0]
+    factors = torch.tensor(LATENT_RGB_FACTORS, dtype=torch.float32, device=latents.device)
+    bias = torch.tensor(LATENT_RGB_BIAS, dtype=torch.float32, device=latents.device)
+    rgb = torch.einsum('bchw,cr->bhwr', latents.float(), factors) + bias
+    pixels = ((rgb.clamp(-1, 1) + 1) * 127.5).to(torch.uint8).cpu().numpy()
+    return [Image.fromarray(array, 'RGB') for array in pixels]
+
+
+def encode_preview(image, quality=70):
+    """JPEG en base64 de una preview (unos pocos KB)."""
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+class ProgressStream:
+    """
+    Eventos de un trabajo para el handler generador. El hilo de GPU los
+    emite con `emit` y el handler los consume con `events` en su event loop.
+    `cancel()` marca el trabajo como cancelado: el denoising se detiene en
+    el siguiente paso (ver StepReporter). Con `on_cancel` se avisa además a
+    quien ejecuta el trabajo en otro proceso (el pool de workers).
+    """
+
+    def __init__(self, loop=None):
+        self._loop = loop or asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def emit(self, event):
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
+        except RuntimeError:
+            # Event loop cerrado: ya nadie consume los eventos
+            pass
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback):
+        """Llama a `callback()` al cancelar el trabajo (en el acto si ya está cancelado)."""
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    async def events(self, futures):
+        """
+        Emite los eventos de progreso y el resultado de cada future
+        (concurrent.futures) en cuanto termina, hasta el último.
+        """
+        results = []
+        for future in futures:
+            future.add_done_callback(lambda done: self.emit(_Result(done)))
+        while len(results) < len(futures):
+            event = await self._queue.get()
+            if isinstance(event, _Result):
+                results.append(event)
+                yield event.future.result()
+            else:
+                yield event
+
+
+class _Result:
+    # Marca un future terminado en la cola de eventos
+    def __init__(self, future):
+        self.future = future
+
+
+class StepReporter:
+    """
+    `callback_on_step_end` de una llamada al pipeline. Tras cada paso emite
+    un evento de progreso en el ProgressStream de cada payload que lo tenga
+    (`payload['progress']`) y, cada `preview_interval` pasos, una preview
+    JPEG de sus latentes. Si todos los trabajos de la llamada están
+    cancelados lanza JobCancelled: el pipeline se aborta sin terminar los
+    pasos ni decodificar con el VAE. Con algún trabajo vivo en el lote el
+    denoising sigue y el resultado de los cancelados se descarta.
+    """
+
+    def __init__(self, payloads, size, num_steps, preview_interval=0, preview_quality=70):
+        self.payloads = payloads
+        self.size = size
+        self.num_steps = num_steps
+        self.preview_interval = preview_interval
+        self.preview_quality = preview_quality
+        self.start = time.time()
+
+    def all_cancelled(self):
+        return all(payload.get('progress') is not None and payload['progress'].cancelled for payload in self.payloads)
+
+    def __call__(self, pipe, step, timestep, callback_kwargs):
+        if self.all_cancelled():
+            raise JobCancelled(f"Denoising detenido en el paso {step + 1}/{self.num_steps}")
+
+        done = step + 1
+        previews = None
+        if self.preview_interval and done % self.preview_interval == 0 and done < self.num_steps:
+            width, height = self.size
+            try:
+                latents = pipe._unpack_latents(callback_kwargs['latents'], height, width, pipe.vae_scale_factor)
+                previews = latents_to_images(latents)
+            except Exception as e:
+                # Una preview fallida no debe abortar el denoising
+                logger.warning(f"No se pudo generar la preview del paso {done}: {e}")
+
+        elapsed = time.time() - self.start
+        for index, payload in enumerate(self.payloads):
+            stream = payload.get('progress')
+            if stream is None or stream.cancelled:
+                continue
+            event = {'type': 'progress', 'step': done, 'total': self.num_steps, 'elapsed': round(elapsed, 2)}
+            if payload.get('item_index') is not None:
+                event['index'] = payload['item_index']
+            if 'box' in payload:
+                event['tile'] = list(payload['box'])
+            elif previews is not None:
+                event['preview'] = encode_preview(previews[index], self.preview_quality)
+            stream.emit(event)
+        return {}
@@ -0,0 +1,118 @@
+# prompt_cache.py
+# Memoización de los embeddings del prompt (encoder de texto/visión de Qwen)
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def tensor_nbytes(*tensors):
+    """Bytes ocupados por los tensores (ignora los None)."""
+    return sum(t.element_size() * t.nelement() for t in tensors if t is not None)
+
+
+def stack_prompt_embeds(entries):
+    """
+    Combina los embeddings `(prompt_embeds, prompt_embeds_mask)` de varios
+    trabajos en un solo lote, rellenando con ceros hasta la secuencia más
+    larga. Devuelve la máscara como None si todas las posiciones son válidas,
+    igual que `QwenImageEditPipeline.encode_prompt`.
+    """
+    if len(entries) == 1:
+        return entries[0]
+
+    # Import diferido: torch solo se carga junto con el modelo
+    import torch
+
+    max_len = max(embeds.shape[1] for embeds, _ in entries)
+    padded_embeds = []
+    padded_masks = []
+    for embeds, mask in entries:
+        seq_len = embeds.shape[1]
+        if mask is None:
+            mask = torch.ones(embeds.shape[:2], dtype=torch.long, device=embeds.device)
+        if seq_len < max_len:
+            embeds = torch.cat([embeds, embeds.new_zeros(embeds.shape[0], max_len - seq_len, embeds.shape[2])], dim=1)
+            mask = torch.cat([mask, mask.new_zeros(mask.shape[0], max_len - seq_len)], dim=1)
+        padded_embeds.append(embeds)
+        padded_masks.append(mask)
+
+    prompt_embeds = torch.cat(padded_embeds, dim=0)
+    prompt_embeds_mask = torch.cat(padded_masks, dim=0)
+    if prompt_embeds_mask.all():
+        prompt_embeds_mask = None
+    return prompt_embeds, prompt_embeds_mask
+
+
+def load_preload_list(path):
+    """
+    Lee la lista de prompts a precalcular en `init()`. El archivo es un JSON
+    con una lista de objetos `{"prompt": ..., "image_path": ...}`: el encoder
+    de Qwen-Image-Edit condiciona el prompt a la imagen, así que cada prompt
+    se precalcula junto con su imagen de referencia.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    if not isinstance(entries, list):
+        raise ValueError(f"{path} debe contener una lista de objetos con 'prompt' e 'image_path'")
+    for entry in entries:
+        if not isinstance(entry, dict) or "prompt" not in entry or "image_path" not in entry:
+            raise ValueError(f"Entrada inválida en {path}: {entry!r}")
+    return entries
+
+
+class PromptEmbeddingCache:
+    """
+    Caché LRU de embeddings del prompt acotada por bytes.
+
+    Los valores son tuplas `(prompt_embeds, prompt_embeds_mask)` guardadas en
+    CPU para no ocupar VRAM; el llamador las mueve al dispositivo al usarlas.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get_or_compute(self, key, compute):
+        """Devuelve `(valor, hit)`; calcula y guarda el valor si no está en caché."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return value, True
+
+        value = compute()
+        with self._lock:
+            self.stats["misses"] += 1
+            self._put(key, value)
+        return value, False
+
+    def summary(self):
+        """Resumen de contadores para la línea de METRICS."""
+        with self._lock:
+            return (
+                f"hits: {self.stats['hits']} | misses: {self.stats['misses']} | "
+                f"{len(self._entries)} entradas, {self._bytes / 1024**2:.1f} MB"
+            )
+
+    def _put(self, key, value):
+        size = tensor_nbytes(*value)
+        if size > self.max_bytes:
+            logger.warning(
+                f"Embedding de {size / 1024**2:.1f} MB supera el presupuesto de la caché, no se guarda"
+            )
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= tensor_nbytes(*old)
+        self._entries[key] = value
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= tensor_nbytes(*evicted)
@@ -0,0 +1,124 @@
+# region_edit.py
+# Edición acotada a la región de la máscara: se recorta la zona marcada con
+# algo de contexto, se edita solo ese recorte y se funde sobre el original
+from PIL import Image, ImageFilter
+
+from image_io import nearest_bucket
+
+# Píxeles de la máscara por encima de este valor se consideran zona a editar
+# (blanco = editar, negro = conservar)
+MASK_THRESHOLD = 127
+
+# Área máxima a desruidar (la que usa el pipeline para la imagen completa) y
+# lado mínimo de la salida
+MAX_OUTPUT_PIXELS = 1024 * 1024
+MIN_OUTPUT_SIDE = 256
+
+
+class Region:
+    """
+    Recorte a editar: caja en la imagen original, bucket al que se reescala
+    la imagen de referencia y tamaño de la salida que desruida el pipeline.
+    """
+
+    def __init__(self, box, bucket, output_size):
+        self.box = box
+        self.bucket = bucket
+        self.output_size = output_size
+
+    @property
+    def size(self):
+        return (self.box[2] - self.box[0], self.box[3] - self.box[1])
+
+    def __repr__(self):
+        return f"Region(box={self.box}, bucket={self.bucket}, output_size={self.output_size})"
+
+
+def mask_bbox(mask, threshold=MASK_THRESHOLD):
+    """Caja `(x0, y0, x1, y1)` de la zona marcada en la máscara, o None si está vacía."""
+    return mask.convert('L').point(lambda value: 255 if value > threshold else 0).getbbox()
+
+
+def _fit_span(start, end, length, limit):
+    # Amplía [start, end) hasta `length` centrado, desplazándolo para no salir de [0, limit)
+    length = min(length, limit)
+    center = (start + end) / 2
+    start = int(round(center - length / 2))
+    start = max(0, min(start, limit - length))
+    return start, start + length
+
+
+def output_size_for(size, multiple=32):
+    """
+    Tamaño de salida para un recorte de tamaño `size`: su resolución nativa
+    (sin ampliar por encima de lo que hace falta), limitada a
+    MAX_OUTPUT_PIXELS y redondeada a múltiplos de `multiple`.
+    """
+    width, height = size
+    scale = min(1.0, (MAX_OUTPUT_PIXELS / (width * height)) ** 0.5)
+    return tuple(
+        max(MIN_OUTPUT_SIDE, int(round(side * scale / multiple)) * multiple) for side in (width, height)
+    )
+
+
+def plan_region(image_size, mask, buckets, padding=64, max_area_fraction=0.5):
+    """
+    Decide si la edición se puede acotar a una región de la imagen.
+
+    El pipeline desruida una salida de ~1 MP sea cual sea la imagen; con la
+    región, solo se desruida el recorte a su resolución nativa (ver
+    `output_size_for`), mucho menos en ediciones locales.
+
+    La región es la caja de la máscara ampliada `padding` píxeles de
+    contexto por cada lado y ajustada a la proporción del bucket más cercano
+    (sin salirse de la imagen), para que el reescalado al bucket no deforme
+    el recorte. Devuelve None si la máscara está vacía o si la región supera
+    `max_area_fraction` del área de la imagen: en ese caso compensa más
+    editar la imagen completa.
+    """
+    bbox = mask_bbox(mask)
+    if bbox is None:
+        return None
+
+    width, height = image_size
+    x0, y0, x1, y1 = bbox
+    x0, y0 = max(0, x0 - padding), max(0, y0 - padding)
+    x1, y1 = min(width, x1 + padding), min(height, y1 + padding)
+
+    bucket = nearest_bucket((x1 - x0, y1 - y0), buckets)
+    aspect = bucket[0] / bucket[1]
+    if (x1 - x0) / (y1 - y0) < aspect:
+        x0, x1 = _fit_span(x0, x1, int(round((y1 - y0) * aspect)), width)
+    else:
+        y0, y1 = _fit_span(y0, y1, int(round((x1 - x0) / aspect)), height)
+
+    if (x1 - x0) * (y1 - y0) > max_area_fraction * width * height:
+        return None
+    return Region((x0, y0, x1, y1), bucket, output_size_for((x1 - x0, y1 - y0)))
+
+
+def crop_region(image, region):
+    """
+    Recorta la imagen a la región y la reescala a su bucket. La máscara no se
+    recorta: el pipeline no la recibe y la fusión usa la original.
+    """
+    return image.crop(region.box).resize(region.bucket, Image.LANCZOS)
+
+
+def blend_region(original, edited, mask, region, feather=16):
+    """
+    Funde el recorte editado sobre la imagen original. Solo cambia la zona
+    marcada en la máscara, con un borde difuminado de `feather` píxeles para
+    que no se note la costura.
+    """
+    edited = edited.convert(original.mode).resize(region.size, Image.LANCZOS)
+    alpha = mask.crop(region.box).convert('L').point(lambda value: 255 if value > MASK_THRESHOLD else 0)
+    if feather > 0:
+        # Dilatar antes de difuminar para que el borde suave caiga fuera de la zona editada
+        alpha = alpha.filter(ImageFilter.MaxFilter(2 * (feather // 2) + 1))
+        alpha = alpha.filter(ImageFilter.GaussianBlur(feather / 2))
+
+    result = original.copy()
+    base = original.crop(region.box)
+    result.paste(Image.composite(edited, base, alpha), region.box[:2])
+    return result
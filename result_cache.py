@@ -0,0 +1,211 @@
+# result_cache.py
+# Caché de resultados direccionada por contenido para peticiones idénticas
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+def digest_bytes(data):
+    """Hash SHA-256 (hex) del contenido de una imagen decodificada."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_cache_key(user_image_digest, mask_image_digest, prompt, params):
+    """
+    Clave de caché de una petición: hash de los bytes decodificados de la
+    imagen y la máscara (ver `digest_bytes`), el prompt y los parámetros de
+    inferencia.
+    """
+    h = hashlib.sha256()
+    h.update(user_image_digest.encode())
+    h.update(b"|")
+    h.update(mask_image_digest.encode() if mask_image_digest else b"-")
+    h.update(b"|")
+    h.update(prompt.encode("utf-8"))
+    h.update(b"|")
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Caché de resultados en dos niveles:
+
+    - Memoria: LRU acotada por bytes.
+    - Disco (opcional): un archivo por entrada, con desalojo del menos
+      usado recientemente cuando se supera el tamaño máximo.
+
+    Las peticiones idénticas en vuelo comparten un único cómputo
+    (single-flight). Los valores son cadenas (la salida de la petición
+    serializada como JSON).
+    """
+
+    def __init__(self, max_memory_bytes, disk_dir=None, max_disk_bytes=0):
+        self.max_memory_bytes = int(max_memory_bytes)
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = int(max_disk_bytes)
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits_memory": 0, "hits_disk": 0, "shared": 0, "misses": 0, "errors": 0}
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            for name in os.listdir(self.disk_dir):
+                if name.endswith(".b64"):
+                    self._disk_bytes += os.path.getsize(os.path.join(self.disk_dir, name))
+            logger.info(
+                f"Caché de resultados en disco: {self.disk_dir} "
+                f"({self._disk_bytes / 1024**2:.1f} MB en uso)"
+            )
+
+    def get_or_compute(self, key, compute):
+        """
+        Devuelve `(valor, estado)` donde estado es "hit-memory", "hit-disk",
+        "shared" (otra petición idéntica lo estaba calculando) o "miss".
+        Los errores de `compute` se propagan y no se guardan en caché.
+        """
+        with self._lock:
+            value = self._memory_get(key)
+            if value is not None:
+                self.stats["hits_memory"] += 1
+                return value, "hit-memory"
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats["shared"] += 1
+                owner = False
+            else:
+                future = Future()
+                self._inflight[key] = future
+                owner = True
+
+        if not owner:
+            return future.result(), "shared"
+
+        try:
+            value = self._disk_get(key)
+            status = "hit-disk"
+            if value is None:
+                value = compute()
+                status = "miss"
+                self._disk_put(key, value)
+            with self._lock:
+                self._memory_put(key, value)
+                self.stats["hits_disk" if status == "hit-disk" else "misses"] += 1
+            future.set_result(value)
+            return value, status
+        except BaseException as e:
+            with self._lock:
+                self.stats["errors"] += 1
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def summary(self):
+        """Resumen de contadores para la línea de METRICS."""
+        with self._lock:
+            hits = self.stats["hits_memory"] + self.stats["hits_disk"] + self.stats["shared"]
+            return (
+                f"hits: {hits} (mem: {self.stats['hits_memory']}, disk: {self.stats['hits_disk']}, "
+                f"shared: {self.stats['shared']}) | misses: {self.stats['misses']}"
+            )
+
+    # --- Nivel en memoria (llamar con el lock tomado) ---
+
+    def _memory_get(self, key):
+        value = self._memory.get(key)
+        if value is not None:
+            self._memory.move_to_end(key)
+        return value
+
+    def _memory_put(self, key, value):
+        size = len(value)
+        if size > self.max_memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = value
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    # --- Nivel en disco ---
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.b64")
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="ascii") as f:
+                value = f.read()
+            # Actualizar mtime para que el desalojo sea LRU
+            os.utime(path)
+            return value
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"No se pudo leer la caché en disco ({path}): {e}")
+            return None
+
+    def _disk_put(self, key, value):
+        if not self.disk_dir or len(value) > self.max_disk_bytes:
+            return
+        path = self._disk_path(key)
+        try:
+            # Escritura atómica para no dejar entradas truncadas
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="ascii") as f:
+                f.write(value)
+            # Si la clave ya estaba en disco (otro proceso o una entrada que no
+            # se pudo leer), os.replace la sustituye: su tamaño deja de contar
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"No se pudo escribir la caché en disco ({path}): {e}")
+            return
+        with self._lock:
+            self._disk_bytes += len(value) - replaced
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def _evict_disk(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".b64"):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._disk_bytes = total
@@ -1,28 +1,82 @@
 # rp_handler.py
 # Qwen-Image-Edit RunPod Serverless Handler
 # Updated: October 12, 2025 - Using official QwenImageEditPipeline
+import time
+_process_start = time.time()
+
 import runpod
-import torch
-from diffusers import QwenImageEditPipeline
 from runpod.serverless.utils.rp_validator import validate
 from PIL import Image
-import base64
+import asyncio
+import atexit
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from io import BytesIO
 import logging
-import time
+import logging.handlers
+import queue
+import threading
 import traceback
 
+import config
+from batching import MicroBatcher
+from compilation import compile_transformer, configure_cache
+from cpu_quant import configure_threads, quantize_pipeline
+from fast_start import StartupProfiler, load_pipeline_fast
+from inference_policy import LatencyModel, check_inference_options, choose_parameters, round_size, work_units
+from image_io import (
+    InputImageError, build_output, check_output_options, decode_base64_image,
+    open_input_image, parse_buckets, resolution_bucket, snap_to_bucket, DEFAULT_RESOLUTION_BUCKETS
+)
+from latent_cache import LatentCache
+from metrics import Registry, process_rss_bytes, start_http_server
+from placement import apply_placement, plan_for_host, torch_dtypes
+from progress import JobCancelled, ProgressStream, StepReporter
+from prompt_cache import PromptEmbeddingCache, load_preload_list, stack_prompt_embeds
+from region_edit import blend_region, crop_region, plan_region
+from result_cache import ResultCache, digest_bytes, make_cache_key
+from stage_timing import GpuTimeline, stage
+from step_cache import StepCache
+from tiling import TileBlender, plan_tiles
+from worker_pool import WorkerError, WorkerPool, resolve_devices
+
+# Tiempos del arranque (imports, carga de pesos, calentamiento...), línea STARTUP
+startup_profiler = StartupProfiler(origin=_process_start)
+startup_profiler.record('imports', _process_start, time.time())
+
+# torch y diffusers se importan en init() (ver import_runtime): tardan varios
+# segundos y no hacen falta hasta cargar el modelo
+torch = None
+
 # Configurar logging detallado para RunPod
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('qwen_image_edit.log')
-    ]
+# Los hilos del handler solo encolan los registros; la escritura a consola y
+# a archivo la hace el hilo del QueueListener, fuera del camino del trabajo
+_log_queue = queue.SimpleQueue()
+_log_formatter = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
 )
+_log_handlers = [logging.StreamHandler()]
+if config.LOG_FILE:
+    _log_handlers.append(logging.FileHandler(config.LOG_FILE))
+for _log_handler in _log_handlers:
+    _log_handler.setFormatter(_log_formatter)
+_log_listener = logging.handlers.QueueListener(_log_queue, *_log_handlers, respect_handler_level=True)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+# force: `import runpod` ya instala un handler en el logger raíz y sin él
+# basicConfig no haría nada (ni siquiera se escribía el archivo de log)
+_queue_handler = logging.handlers.QueueHandler(_log_queue)
+# El formato completo lo aplican los handlers del listener
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=config.LOG_LEVEL, handlers=[_queue_handler], force=True)
 logger = logging.getLogger(__name__)
 
+# Log detallado de cada trabajo: con QWEN_VERBOSE_LOGS desactivado no se
+# formatea ni se encola (los mensajes usan argumentos %s diferidos)
+request_logger = logging.getLogger(f"{__name__}.request")
+request_logger.setLevel(logging.INFO if config.VERBOSE_LOGS else logging.WARNING)
+
 # Configurar logging específico para RunPod
 runpod_logger = logging.getLogger('runpod')
 runpod_logger.setLevel(logging.INFO)
@@ -31,15 +85,219 @@ runpod_logger.setLevel(logging.INFO)
 metrics_logger = logging.getLogger('metrics')
 metrics_logger.setLevel(logging.INFO)
 
+# Métricas estructuradas (expuestas por HTTP con QWEN_METRICS_PORT)
+metrics_registry = Registry()
+REQUESTS = metrics_registry.counter("qwen_requests_total", "Trabajos procesados por resultado")
+REQUEST_LATENCY = metrics_registry.histogram("qwen_request_latency_seconds", "Latencia total de cada trabajo")
+QUEUE_TIME = metrics_registry.histogram("qwen_queue_seconds", "Espera en la cola de GPU antes de la inferencia")
+STAGE_TIME = metrics_registry.histogram("qwen_stage_seconds", "Duración de cada etapa del trabajo")
+CACHE_EVENTS = metrics_registry.counter("qwen_cache_events_total", "Accesos a las cachés por resultado")
+VRAM_BYTES = metrics_registry.gauge("qwen_vram_bytes", "VRAM asignada y reservada por PyTorch")
+RSS_BYTES = metrics_registry.gauge("qwen_rss_bytes", "Memoria residente del proceso")
+COMPILED_GRAPHS = metrics_registry.gauge("qwen_compiled_graphs", "Formas compiladas y recompilaciones del transformer")
+
 # Esquema de validación para las entradas de la API
 INPUT_SCHEMA = {
-    'prompt': {'type': str, 'required': True},
-    'user_image': {'type': str, 'required': True}, # Imagen del usuario en base64
-    'mask_image': {'type': str, 'required': False} # Máscara opcional en base64
+    # Obligatorios salvo en trabajos con items (ver expand_items)
+    'prompt': {'type': str, 'required': False, 'default': None},
+    'user_image': {'type': str, 'required': False, 'default': None}, # Imagen del usuario en base64
+    'mask_image': {'type': str, 'required': False, 'default': None}, # Máscara opcional en base64
+    # Parámetros de inferencia (los rangos se validan en inference_policy.check_inference_options)
+    'num_inference_steps': {'type': int, 'required': False, 'default': None}, # Por defecto NUM_INFERENCE_STEPS
+    'guidance_scale': {'type': float, 'required': False, 'default': None}, # Por defecto GUIDANCE_SCALE
+    'true_cfg_scale': {'type': float, 'required': False, 'default': None}, # CFG real (> 1, con negative_prompt)
+    'negative_prompt': {'type': str, 'required': False, 'default': None},
+    'seed': {'type': int, 'required': False, 'default': None}, # Sin semilla: aleatoria (se devuelve en la respuesta)
+    'width': {'type': int, 'required': False, 'default': None}, # Tamaño de salida; por defecto ~1 MP
+    'height': {'type': int, 'required': False, 'default': None},
+    'latency_budget': {'type': float, 'required': False, 'default': None}, # Segundos; adapta steps y resolución
+    # Opciones de salida (los rangos se validan en image_io.check_output_options)
+    'output_format': {'type': str, 'required': False, 'default': 'png'}, # png, jpeg, webp o raw
+    'output_quality': {'type': int, 'required': False, 'default': 90}, # JPEG/WebP, 1-100
+    'png_compress_level': {'type': int, 'required': False, 'default': config.PNG_COMPRESS_LEVEL}, # 0-9
+    'output_mode': {'type': str, 'required': False, 'default': 'base64'}, # 'path' escribe en QWEN_OUTPUT_DIR
+    # Varios elementos en un trabajo: lista de objetos con los campos anteriores.
+    # Los campos del nivel superior son los valores por defecto de cada elemento
+    'items': {'type': list, 'required': False, 'default': None}
 }
 
+# Buckets de resolución a los que se ajustan las imágenes de entrada (QWEN_SNAP_TO_BUCKETS)
+RESOLUTION_BUCKETS = parse_buckets(config.RESOLUTION_BUCKETS) if config.RESOLUTION_BUCKETS else DEFAULT_RESOLUTION_BUCKETS
+
+# Parámetros de inferencia
+GUIDANCE_SCALE = 7.5
+NUM_INFERENCE_STEPS = 20
+# Default de true_cfg_scale en QwenImageEditPipeline: con negative_prompt hay CFG real
+PIPELINE_TRUE_CFG_SCALE = 4.0
+
 # Variable global para mantener el modelo cargado
 pipeline = None
+# Plan de ubicación del pipeline (estrategia y dtypes), decidido en init()
+placement_plan = None
+# Transformer compilado (solo si QWEN_COMPILE)
+compiled_denoiser = None
+# Reentrante: init() se ejecuta con el lock tomado y crea las cachés (que también lo toman)
+_init_lock = threading.RLock()
+# Hilo único que ejecuta el pipeline cuando no hay micro-batching
+_gpu_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gpu")
+# Pool para las etapas de CPU (decode/encode) del handler pipelined
+_cpu_executor = ThreadPoolExecutor(max_workers=config.CPU_WORKERS, thread_name_prefix="cpu")
+# Elementos de los trabajos con items en proceso a la vez
+_item_executor = ThreadPoolExecutor(max_workers=config.ITEMS_CONCURRENCY, thread_name_prefix="item")
+# Intervalos de uso de la GPU, para medir el solape de las etapas de CPU
+gpu_timeline = GpuTimeline()
+
+# Micro-batcher compartido por los trabajos concurrentes (solo si QWEN_BATCH_ENABLED)
+batcher = None
+
+# Pool de procesos con un pipeline por dispositivo (solo si QWEN_WORKERS); el
+# pipeline de este proceso no se carga
+worker_pool = None
+
+# Caché de resultados (solo si QWEN_RESULT_CACHE_ENABLED)
+result_cache = None
+
+# Caché de embeddings del prompt (solo si QWEN_PROMPT_CACHE_ENABLED)
+prompt_cache = None
+
+# Caché de imágenes decodificadas y latentes del VAE (solo si QWEN_LATENT_CACHE_ENABLED)
+latent_cache = None
+
+# Caché de pasos de denoising (solo si QWEN_STEP_CACHE_ENABLED)
+step_cache = None
+
+# Duración del pipeline observada en este worker, para la política de latency_budget
+latency_model = LatencyModel(
+    prior_overhead=config.POLICY_PRIOR_OVERHEAD,
+    prior_unit_seconds=config.POLICY_PRIOR_STEP_SECONDS
+)
+
+
+def import_runtime():
+    """Importa torch (diferido hasta la carga del modelo)."""
+    global torch
+    if torch is None:
+        if config.COMPILE:
+            # Inductor lee la ubicación de su caché al importarse
+            configure_cache(config.COMPILE_CACHE_DIR)
+        with startup_profiler.phase('imports:torch'):
+            import torch as torch_module
+        torch = torch_module
+        if config.TORCH_THREADS or config.TORCH_INTEROP_THREADS:
+            # Antes de cualquier operación: los hilos inter-op no se pueden cambiar después
+            threads = configure_threads(config.TORCH_THREADS, config.TORCH_INTEROP_THREADS)
+            logger.info(f"Hilos de torch: {threads[0]} intra-op, {threads[1]} inter-op")
+    return torch
+
+
+def cuda_available():
+    """True si hay GPU; False también si torch aún no se ha importado."""
+    return torch is not None and torch.cuda.is_available()
+
+
+def plan_pipeline():
+    """Decide la ubicación y los dtypes del pipeline (QWEN_PLACEMENT, QWEN_DTYPE)."""
+    plan = plan_for_host(
+        dtype=None if config.DTYPE == "auto" else config.DTYPE,
+        strategy=None if config.PLACEMENT == "auto" else config.PLACEMENT
+    )
+    if plan.device == "cpu" and config.CPU_QUANTIZE and plan.compute_dtype != "float32":
+        # La cuantización int8 parte de los pesos en float32
+        plan = plan_for_host(dtype="float32", strategy=plan.strategy)
+        plan.reason = f"float32 para cuantizar a {config.CPU_QUANTIZE}"
+    logger.info(f"Plan de ubicación: {plan.describe()}")
+    if not plan.fits:
+        logger.warning("El modelo no cabe en la memoria disponible según el plan; se intenta igualmente")
+    return plan
+
+
+def load_pipeline(plan):
+    """
+    Carga el pipeline desde QWEN_MODEL_PATH (snapshot local) o desde el Hub,
+    con los dtypes del plan. Con QWEN_FAST_START y un snapshot local, los
+    componentes se cargan en paralelo.
+    """
+    with startup_profiler.phase('imports:diffusers'):
+        from diffusers import QwenImageEditPipeline
+
+    model = config.MODEL_PATH or config.MODEL_ID
+    if config.FAST_START and config.MODEL_PATH:
+        logger.info(f"Carga rápida desde {model} ({config.LOAD_WORKERS} hilos)")
+        return load_pipeline_fast(
+            model,
+            pipeline_class=QwenImageEditPipeline,
+            torch_dtype=torch_dtypes(plan),
+            profiler=startup_profiler,
+            max_workers=config.LOAD_WORKERS
+        )
+
+    with startup_profiler.phase('weights'):
+        return QwenImageEditPipeline.from_pretrained(
+            model,
+            torch_dtype=torch_dtypes(plan),
+            low_cpu_mem_usage=True,
+            use_safetensors=True,
+            local_files_only=config.MODEL_PATH is not None
+        )
+
+
+def place_pipeline(pipeline, plan):
+    """Ubica el pipeline según el plan y aplica las optimizaciones."""
+    with startup_profiler.phase('device'):
+        apply_placement(pipeline, plan)
+
+    if plan.device == "cpu" and config.CPU_QUANTIZE:
+        with startup_profiler.phase('quantize'):
+            quantized = quantize_pipeline(pipeline, config.CPU_QUANTIZE)
+        logger.info(f"Capas lineales cuantizadas ({config.CPU_QUANTIZE}): {quantized}")
+
+    with startup_profiler.phase('optimizations'):
+        if plan.device == "cuda":
+            try:
+                pipeline.enable_xformers_memory_efficient_attention()
+            except Exception as e:
+                logger.warning(f"Atención eficiente de xformers no disponible: {e}")
+        if config.TILED_VAE:
+            # Encode/decode del VAE por teselas: menos VRAM pico en imágenes grandes
+            pipeline.vae.enable_tiling()
+            logger.info("VAE por teselas habilitado")
+
+
+def warmup_pipeline(sizes=((1024, 1024),)):
+    """
+    Inferencia de 1 step por cada tamaño de `sizes` para inicializar kernels
+    y asignaciones de CUDA (y compilar el transformer en modo compilado).
+    """
+    with startup_profiler.phase('warmup'):
+        for size in sizes:
+            warmup_image = Image.new('RGB', size, (128, 128, 128))
+            _call_pipeline([{
+                'prompt': 'warmup',
+                'user_image': warmup_image,
+                'image_digest': f'warmup@{size[0]}x{size[1]}',
+                'params': {'guidance_scale': GUIDANCE_SCALE, 'num_inference_steps': 1}
+            }])
+
+
+def compile_pipeline(loaded):
+    """
+    Compila el transformer y lo calienta en cada bucket de QWEN_COMPILE_BUCKETS
+    para que ningún trabajo pague la compilación. Si la compilación falla,
+    se vuelve al modo eager.
+    """
+    global compiled_denoiser
+    buckets = parse_buckets(config.COMPILE_BUCKETS) if config.COMPILE_BUCKETS else RESOLUTION_BUCKETS
+    logger.info(f"Compilando el transformer para {len(buckets)} buckets (caché en {config.COMPILE_CACHE_DIR})...")
+    compiled_denoiser = compile_transformer(loaded, config.COMPILE_MODE)
+    try:
+        warmup_pipeline(buckets)
+    except Exception as e:
+        logger.error(f"Fallo al compilar el transformer, se usa el modo eager: {type(e).__name__}: {e}")
+        compiled_denoiser.restore()
+        compiled_denoiser = None
+        return
+    logger.info(f"Transformer compilado: {compiled_denoiser.stats()}")
+
 
 def init():
     """
@@ -49,9 +307,11 @@ def init():
     logger.info("=== INICIANDO CARGA DEL MODELO ===")
     start_time = time.time()
     
-    global pipeline
+    global pipeline, placement_plan
     
     try:
+        import_runtime()
+
         # Log de información del sistema
         logger.info("=== INFORMACIÓN DEL SISTEMA ===")
         logger.info(f"PyTorch version: {torch.__version__}")
@@ -67,28 +327,30 @@ def init():
         logger.info("Caché de CUDA limpiado exitosamente")
 
         logger.info("=== INICIANDO CARGA DEL PIPELINE ===")
-        logger.info("Modelo: Qwen-Image-Edit (20B MMDiT)")
-        logger.info("Tipo de datos: torch.float16")
-        logger.info("Dispositivo: CUDA")
-        logger.info("Optimizaciones: memory_efficient_attention, model_cpu_offload")
+        logger.info(f"Modelo: Qwen-Image-Edit (20B MMDiT) desde {config.MODEL_PATH or config.MODEL_ID}")
+        placement_plan = plan_pipeline()
+        logger.info(f"Tipo de datos: torch.{placement_plan.compute_dtype}")
+        logger.info(f"Dispositivo: {placement_plan.device.upper()} ({placement_plan.strategy})")
         
         # Cargar el pipeline oficial de Qwen-Image-Edit
-        pipeline = QwenImageEditPipeline.from_pretrained(
-            "Qwen/Qwen-Image-Edit",
-            torch_dtype=torch.float16,
-            low_cpu_mem_usage=True,
-            use_safetensors=True
-        ).to("cuda")
+        loaded = load_pipeline(placement_plan)
         
         # Habilitar optimizaciones de memoria
         logger.info("Aplicando optimizaciones de memoria...")
-        pipeline.enable_memory_efficient_attention()
-        pipeline.enable_model_cpu_offload()
+        place_pipeline(loaded, placement_plan)
         logger.info("Optimizaciones aplicadas exitosamente")
+        pipeline = loaded
+
+        if config.COMPILE:
+            compile_pipeline(loaded)
+        elif config.WARMUP:
+            logger.info("Ejecutando inferencia de calentamiento...")
+            warmup_pipeline()
 
         load_time = time.time() - start_time
         logger.info(f"=== CARGA COMPLETADA ===")
         logger.info(f"Tiempo total de carga: {load_time:.2f} segundos")
+        metrics_logger.info(f"STARTUP: {startup_profiler.report()}")
         
         # Log de memoria después de la carga
         if torch.cuda.is_available():
@@ -96,6 +358,9 @@ def init():
             logger.info(f"VRAM reservada: {torch.cuda.memory_reserved(0) / 1024**3:.1f} GB")
             logger.info(f"VRAM libre restante: {(torch.cuda.get_device_properties(0).total_memory - torch.cuda.memory_allocated(0)) / 1024**3:.1f} GB")
         
+        if config.PROMPT_CACHE_ENABLED and config.PROMPT_CACHE_PRELOAD:
+            preload_prompt_cache()
+
         logger.info("Pipeline inicializado y listo para procesar imágenes")
         logger.info("=== CARGA DEL MODELO COMPLETADA EXITOSAMENTE ===")
         
@@ -110,7 +375,7 @@ def init():
         logger.error(f"Traceback completo: {traceback.format_exc()}")
         
         # Log de memoria en caso de error
-        if torch.cuda.is_available():
+        if cuda_available():
             logger.error(f"VRAM disponible en el momento del error: {(torch.cuda.get_device_properties(0).total_memory - torch.cuda.memory_allocated(0)) / 1024**3:.1f} GB")
         
         logger.error("=== FALLO EN CARGA DEL MODELO ===")
@@ -118,137 +383,1154 @@ def init():
         return None
 
 
-def handler(job):
+def run_pipeline(payloads):
     """
-    Esta función se ejecuta por cada llamada a la API.
-    Procesa la entrada y devuelve la imagen generada.
+    Ejecuta el pipeline para uno o varios trabajos del mismo bucket y
+    devuelve las imágenes resultantes en el mismo orden.
     """
-    request_id = f"req_{int(time.time() * 1000)}"
-    logger.info(f"=== INICIANDO PROCESAMIENTO DE TRABAJO [{request_id}] ===")
-    start_time = time.time()
-    
-    try:
-        # Log de información del job
-        logger.info(f"Job ID: {job.get('id', 'N/A')}")
-        logger.info(f"Request ID: {request_id}")
-        logger.info(f"Timestamp: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        global pipeline
+    if all(payload.get('progress') is not None and payload['progress'].cancelled for payload in payloads):
+        raise JobCancelled("Trabajo cancelado antes de la inferencia")
+    if cuda_available():
+        torch.cuda.reset_peak_memory_stats()
+    gpu_start = time.time()
+    with gpu_timeline.busy(), step_cache_session(payloads) as steps:
+        if not config.LATENT_CACHE_ENABLED:
+            images = _call_pipeline(payloads)
+        else:
+            # Reutiliza el preprocesado y los latentes del VAE de imágenes ya vistas
+            with get_latent_cache().session([payload['image_digest'] for payload in payloads]) as session:
+                images = _call_pipeline(payloads)
+            for payload in payloads:
+                payload['latent_cache'] = session.report()
+                payload['latent_cache_counts'] = (session.hits, session.misses)
+    if steps is not None:
+        for payload in payloads:
+            payload['step_cache'] = steps.report()
+            payload['step_cache_counts'] = (steps.skipped, steps.calls)
+    gpu_end = time.time()
+    latency_model.observe(sum(payload_work_units(payload) for payload in payloads), gpu_end - gpu_start)
+    peak_vram = torch.cuda.max_memory_allocated() if cuda_available() else None
+    for payload in payloads:
+        payload['gpu_interval'] = (gpu_start, gpu_end)
+        payload['peak_vram'] = peak_vram
+    return images
+
+
+def generation_size(payload):
+    """Tamaño que genera el pipeline para un payload: el pedido o el bucket de ~1 MP de la imagen."""
+    return payload.get('output_size') or resolution_bucket(payload['user_image'].size)
+
+
+def cfg_passes(params):
+    """
+    Llamadas al transformer por step: dos con CFG real (prompt y prompt
+    negativo). Sin true_cfg_scale el pipeline usa su default.
+    """
+    true_cfg = params.get('true_cfg_scale')
+    if true_cfg is None:
+        true_cfg = PIPELINE_TRUE_CFG_SCALE
+    return 2 if true_cfg > 1 and params.get('negative_prompt') else 1
+
+
+def payload_work_units(payload):
+    """Trabajo de un payload para el modelo de latencia (steps x MP x pasadas)."""
+    params = payload['params']
+    return work_units(params['num_inference_steps'], generation_size(payload), cfg_passes(params))
+
+
+def _call_pipeline(payloads):
+    return pipeline(**pipeline_arguments(payloads)).images
+
+
+def pipeline_arguments(payloads):
+    """
+    Argumentos de `QwenImageEditPipeline.__call__` para una llamada con
+    `payloads` (un lote si hay más de uno). Deben existir en su firma: el
+    pipeline no acepta argumentos desconocidos.
+    """
+    params = payloads[0]['params']
+    prompt_kwargs = prompt_inputs(payloads)
+    # Tamaño de la salida: por defecto el pipeline lo deriva de la imagen (~1 MP)
+    output_size = payloads[0].get('output_size')
+    if output_size is not None:
+        prompt_kwargs['width'], prompt_kwargs['height'] = output_size
+    # guidance_scale no tiene efecto en Qwen-Image-Edit (no está destilado con
+    # guidance); el CFG real usa true_cfg_scale y negative_prompt
+    if params.get('true_cfg_scale') is not None:
+        prompt_kwargs['true_cfg_scale'] = params['true_cfg_scale']
+    if params.get('negative_prompt') is not None:
+        negative_prompts = [params['negative_prompt']] * len(payloads)
+        prompt_kwargs['negative_prompt'] = negative_prompts[0] if len(payloads) == 1 else negative_prompts
+    generators = payload_generators(payloads)
+    if any(payload.get('progress') is not None for payload in payloads):
+        # Tamaño que usa el pipeline para desempaquetar los latentes (múltiplo de 16)
+        width, height = (side // 16 * 16 for side in generation_size(payloads[0]))
+        prompt_kwargs['callback_on_step_end'] = StepReporter(
+            payloads, (width, height), params['num_inference_steps'],
+            preview_interval=config.PREVIEW_INTERVAL, preview_quality=config.PREVIEW_QUALITY
+        )
+        prompt_kwargs['callback_on_step_end_tensor_inputs'] = ['latents']
+    if len(payloads) == 1:
+        payload = payloads[0]
+        return dict(
+            image=payload['user_image'],
+            guidance_scale=params['guidance_scale'],
+            num_inference_steps=params['num_inference_steps'],
+            generator=generators[0] if generators else None,
+            **prompt_kwargs
+        )
+    # Con una lista el pipeline no reescala las imágenes: se pasan ya en su
+    # bucket, como las ve en una llamada suelta (y el text encoder en encode_prompt)
+    return dict(
+        image=[resize_to_bucket(payload['user_image']) for payload in payloads],
+        guidance_scale=params['guidance_scale'],
+        num_inference_steps=params['num_inference_steps'],
+        generator=generators,
+        **prompt_kwargs
+    )
+
+
+def payload_generators(payloads):
+    """
+    Un generador por payload con su semilla. Los payloads sin semilla reciben
+    una aleatoria, que se guarda en `payload['seed']` para devolverla.
+    """
+    generators = []
+    for payload in payloads:
+        generator = torch.Generator('cpu')
+        if payload.get('seed') is None:
+            payload['seed'] = generator.seed()
+        else:
+            generator.manual_seed(payload['seed'])
+        generators.append(generator)
+    return generators
+
+
+def prompt_inputs(payloads):
+    """
+    Argumentos de prompt para el pipeline: el texto, o los embeddings
+    precomputados si la caché de prompts está habilitada.
+    """
+    if not config.PROMPT_CACHE_ENABLED:
+        prompts = [payload['prompt'] for payload in payloads]
+        return {'prompt': prompts[0] if len(prompts) == 1 else prompts}
+
+    cache = get_prompt_cache()
+    entries = []
+    for payload in payloads:
+        entry, hit = cache.get_or_compute(
+            prompt_cache_key(payload['prompt'], payload['image_digest'], payload['user_image'].size),
+            lambda: encode_prompt(payload['prompt'], payload['user_image'])
+        )
+        payload['prompt_cache'] = 'hit' if hit else 'miss'
+        entries.append(entry)
+
+    prompt_embeds, prompt_embeds_mask = stack_prompt_embeds(entries)
+    device = pipeline._execution_device
+    return {
+        'prompt_embeds': prompt_embeds.to(device),
+        'prompt_embeds_mask': prompt_embeds_mask.to(device) if prompt_embeds_mask is not None else None
+    }
+
+
+def prompt_cache_key(prompt, image_digest, image_size):
+    """
+    Clave de la caché de prompts. El encoder de Qwen-Image-Edit (Qwen2.5-VL)
+    ve también la imagen, así que el embedding depende del prompt y de la
+    imagen reescalada a su bucket.
+    """
+    return (prompt, image_digest, resolution_bucket(image_size))
+
+
+def encode_prompt(prompt, image):
+    """
+    Calcula los embeddings del prompt igual que `pipeline(...)`: con la
+    imagen reescalada a su bucket. Devuelve los tensores en CPU.
+    """
+    prompt_image = resize_to_bucket(image)
+    with torch.no_grad():
+        prompt_embeds, prompt_embeds_mask = pipeline.encode_prompt(
+            prompt=prompt,
+            image=prompt_image,
+            device=pipeline._execution_device
+        )
+    return (
+        prompt_embeds.cpu(),
+        prompt_embeds_mask.cpu() if prompt_embeds_mask is not None else None
+    )
+
+
+def resize_to_bucket(image):
+    """
+    Imagen reescalada a su bucket de resolución, como `image_processor.resize`
+    del pipeline (LANCZOS para imágenes PIL).
+    """
+    size = resolution_bucket(image.size)
+    return image if image.size == size else image.resize(size, Image.LANCZOS)
+
+
+def get_latent_cache():
+    """Crea la caché de latentes y la instala en el pipeline la primera vez que se necesita."""
+    global latent_cache
+    with _init_lock:
+        if latent_cache is None:
+            logger.info(f"Caché de latentes habilitada: {config.LATENT_CACHE_MB:.0f} MB")
+            latent_cache = LatentCache(max_bytes=config.LATENT_CACHE_MB * 1024**2)
+            # Con el pool de workers este proceso solo usa la caché de imágenes decodificadas
+            if pipeline is not None:
+                latent_cache.install(pipeline)
+    return latent_cache
+
+
+def get_step_cache():
+    """Crea la caché de pasos y la instala en el transformer la primera vez que se necesita."""
+    global step_cache
+    with _init_lock:
+        if step_cache is None:
+            step_cache = StepCache(config.STEP_CACHE_THRESHOLD, config.STEP_CACHE_WARMUP_STEPS)
+            step_cache.install(pipeline.transformer)
+    return step_cache
+
+
+def step_cache_session(payloads):
+    """Sesión de la caché de pasos para una llamada al pipeline (contexto vacío si está deshabilitada)."""
+    if not config.STEP_CACHE_ENABLED:
+        return nullcontext()
+    return get_step_cache().session(payloads[0]['params']['num_inference_steps'])
+
+
+def get_prompt_cache():
+    """Crea la caché de embeddings del prompt la primera vez que se necesita."""
+    global prompt_cache
+    with _init_lock:
+        if prompt_cache is None:
+            logger.info(f"Caché de prompts habilitada: {config.PROMPT_CACHE_MB:.0f} MB")
+            prompt_cache = PromptEmbeddingCache(max_bytes=config.PROMPT_CACHE_MB * 1024**2)
+    return prompt_cache
+
+
+def preload_prompt_cache():
+    """Precalcula los embeddings de los prompts frecuentes (QWEN_PROMPT_CACHE_PRELOAD)."""
+    logger.info(f"Precalculando embeddings de prompts desde {config.PROMPT_CACHE_PRELOAD}...")
+    preload_start = time.time()
+    cache = get_prompt_cache()
+    entries = load_preload_list(config.PROMPT_CACHE_PRELOAD)
+    for entry in entries:
+        with open(entry['image_path'], 'rb') as f:
+            image_bytes = f.read()
+        image = Image.open(BytesIO(image_bytes))
+        cache.get_or_compute(
+            prompt_cache_key(entry['prompt'], digest_bytes(image_bytes), image.size),
+            lambda: encode_prompt(entry['prompt'], image)
+        )
+    logger.info(f"{len(entries)} prompts precalculados en {time.time() - preload_start:.2f} segundos")
+
+
+def get_batcher():
+    """Crea el micro-batcher la primera vez que se necesita."""
+    global batcher
+    with _init_lock:
+        if batcher is None:
+            logger.info(
+                f"Micro-batching habilitado: lote máximo {config.BATCH_MAX_SIZE}, "
+                f"espera máxima {config.BATCH_MAX_WAIT_MS:.0f} ms"
+            )
+            # Los lotes se ejecutan en el hilo de GPU, que también atiende a
+            # los trabajos sin batching: nunca hay dos llamadas al pipeline a la vez
+            batcher = MicroBatcher(
+                lambda payloads: _gpu_executor.submit(run_pipeline, payloads).result(),
+                max_batch_size=config.BATCH_MAX_SIZE,
+                max_wait_ms=config.BATCH_MAX_WAIT_MS
+            )
+    return batcher
+
+
+def submit_inference(payload):
+    """
+    Envía un trabajo a la GPU y devuelve un Future con la imagen resultante.
+    Con micro-batching (o si es un elemento de un trabajo con items) el
+    trabajo se agrupa con otros del mismo bucket; sin él, un único hilo de
+    GPU ejecuta los trabajos de uno en uno.
+    """
+    if worker_pool is not None:
+        # Cada worker agrupa los trabajos con la misma clave que encuentra en su cola
+        future = worker_pool.submit(payload, key=batch_key(payload))
+        future.add_done_callback(lambda done: observe_worker_latency(payload, done))
+        return future
+    if config.BATCH_ENABLED or payload.get('batched'):
+        # Los trabajos del mismo bucket y parámetros comparten una llamada al pipeline
+        key = batch_key(payload)
+        request_logger.info("Encolando trabajo en micro-batcher (bucket: %s)", key)
+        return get_batcher().submit(key, payload)
+    return _gpu_executor.submit(lambda: run_pipeline([payload])[0])
+
+
+def batch_key(payload):
+    """Clave de agrupación: solo los trabajos con el mismo bucket y parámetros comparten lote."""
+    params = payload['params']
+    return (
+        resolution_bucket(payload['user_image'].size),
+        payload.get('output_size'),
+        params['guidance_scale'],
+        params['num_inference_steps'],
+        params['true_cfg_scale'],
+        params['negative_prompt']
+    )
+
+
+def observe_worker_latency(payload, future):
+    """Alimenta el modelo de latencia de este proceso con una llamada hecha en un worker."""
+    if future.exception() is None and 'gpu_interval' in payload:
+        gpu_start, gpu_end = payload['gpu_interval']
+        latency_model.observe(payload_work_units(payload), gpu_end - gpu_start)
+
+
+def ensure_worker_pool():
+    """Arranca el pool de workers (QWEN_WORKERS) si aún no está arrancado."""
+    global worker_pool
+    with _init_lock:
+        if worker_pool is None:
+            count = 0 if config.WORKERS == "auto" else int(config.WORKERS)
+            devices = resolve_devices(config.WORKER_DEVICES, count)
+            try:
+                worker_pool = WorkerPool(
+                    devices, backend=config.WORKER_BACKEND, max_batch=config.BATCH_MAX_SIZE
+                ).start()
+            except WorkerError as e:
+                logger.error(f"No se pudo arrancar el pool de workers: {e}")
+                return False
+    return True
+
+
+def infer(payload, timings):
+    """Ejecuta el pipeline para un trabajo y devuelve la imagen resultante."""
+    with stage(timings, 'inference'):
+        if 'tiles' in payload:
+            result_image = infer_tiled(payload)
+        else:
+            result_image = submit_inference(payload).result()
+    log_inference(payload, timings, result_image)
+    return result_image
+
+
+def prepare_tiles(payload):
+    """
+    Si la imagen supera QWEN_TILED_MIN_MEGAPIXELS, la divide en teselas
+    solapadas que se editan a su resolución nativa. Devuelve los parámetros
+    de teselado que forman parte de la clave de caché.
+    """
+    user_image = payload['user_image']
+    width, height = user_image.size
+    if width * height <= config.TILED_MIN_MEGAPIXELS * 1e6:
+        return {}
+
+    tile_payloads = []
+    for box in plan_tiles(user_image.size, config.TILE_SIZE, config.TILE_OVERLAP):
+        tile_image = user_image.crop(box)
+        tile_payloads.append({
+            **payload,
+            'user_image': tile_image,
+            'image_digest': f"{payload['image_digest']}#{','.join(map(str, box))}",
+            # El pipeline redondea el tamaño a múltiplos de 16 (vae_scale_factor * 2); se
+            # redondea aquí para no perder detalle, y la tesela se reescala a su caja al recomponer
+            'output_size': (tile_image.size[0] // 16 * 16, tile_image.size[1] // 16 * 16),
+            'box': box
+        })
+    payload['tiles'] = tile_payloads
+    request_logger.info(
+        "Procesamiento por teselas: %sx%s -> %s teselas de %spx (solape %spx)",
+        width, height, len(tile_payloads), config.TILE_SIZE, config.TILE_OVERLAP
+    )
+    return {'tile_size': config.TILE_SIZE, 'tile_overlap': config.TILE_OVERLAP}
+
+
+def infer_tiled(payload):
+    """
+    Edita las teselas de un trabajo y las recompone con costuras suaves. Las
+    teselas pasan por la misma cola de GPU que los trabajos normales (una a
+    una, o agrupadas por el micro-batcher), así que la VRAM pico es la de
+    una llamada al pipeline de ~1 MP.
+    """
+    tiles = payload['tiles']
+    # Las teselas se copian en prepare_job, antes de que process_job fije estos campos
+    for tile in tiles:
+        for key in ('batched', 'progress', 'item_index'):
+            tile[key] = payload.get(key)
+    blender = TileBlender(payload['user_image'].size, config.TILE_OVERLAP)
+    futures = [submit_inference(tile) for tile in tiles]
+    for index, (tile, future) in enumerate(zip(tiles, futures), start=1):
+        tile_image = future.result()
+        blender.add(tile['box'], tile_image)
+        gpu_start, gpu_end = tile['gpu_interval']
+        megapixels = tile_image.size[0] * tile_image.size[1] / 1e6
+        peak = f"{tile['peak_vram'] / 1024**3:.1f} GB" if tile['peak_vram'] is not None else "n/d"
+        # Siempre se registra: es la métrica de rendimiento por tesela
+        metrics_logger.info(
+            "TILE: %s/%s %s | %.2fs | %.2f MP/s | VRAM pico %s",
+            index, len(tiles), tile['box'], gpu_end - gpu_start,
+            megapixels / max(gpu_end - gpu_start, 1e-6), peak
+        )
+    payload['gpu_interval'] = (tiles[0]['gpu_interval'][0], tiles[-1]['gpu_interval'][1])
+    if 'step_cache_counts' in tiles[0]:
+        skipped = sum(tile['step_cache_counts'][0] for tile in tiles)
+        calls = sum(tile['step_cache_counts'][1] for tile in tiles)
+        payload['step_cache'] = f"{skipped}/{calls} pasos reutilizados"
+        payload['step_cache_counts'] = (skipped, calls)
+    return blender.result()
+
+
+def log_inference(payload, timings, result_image):
+    """Separa la espera en cola de la inferencia en sí y registra el resultado."""
+    submitted, _ = timings['stages']['inference']
+    gpu_start, gpu_end = payload['gpu_interval']
+    timings['stages']['queue'] = (submitted, gpu_start)
+    timings['stages']['inference'] = (gpu_start, gpu_end)
+    timings['pipeline'] = gpu_end - gpu_start
+    request_logger.info("Pipeline ejecutado exitosamente en %.2f segundos", timings['pipeline'])
+    request_logger.info("Imagen resultante: %s (%s)", result_image.size, result_image.mode)
+
+    # Log de memoria después de la inferencia
+    if cuda_available() and request_logger.isEnabledFor(logging.INFO):
+        request_logger.info("VRAM después de inferencia: %.1f GB", torch.cuda.memory_allocated(0) / 1024**3)
+
+
+def encode_result(result_image, timings, options):
+    """Codifica la imagen resultante en el formato de salida pedido."""
+    with stage(timings, 'encode'):
+        request_logger.info("=== CONVERSIÓN DE RESULTADO ===")
+        request_logger.info("Codificando imagen resultante como %s (%s)...", options['output_format'], options['output_mode'])
+        output = build_output(result_image, options, output_dir=config.OUTPUT_DIR)
+        if 'image_base64' in output:
+            request_logger.info("Imagen convertida a base64: %s caracteres", len(output['image_base64']))
+        else:
+            request_logger.info("Imagen escrita en %s: %s bytes", output['image_path'], output['bytes'])
+    return output
+
+
+def edit_image(payload, timings):
+    """Ejecuta el pipeline y codifica el resultado. Devuelve los campos de salida."""
+    result_image = compose_result(payload, infer(payload, timings), timings)
+    return encode_result(result_image, timings, payload['output'])
+
+
+def cached_edit_image(cache_key, payload, timings):
+    """`edit_image` a través de la caché de resultados. Devuelve `(salida, estado)`."""
+    # La caché guarda la salida serializada como JSON, con los metadatos de la inferencia
+    output_json, cache_status = get_result_cache().get_or_compute(
+        cache_key, lambda: json.dumps({**edit_image(payload, timings), **response_metadata(payload)})
+    )
+    request_logger.info("Caché de resultados: %s (clave %s...)", cache_status, cache_key[:16])
+    return json.loads(output_json), cache_status
+
+
+def get_result_cache():
+    """Crea la caché de resultados la primera vez que se necesita."""
+    global result_cache
+    with _init_lock:
+        if result_cache is None:
+            logger.info(
+                f"Caché de resultados habilitada: memoria {config.RESULT_CACHE_MEMORY_MB:.0f} MB, "
+                f"disco {config.RESULT_CACHE_DIR or 'deshabilitado'}"
+            )
+            result_cache = ResultCache(
+                max_memory_bytes=config.RESULT_CACHE_MEMORY_MB * 1024**2,
+                disk_dir=config.RESULT_CACHE_DIR,
+                max_disk_bytes=config.RESULT_CACHE_DISK_MB * 1024**2
+            )
+    return result_cache
+
+
+def concurrency_modifier(current_concurrency):
+    """Número de trabajos que RunPod puede entregar a la vez a este worker."""
+    return config.MAX_CONCURRENCY
+
+
+async def async_handler(job):
+    """
+    Versión asíncrona del handler para procesar trabajos concurrentes.
+    Cada trabajo corre en un hilo; el micro-batcher agrupa sus llamadas al
+    pipeline.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, handler, job)
+
+
+def ensure_pipeline():
+    """Carga el pipeline si aún no está cargado. Devuelve False si no se pudo cargar."""
+    global pipeline
+    if config.WORKERS != "0":
+        # Los pipelines se cargan en los procesos worker
+        return ensure_worker_pool()
+    with _init_lock:
         if pipeline is None:
             logger.warning("Pipeline no inicializado, ejecutando init()...")
             pipeline = init()
-            if pipeline is None:
-                logger.error("No se pudo inicializar el pipeline")
-                return {"error": "Error interno: No se pudo cargar el modelo"}
         else:
-            logger.info("Pipeline ya está inicializado, continuando...")
+            request_logger.info("Pipeline ya está inicializado, continuando...")
+    if pipeline is None:
+        logger.error("No se pudo inicializar el pipeline")
+        return False
+    return True
+
+
+def open_user_image(image_bytes):
+    """
+    Abre la imagen del usuario: orientación EXIF, RGB, decodificación reducida
+    para JPEG grandes y, si está habilitado, ajuste a un bucket de resolución.
+    """
+    # El pipeline reescala a ~1 MP, no hace falta decodificar mucho más que eso
+    # (salvo con teselas, que trabajan a resolución nativa)
+    target_pixels = None if config.TILED_ENABLED else 1024 * 1024
+    user_image = open_input_image(
+        image_bytes, config.INPUT_MAX_PIXELS, mode='RGB', target_pixels=target_pixels, label='user_image'
+    )
+    if config.SNAP_TO_BUCKETS:
+        original_size = user_image.size
+        user_image = snap_to_bucket(user_image, RESOLUTION_BUCKETS)
+        request_logger.info("Imagen ajustada al bucket %s (original %s)", user_image.size, original_size)
+    return user_image
+
+
+def start_job(job):
+    """Crea el request ID y registra el inicio del trabajo."""
+    request_id = f"req_{int(time.time() * 1000)}"
+    request_logger.info("=== INICIANDO PROCESAMIENTO DE TRABAJO [%s] ===", request_id)
+
+    # Log de información del job
+    request_logger.info("Job ID: %s", job.get('id', 'N/A'))
+    request_logger.info("Request ID: %s", request_id)
+    request_logger.info("Timestamp: %s", time.strftime('%Y-%m-%d %H:%M:%S'))
+    return request_id
+
 
-        logger.info("=== VALIDACIÓN DE ENTRADA ===")
+def prepare_job(job, timings):
+    """
+    Etapa de CPU previa a la inferencia: valida la entrada, decodifica las
+    imágenes y arma el payload del pipeline. Devuelve `{"error": ...}` si la
+    entrada no es válida.
+    """
+    prepare_start = time.time()
+    with stage(timings, 'decode'):
+        request_logger.info("=== VALIDACIÓN DE ENTRADA ===")
         # Valida la entrada del trabajo contra el esquema
         validated_input = validate(job['input'], INPUT_SCHEMA)
         if 'errors' in validated_input:
             logger.error(f"Errores de validación encontrados: {validated_input['errors']}")
             return {"error": validated_input['errors']}
-        
-        logger.info("Entrada validada exitosamente")
+
         job_input = validated_input['validated_input']
-        
-        logger.info(f"Prompt recibido: {job_input['prompt'][:100]}...")
-        logger.info(f"Tamaño de imagen del usuario: {len(job_input['user_image'])} caracteres en base64")
-        
-        logger.info("=== PROCESAMIENTO DE IMÁGENES ===")
-        logger.info("Decodificando imagen del usuario de base64...")
-        # Decodificar la imagen del usuario de base64 a PIL.Image
-        user_img_bytes = base64.b64decode(job_input['user_image'])
-        user_image = Image.open(BytesIO(user_img_bytes))
-        logger.info(f"Imagen del usuario decodificada: {user_image.size} ({user_image.mode})")
-
-        # Decodificar la máscara si se proporciona
-        mask_image = None
-        if job_input.get('mask_image'):
-            logger.info("Máscara proporcionada, decodificando...")
-            mask_img_bytes = base64.b64decode(job_input['mask_image'])
-            mask_image = Image.open(BytesIO(mask_img_bytes))
-            logger.info(f"Máscara decodificada: {mask_image.size} ({mask_image.mode})")
-        else:
-            logger.info("No se proporcionó máscara, continuando sin ella")
-
-        logger.info("=== EJECUCIÓN DEL PIPELINE ===")
-        logger.info("Parámetros de inferencia:")
-        logger.info(f"  - Prompt: {job_input['prompt'][:50]}...")
-        logger.info(f"  - Guidance scale: 7.5")
-        logger.info(f"  - Inference steps: 20")
-        logger.info(f"  - Máscara: {'Sí' if mask_image else 'No'}")
-        logger.info(f"  - Tamaño de imagen: {user_image.size}")
-        
+        missing = [f"{key} es obligatorio" for key in ('prompt', 'user_image') if job_input[key] is None]
+        if missing:
+            logger.error(f"Errores de validación encontrados: {missing}")
+            return {"error": missing}
+
+        request_logger.info("Entrada validada exitosamente")
+
+        request_logger.info("Prompt recibido: %s...", job_input['prompt'][:100])
+        request_logger.info("Tamaño de imagen del usuario: %s caracteres en base64", len(job_input['user_image']))
+
+        request_logger.info("=== PROCESAMIENTO DE IMÁGENES ===")
+        request_logger.info("Decodificando imagen del usuario de base64...")
+        try:
+            # Decodificar la imagen del usuario de base64 a PIL.Image, con límites de tamaño
+            user_img_bytes = decode_base64_image(
+                job_input['user_image'], config.INPUT_MAX_BYTES, config.INPUT_MAX_PIXELS, label='user_image'
+            )
+            user_image_digest = digest_bytes(user_img_bytes)
+            if config.LATENT_CACHE_ENABLED:
+                user_image, decode_hit = get_latent_cache().decode(
+                    user_image_digest, user_img_bytes, open_user_image
+                )
+                request_logger.info("Imagen decodificada %s", 'reutilizada de caché' if decode_hit else 'guardada en caché')
+            else:
+                user_image = open_user_image(user_img_bytes)
+            request_logger.info("Imagen del usuario decodificada: %s (%s)", user_image.size, user_image.mode)
+
+            # Decodificar la máscara si se proporciona
+            mask_image = None
+            mask_image_digest = None
+            if job_input.get('mask_image'):
+                request_logger.info("Máscara proporcionada, decodificando...")
+                mask_img_bytes = decode_base64_image(
+                    job_input['mask_image'], config.INPUT_MAX_BYTES, config.INPUT_MAX_PIXELS, label='mask_image'
+                )
+                mask_image = open_input_image(mask_img_bytes, config.INPUT_MAX_PIXELS, mode='L', label='mask_image')
+                mask_image_digest = digest_bytes(mask_img_bytes)
+                request_logger.info("Máscara decodificada: %s (%s)", mask_image.size, mask_image.mode)
+                if mask_image.size != user_image.size:
+                    # La máscara sigue a la imagen (orientación EXIF, bucket de resolución)
+                    mask_image = mask_image.resize(user_image.size, Image.NEAREST)
+                    request_logger.info("Máscara reescalada al tamaño de la imagen: %s", mask_image.size)
+            else:
+                request_logger.info("No se proporcionó máscara, continuando sin ella")
+        except InputImageError as e:
+            logger.error(f"Imagen de entrada rechazada: {e}")
+            return {"error": str(e)}
+
+        inference_options = {
+            key: job_input[key] for key in (
+                'num_inference_steps', 'guidance_scale', 'true_cfg_scale', 'seed', 'width', 'height', 'latency_budget'
+            )
+        }
+        for key, default in (('num_inference_steps', NUM_INFERENCE_STEPS), ('guidance_scale', GUIDANCE_SCALE)):
+            if inference_options[key] is None:
+                inference_options[key] = default
+        inference_errors = check_inference_options(inference_options)
+        if inference_errors:
+            logger.error(f"Parámetros de inferencia inválidos: {inference_errors}")
+            return {"error": inference_errors}
+
+        params = {
+            'guidance_scale': inference_options['guidance_scale'],
+            'num_inference_steps': inference_options['num_inference_steps'],
+            'true_cfg_scale': inference_options['true_cfg_scale'],
+            'negative_prompt': job_input['negative_prompt']
+        }
+
+        request_logger.info("=== EJECUCIÓN DEL PIPELINE ===")
+        request_logger.info("Parámetros de inferencia:")
+        request_logger.info("  - Prompt: %s...", job_input['prompt'][:50])
+        request_logger.info("  - Guidance scale: %s", params['guidance_scale'])
+        request_logger.info("  - Inference steps: %s", params['num_inference_steps'])
+        request_logger.info("  - True CFG: %s | Semilla: %s", params['true_cfg_scale'], inference_options['seed'])
+        request_logger.info("  - Máscara: %s", 'Sí' if mask_image else 'No')
+        request_logger.info("  - Tamaño de imagen: %s", user_image.size)
+
         # Log de memoria antes de la inferencia
-        if torch.cuda.is_available():
-            logger.info(f"VRAM antes de inferencia: {torch.cuda.memory_allocated(0) / 1024**3:.1f} GB")
-        
-        pipeline_start = time.time()
-        # Ejecuta el pipeline de edición con Qwen-Image-Edit
-        result_image = pipeline(
-            prompt=job_input['prompt'],
-            image=user_image,
-            mask_image=mask_image if mask_image else Image.new('RGB', user_image.size, (0, 0, 0)),
-            guidance_scale=7.5,
-            num_inference_steps=20
-        ).images[0]
-        
-        pipeline_time = time.time() - pipeline_start
-        logger.info(f"Pipeline ejecutado exitosamente en {pipeline_time:.2f} segundos")
-        logger.info(f"Imagen resultante: {result_image.size} ({result_image.mode})")
+        if cuda_available() and request_logger.isEnabledFor(logging.INFO):
+            request_logger.info("VRAM antes de inferencia: %.1f GB", torch.cuda.memory_allocated(0) / 1024**3)
 
-        # Log de memoria después de la inferencia
-        if torch.cuda.is_available():
-            logger.info(f"VRAM después de inferencia: {torch.cuda.memory_allocated(0) / 1024**3:.1f} GB")
-
-        logger.info("=== CONVERSIÓN DE RESULTADO ===")
-        logger.info("Convirtiendo imagen resultante a base64...")
-        # Convierte la imagen de resultado a base64 para devolverla en la respuesta JSON
-        buffered = BytesIO()
-        result_image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-        logger.info(f"Imagen convertida a base64: {len(img_str)} caracteres")
-
-        total_time = time.time() - start_time
-        logger.info(f"=== PROCESAMIENTO COMPLETADO ===")
-        logger.info(f"Tiempo total: {total_time:.2f} segundos")
-        logger.info(f"Tiempo de pipeline: {pipeline_time:.2f} segundos")
-        logger.info(f"Tiempo de procesamiento: {total_time - pipeline_time:.2f} segundos")
-        logger.info(f"Request ID: {request_id}")
-        logger.info("=== PROCESAMIENTO DE TRABAJO COMPLETADO EXITOSAMENTE ===")
-
-        # Log de métricas para RunPod
-        metrics_logger.info(f"METRICS: {request_id} | Total: {total_time:.2f}s | Pipeline: {pipeline_time:.2f}s | Success: True")
-
-        # Devuelve la imagen como una cadena base64
-        return {"image_base64": img_str}
+        output_options = {
+            key: job_input[key] for key in ('output_format', 'output_quality', 'png_compress_level', 'output_mode')
+        }
+        output_errors = check_output_options(output_options, config.OUTPUT_DIR)
+        if output_errors:
+            logger.error(f"Opciones de salida inválidas: {output_errors}")
+            return {"error": output_errors}
+
+        payload = {
+            'prompt': job_input['prompt'],
+            'user_image': user_image,
+            'image_digest': user_image_digest,
+            'params': params,
+            'seed': inference_options['seed'],
+            'output': output_options
+        }
+
+        layout_params = {}
+        if inference_options['width'] is not None:
+            # Tamaño de salida explícito: se edita la imagen completa a ese tamaño
+            payload['output_size'] = round_size((inference_options['width'], inference_options['height']))
+        else:
+            if config.REGION_EDIT_ENABLED and mask_image is not None:
+                layout_params = prepare_region(payload, mask_image)
+            if config.TILED_ENABLED and 'region' not in payload:
+                layout_params = prepare_tiles(payload)
+
+        payload['policy'] = None
+        if inference_options['latency_budget'] is not None:
+            apply_latency_budget(payload, inference_options['latency_budget'], time.time() - prepare_start)
+
+        cache_key = None
+        if config.RESULT_CACHE_ENABLED:
+            # La caché de pasos cambia ligeramente el resultado: su umbral forma parte de la clave
+            step_params = {'step_cache_threshold': config.STEP_CACHE_THRESHOLD} if config.STEP_CACHE_ENABLED else {}
+            # Sin semilla el resultado es aleatorio: la clave usa None y se reutiliza cualquier resultado previo
+            size_params = {'seed': payload['seed'], 'output_size': payload.get('output_size')}
+            cache_key = make_cache_key(
+                user_image_digest, mask_image_digest, job_input['prompt'],
+                {**params, **output_options, **layout_params, **step_params, **size_params}
+            )
+        return {'payload': payload, 'cache_key': cache_key}
+
+
+def apply_latency_budget(payload, budget, elapsed):
+    """
+    Ajusta steps y tamaño de salida del payload para terminar en `budget`
+    segundos desde el inicio del trabajo, según la duración del pipeline
+    observada en este worker. Se reserva QWEN_POLICY_MARGIN del presupuesto
+    para cola, decode y encode. Las teselas conservan su tamaño (solo se
+    reducen los steps).
+    """
+    params = payload['params']
+    tiles = payload.get('tiles')
+    remaining = budget * (1 - config.POLICY_MARGIN) - elapsed
+    choice = choose_parameters(
+        remaining,
+        params['num_inference_steps'],
+        generation_size(tiles[0] if tiles else payload),
+        latency_model,
+        passes=cfg_passes(params),
+        calls=len(tiles) if tiles else 1,
+        allow_resize=not tiles
+    )
+    adapted = choice.steps != params['num_inference_steps'] or (not tiles and choice.size != generation_size(payload))
+    # Las teselas comparten el dict de params del payload: heredan los steps elegidos
+    params['num_inference_steps'] = choice.steps
+    if not tiles:
+        payload['output_size'] = choice.size
+    payload['policy'] = {
+        'latency_budget': budget,
+        'predicted_seconds': round(choice.predicted_seconds + elapsed, 2),
+        'within_budget': choice.within_budget,
+        'adapted': adapted
+    }
+    log = request_logger.info if choice.within_budget else logger.warning
+    log(
+        "Política de latencia: presupuesto %.1fs -> %s steps, salida %s, previsto %.1fs%s | modelo: %s",
+        budget, choice.steps, choice.size, choice.predicted_seconds + elapsed,
+        "" if choice.within_budget else " (no cabe en el presupuesto)", latency_model.summary()
+    )
+
+
+def response_parameters(payload):
+    """Parámetros de inferencia usados, tal como se devuelven en la respuesta."""
+    params = payload['params']
+    # Tamaño de la imagen devuelta: con región o teselas, el de la imagen original
+    if 'region' in payload:
+        width, height = payload['original_image'].size
+    elif 'tiles' in payload:
+        width, height = payload['user_image'].size
+    else:
+        width, height = generation_size(payload)
+    parameters = {
+        'num_inference_steps': params['num_inference_steps'],
+        'guidance_scale': params['guidance_scale'],
+        'true_cfg_scale': params['true_cfg_scale'],
+        'seed': payload.get('seed'),
+        'width': width,
+        'height': height
+    }
+    return parameters
+
+
+def response_metadata(payload):
+    """
+    Campos de la respuesta que describen la inferencia: parámetros usados y
+    caché de pasos. Se guardan con el resultado en la caché de resultados
+    para que un acierto devuelva lo mismo que el cálculo original.
+    """
+    metadata = {'parameters': response_parameters(payload)}
+    if 'step_cache_counts' in payload:
+        skipped, calls = payload['step_cache_counts']
+        metadata['step_cache'] = {'transformer_calls': calls, 'skipped': skipped}
+    return metadata
+
+
+def prepare_region(payload, mask_image):
+    """
+    Si la máscara cubre una zona pequeña, sustituye la imagen del payload por
+    el recorte de la región (reescalado a su bucket) y guarda lo necesario
+    para fundir el resultado sobre la imagen original. Devuelve los
+    parámetros de la región que forman parte de la clave de caché.
+    """
+    user_image = payload['user_image']
+    region = plan_region(
+        user_image.size, mask_image, RESOLUTION_BUCKETS,
+        padding=config.REGION_PADDING, max_area_fraction=config.REGION_MAX_AREA
+    )
+    if region is None:
+        request_logger.info("Edición por región descartada: la máscara cubre demasiada área o está vacía")
+        return {}
+
+    image_crop = crop_region(user_image, region)
+    payload['region'] = region
+    payload['output_size'] = region.output_size
+    payload['original_image'] = user_image
+    payload['original_mask'] = mask_image
+    payload['user_image'] = image_crop
+    # Las cachés de prompt y latentes se indexan por la imagen que ve el pipeline
+    payload['image_digest'] = f"{payload['image_digest']}@{','.join(map(str, region.box))}"
+    area = region.size[0] * region.size[1] / (user_image.size[0] * user_image.size[1])
+    request_logger.info(
+        "Edición por región: caja %s (%.0f%% del área), referencia %s, salida %s",
+        region.box, area * 100, region.bucket, region.output_size
+    )
+    return {
+        'region_padding': config.REGION_PADDING,
+        'region_max_area': config.REGION_MAX_AREA,
+        'region_feather': config.REGION_FEATHER
+    }
+
+
+def compose_result(payload, result_image, timings):
+    """Funde el resultado sobre la imagen original si se editó solo una región."""
+    region = payload.get('region')
+    if region is None:
+        return result_image
+    with stage(timings, 'blend'):
+        result_image = blend_region(
+            payload['original_image'], result_image, payload['original_mask'], region,
+            feather=config.REGION_FEATHER
+        )
+    request_logger.info("Región fundida sobre la imagen original: %s", result_image.size)
+    return result_image
+
+
+def finish_job(request_id, start_time, payload, output, timings, cache_status):
+    """Registra el fin del trabajo y sus métricas, y arma la respuesta."""
+    pipeline_time = timings.get('pipeline', 0.0)
+    total_time = time.time() - start_time
+    request_logger.info("=== PROCESAMIENTO COMPLETADO ===")
+    request_logger.info("Tiempo total: %.2f segundos", total_time)
+    request_logger.info("Tiempo de pipeline: %.2f segundos", pipeline_time)
+    request_logger.info("Tiempo de procesamiento: %.2f segundos", total_time - pipeline_time)
+    request_logger.info("Request ID: %s", request_id)
+    request_logger.info("=== PROCESAMIENTO DE TRABAJO COMPLETADO EXITOSAMENTE ===")
+
+    # Log de métricas para RunPod
+    cache_metrics = ""
+    if cache_status is not None:
+        cache_metrics = f" | Cache: {cache_status} | {get_result_cache().summary()}"
+    # Con el pool de workers las cachés del pipeline viven en los workers: sin resumen aquí
+    if 'latent_cache' in payload:
+        cache_metrics += f" | LatentCache: {payload['latent_cache']}{cache_summary(latent_cache)}"
+    if 'prompt_cache' in payload:
+        cache_metrics += f" | PromptCache: {payload['prompt_cache']}{cache_summary(prompt_cache)}"
+    if 'step_cache' in payload:
+        cache_metrics += f" | StepCache: {payload['step_cache']}{cache_summary(step_cache)}"
+    if cache_status is None:
+        output.update(response_metadata(payload))
+    # La política de latencia es de esta petición, no del resultado guardado
+    if payload['policy'] is not None:
+        output['parameters'].update(payload['policy'])
+    metrics_logger.info(f"METRICS: {request_id} | Total: {total_time:.2f}s | Pipeline: {pipeline_time:.2f}s{cache_metrics} | Success: True")
+    metrics_logger.info(f"STAGES: {request_id} | {gpu_timeline.format_stages(timings.get('stages', {}))}")
+    record_metrics(payload, timings, total_time, cache_status)
+
+    # Devuelve la imagen (base64 o ruta en el volumen) y su formato
+    return output
+
+
+def cache_summary(cache):
+    """Resumen de una caché para la línea de METRICS, o nada si no existe en este proceso."""
+    return f" | {cache.summary()}" if cache is not None else ""
+
+
+def record_metrics(payload, timings, total_time, cache_status):
+    """Actualiza las métricas estructuradas con un trabajo completado."""
+    REQUESTS.inc(status='success')
+    REQUEST_LATENCY.observe(total_time)
+    for name, (start, end) in timings.get('stages', {}).items():
+        if name == 'queue':
+            QUEUE_TIME.observe(end - start)
+        STAGE_TIME.observe(end - start, stage=name)
+
+    if cache_status is not None:
+        CACHE_EVENTS.inc(cache='result', result=cache_status)
+    if 'prompt_cache' in payload:
+        CACHE_EVENTS.inc(cache='prompt', result=payload['prompt_cache'])
+    if 'latent_cache_counts' in payload:
+        hits, misses = payload['latent_cache_counts']
+        CACHE_EVENTS.inc(hits, cache='latent', result='hit')
+        CACHE_EVENTS.inc(misses, cache='latent', result='miss')
+    if 'step_cache_counts' in payload:
+        skipped, calls = payload['step_cache_counts']
+        CACHE_EVENTS.inc(skipped, cache='step', result='hit')
+        CACHE_EVENTS.inc(calls - skipped, cache='step', result='miss')
+
+    record_memory()
+
+
+def record_memory():
+    """Actualiza los gauges de memoria y de compilación."""
+    RSS_BYTES.set(process_rss_bytes())
+    if cuda_available():
+        VRAM_BYTES.set(torch.cuda.memory_allocated(0), kind='allocated')
+        VRAM_BYTES.set(torch.cuda.memory_reserved(0), kind='reserved')
+        VRAM_BYTES.set(torch.cuda.max_memory_allocated(0), kind='peak')
+    if compiled_denoiser is not None:
+        stats = compiled_denoiser.stats()
+        COMPILED_GRAPHS.set(stats['shapes'], kind='shapes')
+        COMPILED_GRAPHS.set(stats['recompiles'], kind='recompiles')
+
+
+def fail_job(request_id, start_time, e):
+    """Registra un error del trabajo y arma la respuesta de error."""
+    total_time = time.time() - start_time
+    if isinstance(e, JobCancelled):
+        metrics_logger.info(f"METRICS: {request_id} | Total: {total_time:.2f}s | Success: False | Cancelado: {e}")
+        REQUESTS.inc(status='cancelled')
+        return {"error": f"Trabajo cancelado: {e}"}
+    logger.error(f"=== ERROR DURANTE EL PROCESAMIENTO ===")
+    logger.error(f"Request ID: {request_id}")
+    logger.error(f"Tiempo transcurrido antes del error: {total_time:.2f} segundos")
+    logger.error(f"Error: {str(e)}")
+    logger.error(f"Tipo de error: {type(e).__name__}")
+    logger.error(f"Traceback completo: {traceback.format_exc()}")
+
+    # Log de memoria en caso de error
+    if cuda_available():
+        logger.error(f"VRAM en el momento del error: {torch.cuda.memory_allocated(0) / 1024**3:.1f} GB")
+
+    # Log de métricas de error
+    metrics_logger.error(f"METRICS: {request_id} | Total: {total_time:.2f}s | Success: False | Error: {type(e).__name__}")
+    REQUESTS.inc(status='error')
+    REQUEST_LATENCY.observe(total_time)
+    record_memory()
+
+    logger.error("=== PROCESAMIENTO DE TRABAJO FALLÓ ===")
+    return {"error": f"Error interno del servidor: {str(e)}"}
+
+
+def handler(job):
+    """
+    Esta función se ejecuta por cada llamada a la API.
+    Procesa la entrada y devuelve la imagen generada.
+    """
+    request_id = start_job(job)
+    start_time = time.time()
+    
+    try:
+        if not ensure_pipeline():
+            return {"error": "Error interno: No se pudo cargar el modelo"}
+        if job['input'].get('items') is not None:
+            return run_items(request_id, start_time, job)
+        return process_job(request_id, start_time, job)
         
     except Exception as e:
-        total_time = time.time() - start_time
-        logger.error(f"=== ERROR DURANTE EL PROCESAMIENTO ===")
-        logger.error(f"Request ID: {request_id}")
-        logger.error(f"Tiempo transcurrido antes del error: {total_time:.2f} segundos")
-        logger.error(f"Error: {str(e)}")
-        logger.error(f"Tipo de error: {type(e).__name__}")
-        logger.error(f"Traceback completo: {traceback.format_exc()}")
-        
-        # Log de memoria en caso de error
-        if torch.cuda.is_available():
-            logger.error(f"VRAM en el momento del error: {torch.cuda.memory_allocated(0) / 1024**3:.1f} GB")
-        
-        # Log de métricas de error
-        metrics_logger.error(f"METRICS: {request_id} | Total: {total_time:.2f}s | Success: False | Error: {type(e).__name__}")
-        
-        logger.error("=== PROCESAMIENTO DE TRABAJO FALLÓ ===")
-        return {"error": f"Error interno del servidor: {str(e)}"}
+        return fail_job(request_id, start_time, e)
+
+
+def process_job(request_id, start_time, job, batched=False, progress=None, item_index=None):
+    """
+    Procesa un trabajo de un solo elemento y arma la respuesta (lanza las
+    excepciones). Con `progress` (ProgressStream) emite el progreso del
+    denoising y se puede cancelar.
+    """
+    timings = {}
+    prepared = prepare_job(job, timings)
+    if 'error' in prepared:
+        REQUESTS.inc(status='rejected')
+        return prepared
+    payload = prepared['payload']
+    payload['batched'] = batched
+    payload['progress'] = progress
+    payload['item_index'] = item_index
+
+    cache_status = None
+    if prepared['cache_key'] is not None:
+        # Peticiones idénticas (reintentos, duplicados) reutilizan el resultado
+        output, cache_status = cached_edit_image(prepared['cache_key'], payload, timings)
+    else:
+        output = edit_image(payload, timings)
+
+    return finish_job(request_id, start_time, payload, output, timings, cache_status)
+
+
+def expand_items(job):
+    """
+    Trabajos individuales de un trabajo con items: cada elemento hereda los
+    campos del nivel superior y los sobrescribe. Devuelve
+    `{"jobs": [...]}` o `{"error": ...}` si la lista no es válida.
+    """
+    defaults = {key: value for key, value in job['input'].items() if key != 'items'}
+    items = job['input']['items']
+    if not isinstance(items, list) or not items:
+        return {"error": "items debe ser una lista no vacía"}
+    if len(items) > config.ITEMS_MAX:
+        return {"error": f"items admite como máximo {config.ITEMS_MAX} elementos, se recibieron {len(items)}"}
+    errors = [
+        f"items[{index}] debe ser un objeto sin items anidados"
+        for index, item in enumerate(items) if not isinstance(item, dict) or 'items' in item
+    ]
+    if errors:
+        return {"error": errors}
+    return {"jobs": [
+        {'id': f"{job.get('id', 'N/A')}#{index}", 'input': {**defaults, **item}}
+        for index, item in enumerate(items)
+    ]}
+
+
+def submit_items(request_id, item_jobs, progress=None):
+    """
+    Procesa los elementos de un trabajo en el pool de elementos y devuelve un
+    Future por elemento. Sus llamadas al pipeline pasan por el micro-batcher,
+    así que los elementos del mismo bucket comparten lote. El resultado de
+    cada Future lleva su `index`; un elemento que falla devuelve su `error`
+    sin afectar a los demás.
+    """
+    def process_item(index, item_job):
+        item_request_id = f"{request_id}#{index}"
+        start_time = time.time()
+        try:
+            output = process_job(
+                item_request_id, start_time, item_job, batched=True, progress=progress, item_index=index
+            )
+        except Exception as e:
+            output = fail_job(item_request_id, start_time, e)
+        return {'index': index, **output}
+
+    return [_item_executor.submit(process_item, index, item_job) for index, item_job in enumerate(item_jobs)]
+
+
+def run_items(request_id, start_time, job):
+    """Procesa un trabajo con items y devuelve los resultados en el orden de entrada."""
+    expanded = expand_items(job)
+    if 'error' in expanded:
+        REQUESTS.inc(status='rejected')
+        return expanded
+    results = [future.result() for future in submit_items(request_id, expanded['jobs'])]
+    failed = sum(1 for result in results if 'error' in result)
+    metrics_logger.info(
+        f"ITEMS: {request_id} | {len(results)} elementos | Fallidos: {failed} | Total: {time.time() - start_time:.2f}s"
+    )
+    return {'items': results, 'succeeded': len(results) - failed, 'failed': failed}
+
+
+async def pipelined_handler(job):
+    """
+    Handler asíncrono en etapas: la decodificación y la codificación corren
+    en un pool de hilos de CPU y la inferencia en el hilo de GPU. Con varios
+    trabajos concurrentes, la preparación del trabajo N+1 y la codificación
+    del N-1 se solapan con la inferencia del trabajo N.
+    """
+    request_id = start_job(job)
+    start_time = time.time()
+    loop = asyncio.get_running_loop()
+
+    try:
+        if not await loop.run_in_executor(_cpu_executor, ensure_pipeline):
+            return {"error": "Error interno: No se pudo cargar el modelo"}
+        if job['input'].get('items') is not None:
+            # Los elementos se preparan y codifican en su propio pool
+            return await loop.run_in_executor(None, run_items, request_id, start_time, job)
+
+        timings = {}
+        prepared = await loop.run_in_executor(_cpu_executor, prepare_job, job, timings)
+        if 'error' in prepared:
+            REQUESTS.inc(status='rejected')
+            return prepared
+        payload = prepared['payload']
+
+        cache_status = None
+        if prepared['cache_key'] is not None:
+            # El single-flight de la caché es bloqueante: se resuelve en el pool de CPU
+            output, cache_status = await loop.run_in_executor(
+                _cpu_executor, cached_edit_image, prepared['cache_key'], payload, timings
+            )
+        else:
+            if 'tiles' in payload:
+                # La recomposición de teselas espera cada tesela: se ejecuta en el pool de CPU
+                result_image = await loop.run_in_executor(_cpu_executor, infer, payload, timings)
+            else:
+                with stage(timings, 'inference'):
+                    result_image = await asyncio.wrap_future(submit_inference(payload))
+                log_inference(payload, timings, result_image)
+            result_image = await loop.run_in_executor(
+                _cpu_executor, compose_result, payload, result_image, timings
+            )
+            output = await loop.run_in_executor(
+                _cpu_executor, encode_result, result_image, timings, payload['output']
+            )
+
+        return finish_job(request_id, start_time, payload, output, timings, cache_status)
+
+    except Exception as e:
+        return fail_job(request_id, start_time, e)
+
+
+async def stream_handler(job):
+    """
+    Handler generador (QWEN_STREAM_RESULTS): en un trabajo con items emite el
+    resultado de cada elemento en cuanto termina, con su `index`, sin esperar
+    a los más lentos. Un trabajo de un solo elemento emite su resultado.
+    Con QWEN_STREAM_PROGRESS emite además eventos `{"type": "progress"}`
+    tras cada paso de denoising, con una preview cada QWEN_PREVIEW_INTERVAL
+    pasos. RunPod agrega lo emitido para /run y /runsync
+    (return_aggregate_stream).
+
+    Si RunPod cancela el trabajo (cancelación del cliente o timeout), el
+    denoising se detiene en el siguiente paso.
+    """
+    request_id = start_job(job)
+    start_time = time.time()
+    loop = asyncio.get_running_loop()
+    stream = ProgressStream(loop)
+    progress = stream if config.STREAM_PROGRESS else None
+
+    try:
+        if not await loop.run_in_executor(_cpu_executor, ensure_pipeline):
+            yield {"error": "Error interno: No se pudo cargar el modelo"}
+            return
+        if job['input'].get('items') is None:
+            futures = [_item_executor.submit(run_streamed_job, request_id, start_time, job, progress)]
+        else:
+            expanded = expand_items(job)
+            if 'error' in expanded:
+                REQUESTS.inc(status='rejected')
+                yield expanded
+                return
+            futures = submit_items(request_id, expanded['jobs'], progress=progress)
+
+        failed = 0
+        async for event in stream.events(futures):
+            failed += 'error' in event
+            yield event
+        if job['input'].get('items') is not None:
+            metrics_logger.info(
+                f"ITEMS: {request_id} | {len(futures)} elementos | Fallidos: {failed} | Total: {time.time() - start_time:.2f}s"
+            )
+
+    except Exception as e:
+        yield fail_job(request_id, start_time, e)
+    finally:
+        # Trabajo cancelado o generador cerrado antes de tiempo: no sigue en la GPU
+        stream.cancel()
+
+
+def run_streamed_job(request_id, start_time, job, progress):
+    """`process_job` para el handler generador: los errores se devuelven como resultado."""
+    try:
+        return process_job(request_id, start_time, job, progress=progress)
+    except Exception as e:
+        return fail_job(request_id, start_time, e)
+
+
+def select_handler():
+    """Handler que se registra en RunPod según la configuración."""
+    if config.STREAM_RESULTS:
+        return stream_handler
+    if config.MAX_CONCURRENCY <= 1:
+        return handler
+    if config.PIPELINED_HANDLER:
+        return pipelined_handler
+    return async_handler
 
 
-# Inicia el manejador de trabajos de RunPod
-logger.info("=== INICIANDO SERVIDOR RUNPOD ===")
-logger.info("Configuración:")
-logger.info("  - Handler: handler")
-logger.info("  - Init: init")
-logger.info("Servidor listo para recibir trabajos...")
-runpod.serverless.start({"handler": handler, "init": init})
+if __name__ == "__main__":
+    # Inicia el manejador de trabajos de RunPod
+    logger.info("=== INICIANDO SERVIDOR RUNPOD ===")
+    logger.info("Configuración:")
+    logger.info(f"  - Handler: {select_handler().__name__}")
+    logger.info("  - Init: init")
+    logger.info(f"  - Micro-batching: {'Sí' if config.BATCH_ENABLED else 'No'}")
+    logger.info(f"  - Concurrencia máxima: {config.MAX_CONCURRENCY}")
+    logger.info(f"  - Trabajos con items: hasta {config.ITEMS_MAX} elementos, {config.ITEMS_CONCURRENCY} a la vez | Streaming: {'Sí' if config.STREAM_RESULTS else 'No'}")
+    logger.info(f"  - Caché de resultados: {'Sí' if config.RESULT_CACHE_ENABLED else 'No'}")
+    logger.info(f"  - Caché de prompts: {'Sí' if config.PROMPT_CACHE_ENABLED else 'No'}")
+    logger.info(f"  - Caché de latentes: {'Sí' if config.LATENT_CACHE_ENABLED else 'No'}")
+    logger.info(f"  - Caché de pasos: {'Sí (umbral ' + str(config.STEP_CACHE_THRESHOLD) + ')' if config.STEP_CACHE_ENABLED else 'No'}")
+    logger.info(f"  - Hilos de CPU (decode/encode): {config.CPU_WORKERS}")
+    logger.info(f"  - Límites de entrada: {config.INPUT_MAX_BYTES / 1024**2:.0f} MB, {config.INPUT_MAX_PIXELS / 1e6:.0f} MP")
+    logger.info(f"  - Ajuste a buckets de resolución: {'Sí' if config.SNAP_TO_BUCKETS else 'No'}")
+    logger.info(f"  - Edición por región: {'Sí' if config.REGION_EDIT_ENABLED else 'No'}")
+    logger.info(f"  - Procesamiento por teselas: {'Sí' if config.TILED_ENABLED else 'No'} | VAE por teselas: {'Sí' if config.TILED_VAE else 'No'}")
+    logger.info(f"  - Modelo: {config.MODEL_PATH or config.MODEL_ID}")
+    if config.WORKERS != "0":
+        logger.info(f"  - Pool de workers: {config.WORKERS} ({config.WORKER_DEVICES}), backend {config.WORKER_BACKEND}")
+    logger.info(f"  - Log detallado por trabajo: {'Sí' if config.VERBOSE_LOGS else 'No'} (nivel {config.LOG_LEVEL})")
+    if config.METRICS_PORT:
+        start_http_server(metrics_registry, config.METRICS_PORT)
+    if config.FAST_START:
+        # La carga del modelo empieza ya, en paralelo con el arranque de RunPod;
+        # el primer trabajo espera en ensure_pipeline() si aún no ha terminado
+        logger.info("  - Arranque rápido: cargando el modelo en segundo plano")
+        threading.Thread(target=ensure_pipeline, name="preload", daemon=True).start()
+    logger.info("Servidor listo para recibir trabajos...")
+    runpod.serverless.start({
+        "handler": select_handler(),
+        "init": init,
+        "concurrency_modifier": concurrency_modifier,
+        "return_aggregate_stream": config.STREAM_RESULTS
+    })
@@ -0,0 +1,63 @@
+# stage_timing.py
+# Tiempos por etapa de cada trabajo y solape entre etapas de CPU y la GPU
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+@contextmanager
+def stage(timings, name):
+    """Registra el intervalo `(inicio, fin)` de una etapa en `timings['stages']`."""
+    start = time.time()
+    try:
+        yield
+    finally:
+        timings.setdefault('stages', {})[name] = (start, time.time())
+
+
+class GpuTimeline:
+    """
+    Historial de los intervalos en los que la GPU estuvo ejecutando el
+    pipeline. Permite medir cuánto de una etapa de CPU (decode, encode) se
+    ejecutó mientras la GPU trabajaba en otro trabajo, es decir, cuánto
+    solape real consigue el handler en modo pipelined.
+    """
+
+    def __init__(self, max_intervals=256):
+        self._intervals = deque(maxlen=max_intervals)
+        self._active_since = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def busy(self):
+        """Marca la GPU como ocupada durante el bloque."""
+        start = time.time()
+        with self._lock:
+            self._active_since = start
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._intervals.append((start, time.time()))
+                self._active_since = None
+
+    def overlap(self, start, end):
+        """Segundos del intervalo `[start, end]` durante los que la GPU estuvo ocupada."""
+        with self._lock:
+            intervals = list(self._intervals)
+            if self._active_since is not None:
+                intervals.append((self._active_since, time.time()))
+        return sum(max(0.0, min(end, e) - max(start, s)) for s, e in intervals)
+
+    def format_stages(self, stages, cpu_stages=('decode', 'blend', 'encode')):
+        """Resumen de etapas para la línea de STAGES, con el solape con la GPU."""
+        parts = []
+        for name, (start, end) in sorted(stages.items(), key=lambda item: item[1][0]):
+            duration = end - start
+            part = f"{name}: {duration:.3f}s"
+            if name in cpu_stages and duration > 0:
+                overlap = self.overlap(start, end)
+                part += f" (solape GPU {overlap:.3f}s, {overlap / duration * 100:.0f}%)"
+            parts.append(part)
+        return " | ".join(parts)
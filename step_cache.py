@@ -0,0 +1,122 @@
+# step_cache.py
+# Reutilización de la salida del transformer entre pasos de denoising
+# consecutivos cuando su entrada apenas cambia (estilo TeaCache)
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StepSession:
+    """Contadores de una llamada al pipeline (uno o varios trabajos)."""
+
+    def __init__(self, num_steps=None):
+        self.num_steps = num_steps
+        self.calls = 0
+        self.skipped = 0
+        self._streams = {}
+
+    def report(self):
+        return f"{self.skipped}/{self.calls} pasos reutilizados"
+
+
+class _Stream:
+    # Estado de una secuencia de llamadas al transformer (condicionada o no)
+    def __init__(self):
+        self.step = 0
+        self.input = None
+        self.output = None
+        self.accumulated = 0.0
+
+
+def relative_l1(current, previous):
+    """Cambio relativo medio |a - b| / |b| entre dos tensores."""
+    return ((current - previous).abs().mean() / previous.abs().mean().clamp_min(1e-8)).item()
+
+
+class StepCache:
+    """
+    Envuelve `forward` del transformer. En cada paso se acumula el cambio
+    relativo (L1) de la entrada del transformer respecto al paso anterior;
+    mientras el acumulado no supera `threshold`, el paso reutiliza la salida
+    del último paso calculado en lugar de ejecutar el transformer. Al
+    calcular un paso el acumulado vuelve a cero.
+
+    Los primeros `warmup_steps` pasos y el último se calculan siempre: al
+    principio la entrada cambia mucho y el último paso fija el detalle
+    fino. Cada llamada al pipeline con CFG real tiene dos secuencias
+    (prompt y prompt negativo); se distinguen por el tensor de embeddings
+    del prompt que recibe el transformer.
+
+    Solo actúa dentro de `session()`; fuera de ella el transformer se
+    ejecuta siempre.
+    """
+
+    def __init__(self, threshold=0.1, warmup_steps=2):
+        self.threshold = threshold
+        self.warmup_steps = warmup_steps
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "skipped": 0}
+
+    @contextmanager
+    def session(self, num_steps=None):
+        """Activa la caché para una llamada al pipeline de `num_steps` pasos."""
+        session = StepSession(num_steps)
+        self._local.session = session
+        try:
+            yield session
+        finally:
+            self._local.session = None
+            with self._lock:
+                self.stats["calls"] += session.calls
+                self.stats["skipped"] += session.skipped
+
+    def summary(self):
+        """Resumen de contadores para la línea de METRICS."""
+        with self._lock:
+            calls, skipped = self.stats["calls"], self.stats["skipped"]
+        return f"reutilizados: {skipped}/{calls} ({skipped / calls if calls else 0:.0%}) | umbral: {self.threshold}"
+
+    def install(self, module):
+        """Envuelve `forward` del transformer `module`."""
+        forward = module.forward
+
+        def cached_forward(*args, **kwargs):
+            session = getattr(self._local, "session", None)
+            if session is None or self.threshold <= 0:
+                return forward(*args, **kwargs)
+            return self._step(session, forward, args, kwargs)
+
+        module.forward = cached_forward
+        logger.info(f"Caché de pasos instalada en el transformer (umbral {self.threshold})")
+
+    def _step(self, session, forward, args, kwargs):
+        hidden_states = kwargs.get("hidden_states", args[0] if args else None)
+        prompt_embeds = kwargs.get("encoder_hidden_states")
+        stream = session._streams.setdefault(
+            prompt_embeds.data_ptr() if prompt_embeds is not None else None, _Stream()
+        )
+        step = stream.step
+        stream.step += 1
+        session.calls += 1
+
+        last_step = session.num_steps is not None and step >= session.num_steps - 1
+        if (
+            stream.output is not None
+            and step >= self.warmup_steps
+            and not last_step
+            and stream.input.shape == hidden_states.shape
+        ):
+            stream.accumulated += relative_l1(hidden_states, stream.input)
+            stream.input = hidden_states
+            if stream.accumulated < self.threshold:
+                session.skipped += 1
+                return stream.output
+
+        output = forward(*args, **kwargs)
+        stream.input = hidden_states
+        stream.output = output
+        stream.accumulated = 0.0
+        return output
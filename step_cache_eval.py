@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Evaluación calidad / velocidad de la caché de pasos de Qwen-Image-Edit
+
+Ejecuta el pipeline real con la misma imagen, prompt y semilla para cada
+umbral de la caché de pasos y compara con el resultado sin caché (umbral 0):
+latencia, aceleración, pasos reutilizados y PSNR.
+
+  python step_cache_eval.py --thresholds 0.02,0.05,0.1,0.2 --steps 20
+  python step_cache_eval.py --placement cpu --dtype float32 --resolution 256x256 --steps 8
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from benchmark import DEFAULT_MODEL, PipelineBackend, synthetic_request
+from cpu_quant import psnr
+from image_io import decode_base64_image, open_input_image
+from placement import STRATEGIES
+from step_cache import StepCache
+
+
+def run_threshold(backend, cache, image, prompt, steps, threshold, repeats):
+    """Mejor latencia de `repeats` ejecuciones con el umbral dado, con su imagen y sus contadores."""
+    cache.threshold = threshold
+    best = None
+    for _ in range(repeats):
+        with cache.session(steps) as session:
+            start = time.perf_counter()
+            result = backend.infer([image], prompt, steps)[0]
+            seconds = time.perf_counter() - start
+        if best is None or seconds < best[0]:
+            best = (seconds, result, session)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--thresholds", default="0.02,0.05,0.1,0.2")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="Id del Hub o ruta local (p. ej. un modelo pequeño)")
+    parser.add_argument("--warmup-steps", type=int, default=2, help="Pasos iniciales que se calculan siempre")
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--resolution", default="1024x1024")
+    parser.add_argument("--prompt", default="Make the sky a sunset")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--placement", choices=("auto",) + STRATEGIES, default="auto")
+    parser.add_argument("--dtype", help="float16, bfloat16 o float32 (por defecto, el del plan)")
+    parser.add_argument("--output", help="Archivo JSON con la tabla de resultados")
+    parser.add_argument("--save-images", help="Prefijo para guardar la imagen de cada umbral")
+    args = parser.parse_args(argv)
+
+    thresholds = [float(value) for value in args.thresholds.split(",")]
+    width, height = (int(value) for value in args.resolution.lower().split("x"))
+
+    backend = PipelineBackend(
+        placement=None if args.placement == "auto" else args.placement,
+        dtype=args.dtype,
+        model=args.model,
+        seed=args.seed,
+    )
+    print("=== EVALUACIÓN DE LA CACHÉ DE PASOS ===")
+    backend.load()
+    cache = StepCache(threshold=0.0, warmup_steps=args.warmup_steps)
+    cache.install(backend.pipeline.transformer)
+
+    data = synthetic_request(width, height, seed=args.seed)
+    image = backend.preprocess(open_input_image(decode_base64_image(data, float("inf"), float("inf")), float("inf")))
+
+    # Referencia sin caché (umbral 0: el transformer se ejecuta en todos los pasos)
+    reference_seconds, reference, _ = run_threshold(backend, cache, image, args.prompt, args.steps, 0.0, args.repeats)
+    rows = [{"threshold": 0.0, "seconds": reference_seconds, "speedup": 1.0, "skipped": 0, "calls": args.steps, "psnr_db": None}]
+    if args.save_images:
+        reference.save(f"{args.save_images}_0.png")
+
+    for threshold in thresholds:
+        seconds, result, session = run_threshold(backend, cache, image, args.prompt, args.steps, threshold, args.repeats)
+        rows.append({
+            "threshold": threshold,
+            "seconds": seconds,
+            "speedup": reference_seconds / seconds,
+            "skipped": session.skipped,
+            "calls": session.calls,
+            "psnr_db": psnr(reference, result),
+        })
+        if args.save_images:
+            result.save(f"{args.save_images}_{threshold}.png")
+
+    print(f"\n{'umbral':>8} {'latencia (s)':>13} {'aceleración':>12} {'reutilizados':>13} {'PSNR (dB)':>10}")
+    for row in rows:
+        similarity = f"{row['psnr_db']:.2f}" if row["psnr_db"] is not None else "ref."
+        print(
+            f"{row['threshold']:>8} {row['seconds']:>13.2f} {row['speedup']:>11.2f}x "
+            f"{row['skipped']:>6}/{row['calls']:<6} {similarity:>10}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"steps": args.steps, "resolution": args.resolution, "rows": rows}, f, indent=2)
+        print(f"\n💾 Resultados guardados en {args.output}")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
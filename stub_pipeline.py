@@ -0,0 +1,76 @@
+# stub_pipeline.py
+# Sustituto del pipeline de Qwen-Image-Edit sin modelo, para probar el
+# handler, el pool de workers y la carga en máquinas sin GPU
+import time
+
+from PIL import Image
+
+from image_io import resolution_bucket
+
+
+class StubOutput:
+    def __init__(self, images):
+        self.images = images
+
+
+class StubPipeline:
+    """
+    Tiene la misma firma que `QwenImageEditPipeline.__call__` (diffusers
+    0.41), sin argumentos comodín: un argumento que el pipeline real no
+    acepta falla también aquí. Devuelve la imagen de entrada volteada y
+    reescalada al tamaño de salida. La duración se simula con una espera
+    (la CPU queda libre, como si la GPU trabajara):
+    `overhead + step_seconds * steps * megapíxeles * pasadas`, con lotes
+    más baratos que las llamadas sueltas (cada imagen extra del lote cuesta
+    `batch_efficiency` de una imagen). Llama a `callback_on_step_end` en
+    cada paso, como el pipeline real.
+    """
+
+    vae_scale_factor = 8
+
+    def __init__(self, step_seconds=0.01, overhead=0.05, batch_efficiency=0.6):
+        self.step_seconds = step_seconds
+        self.overhead = overhead
+        self.batch_efficiency = batch_efficiency
+        self.calls = 0
+
+    def __call__(self, image=None, prompt=None, negative_prompt=None, true_cfg_scale=4.0, height=None, width=None,
+                 num_inference_steps=50, sigmas=None, guidance_scale=None, num_images_per_prompt=1, generator=None,
+                 latents=None, prompt_embeds=None, prompt_embeds_mask=None, negative_prompt_embeds=None,
+                 negative_prompt_embeds_mask=None, output_type='pil', return_dict=True, attention_kwargs=None,
+                 callback_on_step_end=None, callback_on_step_end_tensor_inputs=['latents'], max_sequence_length=512):
+        images = image if isinstance(image, list) else [image]
+        size = (width, height) if width and height else resolution_bucket(images[0].size)
+        # Como el pipeline real: CFG (dos pasadas) si hay prompt negativo y true_cfg_scale > 1
+        has_negative = negative_prompt is not None or negative_prompt_embeds is not None
+        passes = 2 if true_cfg_scale > 1 and has_negative else 1
+        megapixels = size[0] * size[1] / 1e6
+        batch_factor = 1 + (len(images) - 1) * self.batch_efficiency
+        step_time = self.step_seconds * megapixels * passes * batch_factor
+        self.calls += 1
+
+        time.sleep(self.overhead)
+        latents = self._latents(len(images), size) if callback_on_step_end is not None else None
+        for step in range(num_inference_steps):
+            time.sleep(step_time)
+            if callback_on_step_end is not None:
+                callback_on_step_end(self, step, num_inference_steps - step, {'latents': latents})
+        return StubOutput([
+            source.convert('RGB').transpose(Image.FLIP_LEFT_RIGHT).resize(size, Image.BILINEAR)
+            for source in images
+        ])
+
+    def _latents(self, batch, size):
+        # Latentes empaquetados con la forma del pipeline real, para las previews
+        import torch
+
+        return torch.randn(batch, (size[1] // 16) * (size[0] // 16), 64)
+
+    @staticmethod
+    def _unpack_latents(latents, height, width, vae_scale_factor):
+        batch, _, channels = latents.shape
+        height = 2 * (int(height) // (vae_scale_factor * 2))
+        width = 2 * (int(width) // (vae_scale_factor * 2))
+        latents = latents.view(batch, height // 2, width // 2, channels // 4, 2, 2)
+        latents = latents.permute(0, 3, 1, 4, 2, 5)
+        return latents.reshape(batch, channels // 4, 1, height, width)
@@ -0,0 +1,111 @@
+# MicroBatcher: ventana de espera, tamaño máximo de lote, agrupación por
+# bucket y reintento individual cuando falla un lote
+import threading
+import time
+
+import pytest
+
+from batching import MicroBatcher
+
+
+class RecordingRunner:
+    """`run_batch` de prueba: registra cada lote y falla si contiene 'bad'."""
+
+    def __init__(self):
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def __call__(self, payloads):
+        with self.lock:
+            self.batches.append(list(payloads))
+        if 'bad' in payloads:
+            raise ValueError('payload inválido')
+        return [payload.upper() for payload in payloads]
+
+
+@pytest.fixture
+def runner():
+    return RecordingRunner()
+
+
+def test_single_job_waits_for_the_window(runner):
+    batcher = MicroBatcher(runner, max_batch_size=4, max_wait_ms=200)
+    started = time.monotonic()
+    future = batcher.submit('a', 'x')
+
+    time.sleep(0.05)
+    assert not future.done()
+    assert batcher.pending() == 1
+
+    assert future.result(timeout=2) == 'X'
+    assert time.monotonic() - started >= 0.2
+    assert runner.batches == [['x']]
+    batcher.close()
+
+
+def test_jobs_within_the_window_share_a_call(runner):
+    batcher = MicroBatcher(runner, max_batch_size=4, max_wait_ms=200)
+    futures = [batcher.submit('a', payload) for payload in ('x', 'y', 'z')]
+
+    assert [future.result(timeout=2) for future in futures] == ['X', 'Y', 'Z']
+    assert runner.batches == [['x', 'y', 'z']]
+    batcher.close()
+
+
+def test_full_bucket_runs_without_waiting(runner):
+    batcher = MicroBatcher(runner, max_batch_size=3, max_wait_ms=10_000)
+    futures = [batcher.submit('a', payload) for payload in 'abcdefg']
+
+    # Dos lotes llenos salen enseguida; el resto espera a la ventana
+    assert [future.result(timeout=2) for future in futures[:6]] == list('ABCDEF')
+    assert runner.batches == [list('abc'), list('def')]
+    assert not futures[6].done()
+    assert batcher.pending() == 1
+
+    # Al cerrar se vacía la cola sin esperar la ventana
+    batcher.close()
+    assert futures[6].result(timeout=0) == 'G'
+    assert runner.batches[-1] == ['g']
+
+
+def test_jobs_are_grouped_only_within_their_key(runner):
+    batcher = MicroBatcher(runner, max_batch_size=2, max_wait_ms=10_000)
+    futures = [batcher.submit(key, payload) for key, payload in (('a', 'x'), ('b', 'y'), ('a', 'z'), ('b', 'w'))]
+
+    assert [future.result(timeout=2) for future in futures] == ['X', 'Y', 'Z', 'W']
+    assert sorted(runner.batches) == [['x', 'z'], ['y', 'w']]
+    batcher.close()
+
+
+def test_failed_batch_retries_each_job_alone(runner):
+    batcher = MicroBatcher(runner, max_batch_size=3, max_wait_ms=10_000)
+    good, bad, other = (batcher.submit('a', payload) for payload in ('x', 'bad', 'y'))
+
+    assert good.result(timeout=2) == 'X'
+    assert other.result(timeout=2) == 'Y'
+    with pytest.raises(ValueError, match='payload inválido'):
+        bad.result(timeout=2)
+    assert runner.batches == [['x', 'bad', 'y'], ['x'], ['bad'], ['y']]
+    batcher.close()
+
+
+def test_result_count_mismatch_retries_each_job_alone():
+    batches = []
+
+    def drop_last(payloads):
+        batches.append(list(payloads))
+        return payloads[:-1] if len(payloads) > 1 else payloads
+
+    batcher = MicroBatcher(drop_last, max_batch_size=2, max_wait_ms=10_000)
+    futures = [batcher.submit('a', payload) for payload in ('x', 'y')]
+
+    assert [future.result(timeout=2) for future in futures] == ['x', 'y']
+    assert batches == [['x', 'y'], ['x'], ['y']]
+    batcher.close()
+
+
+def test_closed_batcher_rejects_jobs(runner):
+    batcher = MicroBatcher(runner)
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.submit('a', 'x')
@@ -0,0 +1,55 @@
+# Modelo de latencia y política de presupuesto (sin GPU)
+import pytest
+
+from inference_policy import LatencyModel, choose_parameters
+
+
+def test_prior_without_observations():
+    model = LatencyModel(prior_overhead=3.0, prior_unit_seconds=1.0)
+    assert model.coefficients() == (3.0, 1.0)
+
+
+def test_linear_fit_with_different_work():
+    model = LatencyModel(prior_overhead=3.0, prior_unit_seconds=1.0, decay=1.0)
+    for units in (4, 8, 16):
+        model.observe(units, 0.5 + 0.1 * units)
+    overhead, unit_seconds = model.coefficients()
+    assert overhead == pytest.approx(0.5)
+    assert unit_seconds == pytest.approx(0.1)
+
+
+@pytest.mark.parametrize("seconds, expected", [
+    # Más rápido que el coste inicial solo: sin fijo, coste ajustado a la media
+    (0.5, (0.0, 0.125)),
+    # Entre medias: coste inicial y fijo ajustado
+    (5.0, (1.0, 1.0)),
+    # Más lento que el fijo inicial más el coste inicial: fijo inicial, coste ajustado
+    (11.0, (3.0, 2.0)),
+])
+def test_same_work_observations_reproduce_mean(seconds, expected):
+    model = LatencyModel(prior_overhead=3.0, prior_unit_seconds=1.0)
+    for _ in range(5):
+        model.observe(4, seconds)
+    assert model.coefficients() == pytest.approx(expected)
+    assert model.predict(4) == pytest.approx(seconds)
+
+
+def test_fast_worker_fits_small_budget():
+    model = LatencyModel(prior_overhead=3.0, prior_unit_seconds=1.0)
+    for _ in range(5):
+        model.observe(4, 0.2)
+    choice = choose_parameters(0.5, 4, (1024, 1024), model)
+    assert choice.within_budget
+
+
+@pytest.mark.parametrize("params, passes", [
+    ({'true_cfg_scale': None, 'negative_prompt': None}, 1),
+    # Solo prompt negativo: el pipeline aplica su true_cfg_scale por defecto (4.0)
+    ({'true_cfg_scale': None, 'negative_prompt': 'blurry'}, 2),
+    ({'true_cfg_scale': 1.0, 'negative_prompt': 'blurry'}, 1),
+    ({'true_cfg_scale': 4.0, 'negative_prompt': None}, 1),
+])
+def test_cfg_passes(params, passes):
+    import rp_handler
+
+    assert rp_handler.cfg_passes(params) == passes
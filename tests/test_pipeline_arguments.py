@@ -0,0 +1,56 @@
+# Los argumentos que el handler pasa al pipeline deben existir en la firma de
+# QwenImageEditPipeline.__call__ (sin cargar el modelo)
+import inspect
+
+import pytest
+from PIL import Image
+
+diffusers = pytest.importorskip("diffusers")
+
+import rp_handler
+
+
+def make_payload(index, **params):
+    return {
+        'prompt': f'prompt {index}',
+        'user_image': Image.new('RGB', (640, 480), (index * 40, 0, 0)),
+        'image_digest': f'digest-{index}',
+        'params': {'guidance_scale': 4.0, 'num_inference_steps': 4, 'true_cfg_scale': None, **params},
+        'seed': index
+    }
+
+
+@pytest.fixture(autouse=True)
+def runtime():
+    rp_handler.import_runtime()
+
+
+@pytest.mark.parametrize("batch", [1, 3])
+@pytest.mark.parametrize("params", [{}, {'true_cfg_scale': 4.0, 'negative_prompt': 'blurry'}])
+def test_arguments_bind_to_pipeline_signature(batch, params):
+    payloads = [make_payload(index, **params) for index in range(batch)]
+    payloads[0]['output_size'] = (512, 384)
+
+    arguments = rp_handler.pipeline_arguments(payloads)
+
+    inspect.signature(diffusers.QwenImageEditPipeline.__call__).bind(None, **arguments)
+
+
+def test_stub_mirrors_pipeline_signature():
+    from stub_pipeline import StubPipeline
+
+    def parameters(function):
+        return {name: parameter.default for name, parameter in inspect.signature(function).parameters.items()}
+
+    assert parameters(StubPipeline.__call__) == parameters(diffusers.QwenImageEditPipeline.__call__)
+
+
+def test_batched_images_are_resized_to_their_bucket():
+    payloads = [make_payload(index) for index in range(2)]
+    payloads[1]['user_image'] = Image.new('RGB', (3000, 2000))
+
+    arguments = rp_handler.pipeline_arguments(payloads)
+
+    assert [image.size for image in arguments['image']] == [
+        rp_handler.resolution_bucket(payload['user_image'].size) for payload in payloads
+    ]
@@ -0,0 +1,46 @@
+# Decisiones del planificador de ubicación con cifras de memoria simuladas
+import pytest
+
+from placement import CPU, GB, MODEL_OFFLOAD, RESIDENT, SEQUENTIAL_OFFLOAD, main, plan_placement
+
+# Pesos de Qwen-Image-Edit: ~53.7 GB en bfloat16, ~107.4 GB en float32
+CASES = [
+    # (vram_gb, ram_gb, bf16, estrategia, dtype)
+    (80, 64, True, RESIDENT, "bfloat16"),
+    (80, 64, False, RESIDENT, "float16"),
+    (48, 80, True, MODEL_OFFLOAD, "bfloat16"),
+    (24, 80, True, SEQUENTIAL_OFFLOAD, "bfloat16"),
+    (0, 160, False, CPU, "float32"),
+    (0, 96, False, CPU, "bfloat16"),
+    # GPU demasiado pequeña incluso para el offload secuencial: CPU
+    (4, 160, True, CPU, "float32"),
+]
+
+
+@pytest.mark.parametrize("vram_gb, ram_gb, bf16, strategy, dtype", CASES)
+def test_plan_outcome(vram_gb, ram_gb, bf16, strategy, dtype):
+    plan = plan_placement(vram_gb * GB, ram_gb * GB, bf16_supported=bf16)
+    assert plan.fits
+    assert plan.strategy == strategy
+    assert set(plan.dtypes.values()) == {dtype}
+    assert plan.device == ("cpu" if strategy == CPU else "cuda")
+    if strategy != CPU:
+        assert plan.peak_vram <= vram_gb * GB
+    assert plan.peak_ram <= ram_gb * GB
+
+
+def test_no_fit_is_reported():
+    plan = plan_placement(0, 32 * GB)
+    assert not plan.fits
+    assert plan.strategy == CPU
+    assert plan.reason == "no cabe en 32.0 GB de RAM"
+    assert "NO CABE" in plan.describe()
+    # El CLI sale con error si el plan no cabe
+    assert main(["--vram-gb", "0", "--ram-gb", "32"]) is False
+
+
+def test_forced_choice_reports_fit():
+    plan = plan_placement(24 * GB, 80 * GB, strategy=RESIDENT)
+    assert plan.strategy == RESIDENT
+    assert not plan.fits
+    assert plan.reason == "estrategia forzada"
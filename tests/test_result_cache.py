@@ -0,0 +1,47 @@
+# Caché de resultados: contabilidad del disco y forma de la respuesta en un acierto
+import base64
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import rp_handler
+from result_cache import ResultCache
+from stub_pipeline import StubPipeline
+
+
+def test_disk_rewrite_of_same_key_is_counted_once(tmp_path):
+    cache = ResultCache(max_memory_bytes=0, disk_dir=str(tmp_path), max_disk_bytes=1024)
+    cache._disk_put('key', 'a' * 100)
+    cache._disk_put('key', 'b' * 60)
+    assert cache._disk_bytes == 60
+    assert cache._disk_get('key') == 'b' * 60
+
+
+def test_disk_usage_is_read_at_startup(tmp_path):
+    ResultCache(max_memory_bytes=0, disk_dir=str(tmp_path), max_disk_bytes=1024)._disk_put('key', 'a' * 100)
+    assert ResultCache(max_memory_bytes=0, disk_dir=str(tmp_path), max_disk_bytes=1024)._disk_bytes == 100
+
+
+@pytest.fixture
+def cached_handler(monkeypatch):
+    rp_handler.import_runtime()
+    monkeypatch.setattr(rp_handler.config, 'RESULT_CACHE_ENABLED', True)
+    monkeypatch.setattr(rp_handler, 'result_cache', None)
+    monkeypatch.setattr(rp_handler, 'pipeline', StubPipeline(step_seconds=0.001, overhead=0.0))
+
+
+def test_hit_returns_same_metadata_as_miss(cached_handler):
+    buffer = BytesIO()
+    Image.new('RGB', (320, 240), (200, 30, 30)).save(buffer, format='PNG')
+    job = {'id': 'cached', 'input': {
+        'prompt': 'make it blue', 'user_image': base64.b64encode(buffer.getvalue()).decode('utf-8'),
+        'num_inference_steps': 2
+    }}
+
+    miss = rp_handler.handler(job)
+    hit = rp_handler.handler(job)
+
+    assert miss['parameters']['seed'] is not None
+    assert hit['parameters'] == miss['parameters']
+    assert hit.keys() == miss.keys()
@@ -0,0 +1,73 @@
+# Un trabajo por teselas con el handler generador emite el progreso de cada
+# tesela y se puede cancelar (con StubPipeline, sin modelo)
+import asyncio
+import base64
+import time
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import rp_handler
+from progress import ProgressStream
+from stub_pipeline import StubPipeline
+
+
+def large_image_b64(size=(2000, 1500)):
+    image = Image.linear_gradient('L').convert('RGB').resize(size)
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+def tiled_job(steps):
+    return {'id': 'tiled', 'input': {'prompt': 'make it red', 'user_image': large_image_b64(), 'num_inference_steps': steps}}
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    rp_handler.import_runtime()
+    monkeypatch.setattr(rp_handler.config, 'TILED_ENABLED', True)
+    monkeypatch.setattr(rp_handler.config, 'STREAM_PROGRESS', True)
+    pipeline = StubPipeline(step_seconds=0.001, overhead=0.0)
+    monkeypatch.setattr(rp_handler, 'pipeline', pipeline)
+    return pipeline
+
+
+def test_streamed_tiled_job_reports_progress_per_tile(stub):
+    async def collect():
+        return [event async for event in rp_handler.stream_handler(tiled_job(steps=3))]
+
+    events = asyncio.run(collect())
+
+    progress = [event for event in events if event.get('type') == 'progress']
+    tiles = {tuple(event['tile']) for event in progress}
+    assert len(tiles) == stub.calls > 1
+    assert len(progress) == 3 * len(tiles)
+    assert all(event['total'] == 3 and 'preview' not in event for event in progress)
+    assert 'error' not in events[-1]
+    assert events[-1]['parameters']['width'] == 2000
+
+
+def test_cancelled_tiled_job_stops_denoising(stub):
+    stub.step_seconds = 0.05
+    steps = 20
+
+    async def run_until_first_progress():
+        stream = ProgressStream(asyncio.get_running_loop())
+        future = rp_handler._item_executor.submit(
+            rp_handler.run_streamed_job, 'tiled', time.time(), tiled_job(steps), stream
+        )
+        events = []
+        async for event in stream.events([future]):
+            events.append(event)
+            if event.get('type') == 'progress':
+                stream.cancel()
+        return events
+
+    events = asyncio.run(run_until_first_progress())
+
+    assert events[-1]['error'].startswith('Trabajo cancelado')
+    # Solo la primera tesela llega al pipeline, y no termina sus pasos
+    assert stub.calls == 1
+    assert len([event for event in events if event.get('type') == 'progress']) < steps
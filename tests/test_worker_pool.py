@@ -0,0 +1,136 @@
+# WorkerPool con el backend StubPipeline: resultados por memoria compartida,
+# lotes por clave, progreso y cancelación entre procesos, y workers caídos
+import asyncio
+import os
+import threading
+
+import pytest
+from PIL import Image
+
+from progress import JobCancelled, ProgressStream
+from worker_pool import WorkerError, WorkerPool
+
+
+def job(steps=2, digest='d', **extra):
+    """Payload como los que arma rp_handler (1024x1024: 1 MP, ~10 ms por paso en el stub)."""
+    return {
+        'prompt': 'make it red',
+        'user_image': Image.new('RGB', (1024, 1024), (200, 30, 30)),
+        'image_digest': digest,
+        'params': {'guidance_scale': 4.0, 'num_inference_steps': steps, 'true_cfg_scale': None, 'negative_prompt': None},
+        'seed': 7,
+        'output_size': None,
+        **extra
+    }
+
+
+class RecordingStream(ProgressStream):
+    """ProgressStream que guarda los eventos en vez de pasarlos a un event loop."""
+
+    def __init__(self, cancel_after=None):
+        super().__init__(asyncio.new_event_loop())
+        self.events = []
+        self.cancel_after = cancel_after
+
+    def emit(self, event):
+        self.events.append(event)
+        if self.cancel_after is not None and len(self.events) >= self.cancel_after:
+            self.cancel()
+
+
+def shared_blocks():
+    return {name for name in os.listdir('/dev/shm') if name.startswith('psm_')} if os.path.isdir('/dev/shm') else set()
+
+
+@pytest.fixture(scope='module')
+def pool():
+    pool = WorkerPool(['cpu:0'], backend='stub', max_batch=4, start_timeout=120).start()
+    yield pool
+    pool.close()
+
+
+def test_results_come_back_through_shared_memory(pool):
+    before = shared_blocks()
+    payload = job(steps=2, output_size=(512, 384))
+
+    image = pool.submit(payload, key='a').result(timeout=30)
+
+    assert isinstance(image, Image.Image) and image.size == (512, 384)
+    # El stub devuelve la entrada volteada: los píxeles cruzan la memoria compartida
+    assert image.getpixel((0, 0)) == (200, 30, 30)
+    assert 'gpu_interval' in payload and payload['seed'] == 7
+    assert pool.depths() == [0] and not pool._inflight
+    assert shared_blocks() <= before
+
+
+def test_jobs_with_the_same_key_share_a_call(pool):
+    # Mientras el worker está ocupado se acumulan trabajos en su cola
+    busy = pool.submit(job(steps=100, digest='busy'), key='busy')
+    same = [job(digest=f's{index}') for index in range(3)]
+    other = job(digest='o')
+    futures = [pool.submit(payload, key='same') for payload in same]
+    futures.append(pool.submit(other, key='other'))
+
+    for future in [busy] + futures:
+        future.result(timeout=30)
+
+    intervals = {tuple(payload['gpu_interval']) for payload in same}
+    assert len(intervals) == 1
+    assert tuple(other['gpu_interval']) not in intervals
+
+
+def test_progress_events_come_back_from_the_worker(pool):
+    stream = RecordingStream()
+    payload = job(steps=4, progress=stream, item_index=2, box=(0, 0, 1024, 1024))
+
+    pool.submit(payload, key='progress').result(timeout=30)
+
+    assert [event['step'] for event in stream.events] == [1, 2, 3, 4]
+    assert all(event['total'] == 4 and event['index'] == 2 for event in stream.events)
+    assert all(event['tile'] == [0, 0, 1024, 1024] for event in stream.events)
+
+
+def test_cancellation_reaches_the_worker(pool):
+    steps = 300
+    stream = RecordingStream(cancel_after=1)
+
+    future = pool.submit(job(steps=steps, progress=stream), key='cancel')
+
+    with pytest.raises(JobCancelled):
+        future.result(timeout=30)
+    assert 1 <= len(stream.events) < steps
+    assert not pool._inflight
+
+
+def test_job_cancelled_before_it_runs_never_reaches_the_pipeline(pool):
+    busy = pool.submit(job(steps=50, digest='busy'), key='busy')
+    stream = RecordingStream()
+    future = pool.submit(job(progress=stream), key='queued')
+    stream.cancel()
+
+    busy.result(timeout=30)
+    with pytest.raises(JobCancelled):
+        future.result(timeout=30)
+    assert stream.events == []
+
+
+def test_killed_worker_fails_its_pending_jobs():
+    pool = WorkerPool(['cpu:0'], backend='stub', start_timeout=120).start()
+    try:
+        started = threading.Event()
+        stream = RecordingStream()
+        stream.emit = lambda event: started.set()
+        futures = [pool.submit(job(steps=1000, digest=f'k{index}', progress=stream if index == 0 else None), key=index)
+                   for index in range(3)]
+        assert started.wait(timeout=30)
+
+        pool._processes[0].kill()
+
+        for future in futures:
+            with pytest.raises(WorkerError):
+                future.result(timeout=10)
+        # Sin workers vivos los trabajos nuevos fallan en el acto
+        with pytest.raises(WorkerError):
+            pool.submit(job(), key='late').result(timeout=1)
+    finally:
+        pool.close()
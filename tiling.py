@@ -0,0 +1,79 @@
+# tiling.py
+# Procesamiento por teselas de imágenes mayores que la resolución nativa del
+# modelo: división en teselas solapadas y recomposición con costuras suaves
+import numpy as np
+from PIL import Image
+
+
+def _starts(length, tile, overlap):
+    # Inicios de las teselas a lo largo de un eje; la última se alinea con el borde
+    if length <= tile:
+        return [0]
+    stride = tile - overlap
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)
+    return starts
+
+
+def plan_tiles(size, tile_size=1024, overlap=128):
+    """
+    Divide una imagen de tamaño `size` en teselas de `tile_size` píxeles
+    que se solapan al menos `overlap` píxeles. Devuelve las cajas
+    `(x0, y0, x1, y1)` en orden de filas.
+    """
+    width, height = size
+    tile_width, tile_height = min(tile_size, width), min(tile_size, height)
+    return [
+        (x, y, x + tile_width, y + tile_height)
+        for y in _starts(height, tile_height, overlap)
+        for x in _starts(width, tile_width, overlap)
+    ]
+
+
+def _ramp(length, overlap, ramp_start, ramp_end):
+    weights = np.ones(length, dtype=np.float32)
+    if overlap <= 0:
+        return weights
+    ramp = (np.arange(overlap, dtype=np.float32) + 0.5) / overlap
+    if ramp_start:
+        weights[:overlap] = np.minimum(weights[:overlap], ramp)
+    if ramp_end:
+        weights[-overlap:] = np.minimum(weights[-overlap:], ramp[::-1])
+    return weights
+
+
+class TileBlender:
+    """
+    Recompone la imagen sumando cada tesela con un peso que decae
+    linealmente en los bordes que se solapan con otra tesela (los bordes de
+    la imagen conservan peso completo), y normalizando por la suma de pesos.
+    """
+
+    def __init__(self, size, overlap):
+        self.size = size
+        self.overlap = overlap
+        width, height = size
+        self._accum = np.zeros((height, width, 3), dtype=np.float32)
+        self._weights = np.zeros((height, width, 1), dtype=np.float32)
+
+    def add(self, box, tile):
+        """Suma la tesela editada `tile` en la caja `box` (se reescala al tamaño de la caja)."""
+        x0, y0, x1, y1 = box
+        width, height = x1 - x0, y1 - y0
+        if tile.size != (width, height):
+            tile = tile.resize((width, height), Image.LANCZOS)
+        pixels = np.asarray(tile.convert('RGB'), dtype=np.float32)
+
+        overlap_x = min(self.overlap, width // 2)
+        overlap_y = min(self.overlap, height // 2)
+        weight_x = _ramp(width, overlap_x, x0 > 0, x1 < self.size[0])
+        weight_y = _ramp(height, overlap_y, y0 > 0, y1 < self.size[1])
+        weight = (weight_y[:, None] * weight_x[None, :])[..., None]
+
+        self._accum[y0:y1, x0:x1] += pixels * weight
+        self._weights[y0:y1, x0:x1] += weight
+
+    def result(self):
+        """Imagen recompuesta."""
+        pixels = self._accum / np.maximum(self._weights, 1e-6)
+        return Image.fromarray(np.clip(pixels + 0.5, 0, 255).astype(np.uint8), 'RGB')
@@ -0,0 +1,540 @@
+# worker_pool.py
+# Pool de procesos con un pipeline por dispositivo (una GPU o un nodo NUMA
+# de CPU). Las imágenes viajan entre el proceso principal y los workers por
+# memoria compartida, no serializadas con pickle
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import connection, shared_memory
+
+from PIL import Image
+
+from progress import JobCancelled
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("pipeline", "stub")
+# Segundos entre comprobaciones de que los workers siguen vivos
+HEALTH_INTERVAL = 1.0
+
+# Campos del payload que necesita run_pipeline en el worker (las imágenes aparte).
+# item_index y box van en los eventos de progreso, que vuelven por la tubería de respuestas
+PAYLOAD_KEYS = ('prompt', 'image_digest', 'params', 'seed', 'output_size', 'item_index', 'box')
+PAYLOAD_IMAGES = ('user_image',)
+# Campos que run_pipeline añade al payload y vuelven al proceso principal
+RESULT_KEYS = (
+    'gpu_interval', 'peak_vram', 'seed', 'prompt_cache',
+    'latent_cache', 'latent_cache_counts', 'step_cache', 'step_cache_counts'
+)
+
+
+class WorkerError(Exception):
+    """Error de la inferencia en un worker (o worker caído)."""
+
+
+def share_image(image):
+    """
+    Copia los píxeles de `image` a un bloque de memoria compartida. Devuelve
+    el bloque (el llamador lo libera con `release`) y su descriptor, que es
+    lo único que se envía al otro proceso.
+    """
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    data = image.tobytes()
+    block = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    block.buf[:len(data)] = data
+    return block, {'shm': block.name, 'size': image.size, 'mode': image.mode, 'bytes': len(data)}
+
+
+def read_image(descriptor, unlink=False):
+    """Imagen PIL (copia propia) a partir del descriptor de `share_image`."""
+    block = shared_memory.SharedMemory(name=descriptor['shm'])
+    try:
+        image = Image.frombytes(descriptor['mode'], descriptor['size'], bytes(block.buf[:descriptor['bytes']]))
+    finally:
+        block.close()
+        if unlink:
+            block.unlink()
+    return image
+
+
+def release(block):
+    """Libera un bloque de `share_image` creado en este proceso."""
+    block.close()
+    try:
+        block.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def numa_nodes():
+    """`{nodo: [cpus]}` de los nodos NUMA con CPUs (Linux); un solo nodo si no se puede leer."""
+    nodes = {}
+    base = "/sys/devices/system/node"
+    try:
+        names = sorted(name for name in os.listdir(base) if name.startswith("node") and name[4:].isdigit())
+    except OSError:
+        names = []
+    for name in names:
+        with open(os.path.join(base, name, "cpulist")) as f:
+            cpus = parse_cpulist(f.read())
+        if cpus:
+            nodes[int(name[4:])] = cpus
+    return nodes or {0: sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))}
+
+
+def parse_cpulist(text):
+    """'0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11]."""
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        cpus.extend(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+def resolve_devices(spec, count=0):
+    """
+    Dispositivos de los workers. `spec` es una lista "cuda:0,cuda:1",
+    "cpu:0,cpu:1" (nodo NUMA) o "auto": una GPU por worker si hay GPUs,
+    si no un nodo NUMA por worker. `count` > 0 limita (o, en CPU, fija) el
+    número de workers.
+    """
+    if spec and spec != "auto":
+        devices = [device.strip() for device in spec.split(",") if device.strip()]
+    else:
+        gpus = cuda_device_count()
+        if gpus:
+            devices = [f"cuda:{index}" for index in range(gpus)]
+        else:
+            nodes = sorted(numa_nodes())
+            devices = [f"cpu:{node}" for node in nodes]
+            if count > len(devices):
+                # Más workers que nodos: se reparten los nodos
+                devices = [devices[index % len(devices)] for index in range(count)]
+    return devices[:count] if count else devices
+
+
+def cuda_device_count():
+    """GPUs visibles, sin inicializar CUDA en este proceso (los workers la inicializan)."""
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if visible is not None:
+        return len([device for device in visible.split(",") if device.strip()])
+    try:
+        import subprocess
+        output = subprocess.run(["nvidia-smi", "-L"], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return 0
+    return sum(1 for line in output.splitlines() if line.startswith("GPU "))
+
+
+def worker_environment(device, workers_on_node=1, slot=0):
+    """
+    Variables de entorno de un worker y CPUs a las que se fija. Se aplican
+    al lanzar el proceso: config.py las lee al importarse y CUDA al
+    inicializarse. Con GPU, CUDA_VISIBLE_DEVICES; con un nodo NUMA de CPU,
+    sus CPUs (repartidas si hay varios workers por nodo) y los hilos de torch.
+    """
+    # El rp_handler del worker ejecuta el pipeline en el propio proceso
+    env = {"QWEN_WORKERS": "0", "QWEN_METRICS_PORT": "0", "QWEN_FAST_START": "0"}
+    kind, _, index = device.partition(":")
+    if kind == "cuda":
+        env["CUDA_VISIBLE_DEVICES"] = index or "0"
+        return env, None
+    cpus = numa_nodes().get(int(index or 0))
+    if cpus:
+        share = max(1, len(cpus) // workers_on_node)
+        cpus = cpus[slot * share:(slot + 1) * share] or cpus
+        env["QWEN_TORCH_THREADS"] = str(len(cpus))
+    env["QWEN_PLACEMENT"] = "cpu"
+    env["CUDA_VISIBLE_DEVICES"] = ""
+    return env, cpus
+
+
+def import_handler():
+    """
+    rp_handler del worker. Si el proceso principal ejecuta rp_handler.py
+    como script, spawn ya lo importó como __mp_main__: se reutiliza ese
+    módulo en lugar de importarlo por segunda vez.
+    """
+    main = sys.modules.get("__mp_main__")
+    if main is not None and os.path.basename(getattr(main, "__file__", "") or "") == "rp_handler.py":
+        sys.modules.setdefault("rp_handler", main)
+    import rp_handler
+    return rp_handler
+
+
+class Cancellations:
+    """
+    Peticiones canceladas en el proceso principal, según llegan por la cola
+    de control del worker. Se consulta en cada paso del denoising.
+    """
+
+    def __init__(self, controls):
+        self._controls = controls
+        self._ids = set()
+
+    def __contains__(self, request_id):
+        while True:
+            try:
+                self._ids.add(self._controls.get_nowait())
+            except queue.Empty:
+                break
+        return request_id in self._ids
+
+    def discard(self, request_id):
+        self._ids.discard(request_id)
+
+
+class WorkerProgress:
+    """
+    Sustituto de ProgressStream en el worker: los eventos de StepReporter
+    vuelven al proceso principal por la conexión de respuestas y la
+    cancelación llega por la cola de control.
+    """
+
+    def __init__(self, request_id, responses, cancellations):
+        self.request_id = request_id
+        self._responses = responses
+        self._cancellations = cancellations
+
+    def emit(self, event):
+        self._responses.send({'id': self.request_id, 'event': event})
+
+    @property
+    def cancelled(self):
+        return self.request_id in self._cancellations
+
+
+def worker_main(index, cpus, backend, requests, controls, responses, max_batch):
+    """
+    Proceso worker: carga el pipeline a través de rp_handler (con toda su
+    configuración: ubicación, cachés, compilación) o el StubPipeline, y
+    ejecuta run_pipeline con las peticiones de su cola. Agrupa en un lote
+    las peticiones pendientes con la misma clave. `controls` trae los ids
+    de las peticiones canceladas y `responses` es el extremo de escritura
+    de una tubería propia del worker.
+    """
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    rp_handler = import_handler()
+
+    try:
+        if backend == "stub":
+            from stub_pipeline import StubPipeline
+            rp_handler.import_runtime()
+            rp_handler.pipeline = StubPipeline()
+        elif not rp_handler.ensure_pipeline():
+            raise WorkerError("No se pudo cargar el modelo")
+    except Exception as e:
+        responses.send({'ready': index, 'error': f"{type(e).__name__}: {e}"})
+        return
+    responses.send({'ready': index, 'pid': os.getpid()})
+
+    cancellations = Cancellations(controls)
+    pending = []
+    while True:
+        if not pending:
+            pending.append(requests.get())
+        # Todo lo que ya está en cola, para poder agrupar por clave
+        while True:
+            try:
+                pending.append(requests.get_nowait())
+            except queue.Empty:
+                break
+        request = pending.pop(0)
+        if request is None:
+            break
+        batch = [request]
+        for candidate in list(pending):
+            if len(batch) >= max_batch:
+                break
+            if candidate is not None and candidate['key'] == request['key']:
+                batch.append(candidate)
+                pending.remove(candidate)
+        run_batch(rp_handler, index, batch, responses, cancellations)
+        for request in batch:
+            cancellations.discard(request['id'])
+
+
+def run_batch(rp_handler, index, batch, responses, cancellations):
+    """Ejecuta un lote de peticiones en el worker y envía una respuesta por petición."""
+    payloads = []
+    for request in batch:
+        payload = dict(request['payload'])
+        for key, descriptor in request['images'].items():
+            payload[key] = read_image(descriptor)
+        if request['progress']:
+            payload['progress'] = WorkerProgress(request['id'], responses, cancellations)
+        payloads.append(payload)
+    try:
+        images = rp_handler.run_pipeline(payloads)
+    except Exception as e:
+        if len(batch) > 1:
+            # Como el micro-batcher: cada petición se reintenta por separado
+            for request in batch:
+                run_batch(rp_handler, index, [request], responses, cancellations)
+            return
+        if isinstance(e, JobCancelled):
+            responses.send({'id': batch[0]['id'], 'worker': index, 'cancelled': str(e)})
+        else:
+            responses.send({'id': batch[0]['id'], 'worker': index, 'error': f"{type(e).__name__}: {e}"})
+        return
+    for request, payload, image in zip(batch, payloads, images):
+        # El proceso principal lee el resultado y libera el bloque
+        block, descriptor = share_image(image)
+        block.close()
+        responses.send({
+            'id': request['id'],
+            'worker': index,
+            'image': descriptor,
+            'result': {key: payload[key] for key in RESULT_KEYS if key in payload}
+        })
+
+
+class WorkerPool:
+    """
+    Un proceso worker por dispositivo, cada uno con su pipeline. `submit`
+    envía un payload al worker con menos trabajos en curso (profundidad de
+    cola) y devuelve un Future con la imagen resultante. Las imágenes de
+    entrada y de salida se pasan por memoria compartida; por la cola solo
+    viajan los parámetros y los descriptores de los bloques. Si el payload
+    tiene un ProgressStream (`progress`), sus eventos de progreso vuelven del
+    worker y su cancelación se envía al worker.
+
+    Cada worker responde por su propia tubería (un solo escritor, sin
+    cerrojo): un worker que muere a mitad de un envío no bloquea las
+    respuestas de los demás, como pasaría con una cola compartida.
+    """
+
+    def __init__(self, devices, backend="pipeline", max_batch=1, start_timeout=1800.0):
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend de worker desconocido: {backend} (opciones: {', '.join(BACKENDS)})")
+        self.devices = list(devices)
+        self.backend = backend
+        self.max_batch = max(1, max_batch)
+        self.start_timeout = start_timeout
+        self._context = multiprocessing.get_context("spawn")
+        self._responses = {}
+        self._requests = []
+        self._controls = []
+        self._processes = []
+        self._alive = []
+        self._inflight = {}
+        self._depth = [0] * len(self.devices)
+        self._served = [0] * len(self.devices)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._closing = threading.Event()
+        self._collector = None
+
+    def start(self):
+        """Arranca los workers y espera a que todos hayan cargado su pipeline."""
+        slots = {}
+        for index, device in enumerate(self.devices):
+            requests = self._context.Queue()
+            controls = self._context.Queue()
+            reader, writer = self._context.Pipe(duplex=False)
+            slot = slots.get(device, 0)
+            slots[device] = slot + 1
+            env, cpus = worker_environment(device, self.devices.count(device), slot)
+            process = self._context.Process(
+                target=worker_main,
+                args=(index, cpus, self.backend, requests, controls, writer, self.max_batch),
+                name=f"qwen-worker-{index}",
+                daemon=True
+            )
+            # El proceso hereda el entorno en el momento de lanzarlo
+            saved = {name: os.environ.get(name) for name in env}
+            os.environ.update(env)
+            try:
+                process.start()
+            finally:
+                for name, value in saved.items():
+                    if value is None:
+                        os.environ.pop(name, None)
+                    else:
+                        os.environ[name] = value
+            # Solo el worker escribe: al morir, el lector ve el fin de la tubería
+            writer.close()
+            self._responses[reader] = index
+            self._requests.append(requests)
+            self._controls.append(controls)
+            self._processes.append(process)
+            self._alive.append(True)
+        logger.info(f"Pool de workers: {len(self.devices)} procesos ({', '.join(self.devices)}), backend {self.backend}")
+
+        deadline = time.time() + self.start_timeout
+        ready = 0
+        while ready < len(self.devices):
+            if time.time() >= deadline:
+                self.close()
+                raise WorkerError(f"Los workers no arrancaron en {self.start_timeout:.0f}s")
+            for index, message in self._receive(max(0.1, deadline - time.time())):
+                if message is None or 'error' in message:
+                    self.close()
+                    reason = message['error'] if message else "el proceso terminó"
+                    raise WorkerError(f"El worker {index} no pudo arrancar: {reason}")
+                ready += 1
+                logger.info(f"Worker {index} listo en {self.devices[index]} (pid {message['pid']})")
+
+        self._collector = threading.Thread(target=self._collect, name="worker-pool", daemon=True)
+        self._collector.start()
+        return self
+
+    def submit(self, payload, key=None):
+        """
+        Envía un payload al worker menos cargado. Los payloads con la misma
+        `key` que coinciden en la cola de un worker se ejecutan en un lote.
+        """
+        future = Future()
+        blocks = []
+        images = {}
+        for name in PAYLOAD_IMAGES:
+            if payload.get(name) is not None:
+                block, images[name] = share_image(payload[name])
+                blocks.append(block)
+        progress = payload.get('progress')
+        request = {
+            'payload': {name: payload[name] for name in PAYLOAD_KEYS if name in payload},
+            'images': images,
+            'key': key,
+            'progress': progress is not None
+        }
+        with self._lock:
+            alive = [index for index, alive in enumerate(self._alive) if alive]
+            if not alive:
+                for block in blocks:
+                    release(block)
+                future.set_exception(WorkerError("No queda ningún worker vivo"))
+                return future
+            request['id'] = self._next_id
+            self._next_id += 1
+            worker = min(alive, key=lambda index: (self._depth[index], self._served[index]))
+            self._depth[worker] += 1
+            self._served[worker] += 1
+            self._inflight[request['id']] = (future, payload, blocks, worker)
+        self._requests[worker].put(request)
+        if progress is not None:
+            progress.on_cancel(lambda: self._cancel(request['id']))
+        return future
+
+    def _cancel(self, request_id):
+        # El worker deja de emitir eventos y, si todo su lote está cancelado,
+        # detiene el denoising en el siguiente paso
+        with self._lock:
+            entry = self._inflight.get(request_id)
+        if entry is not None:
+            self._controls[entry[3]].put(request_id)
+
+    def depths(self):
+        """Trabajos en curso por worker."""
+        with self._lock:
+            return list(self._depth)
+
+    def _receive(self, timeout):
+        # Mensajes `(worker, mensaje)` de las tuberías con datos; el mensaje es
+        # None cuando la tubería se cerró (el worker terminó)
+        if not self._responses:
+            time.sleep(timeout)
+            return []
+        messages = []
+        for reader in connection.wait(list(self._responses), timeout):
+            index = self._responses[reader]
+            try:
+                messages.append((index, reader.recv()))
+            except (EOFError, OSError):
+                del self._responses[reader]
+                reader.close()
+                messages.append((index, None))
+        return messages
+
+    def _collect(self):
+        # Resuelve los Futures con las respuestas de los workers. La vida de los
+        # workers se comprueba cada HEALTH_INTERVAL segundos aunque lleguen
+        # respuestas: los demás workers pueden mantener el colector ocupado
+        last_check = time.time()
+        while not self._closing.is_set():
+            if time.time() - last_check >= HEALTH_INTERVAL:
+                self._check_workers()
+                last_check = time.time()
+            for _, message in self._receive(HEALTH_INTERVAL):
+                if message is None:
+                    # Tubería cerrada: el worker ha terminado o está terminando
+                    self._check_workers()
+                else:
+                    self._handle(message)
+
+    def _handle(self, message):
+        # Evento de progreso (la petición sigue en curso) o respuesta final
+        if 'event' in message:
+            with self._lock:
+                entry = self._inflight.get(message['id'])
+            if entry is not None:
+                entry[1]['progress'].emit(message['event'])
+            return
+        with self._lock:
+            entry = self._inflight.pop(message['id'], None)
+            if entry is not None:
+                self._depth[entry[3]] -= 1
+        if entry is None:
+            # Respuesta de un worker que ya se dio por caído: su trabajo ya falló
+            if 'image' in message:
+                release(shared_memory.SharedMemory(name=message['image']['shm']))
+            return
+        future, payload, blocks, worker = entry
+        for block in blocks:
+            release(block)
+        if 'cancelled' in message:
+            future.set_exception(JobCancelled(message['cancelled']))
+            return
+        if 'error' in message:
+            future.set_exception(WorkerError(f"Worker {message['worker']}: {message['error']}"))
+            return
+        image = read_image(message['image'], unlink=True)
+        payload.update(message['result'])
+        future.set_result(image)
+
+    def _check_workers(self):
+        # Un worker caído no responde nunca: sus trabajos fallan
+        for index, process in enumerate(self._processes):
+            if process.is_alive() or not self._alive[index]:
+                continue
+            logger.error(f"El worker {index} ({self.devices[index]}) terminó con código {process.exitcode}")
+            with self._lock:
+                self._alive[index] = False
+                lost = [(request_id, entry) for request_id, entry in self._inflight.items() if entry[3] == index]
+                for request_id, _ in lost:
+                    del self._inflight[request_id]
+                self._depth[index] = 0
+            for _, (future, _, blocks, _) in lost:
+                for block in blocks:
+                    release(block)
+                future.set_exception(WorkerError(f"El worker {index} terminó (código {process.exitcode})"))
+
+    def close(self):
+        """Detiene los workers."""
+        for requests, controls, process in zip(self._requests, self._controls, self._processes):
+            # Lo que quede en las colas de un worker muerto no lo lee nadie: no
+            # se espera a vaciarlas al salir
+            controls.cancel_join_thread()
+            if process.is_alive():
+                requests.put(None)
+            else:
+                requests.cancel_join_thread()
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self._closing.set()
+        if self._collector is not None:
+            self._collector.join(timeout=5)
+        for reader in list(self._responses):
+            reader.close()
+        self._responses.clear()